@@ -113,15 +113,46 @@ class MySQLConnector:
   ############################
   def write_record(self, record):
     """Write record to table."""
+    self.write_records([record])
 
-    # First, check that we've got something we can work with
-    if not record:
-      return
-    if not type(record) == DASRecord:
-      logging.error('write_record() received non-DASRecord as input. '
-                    'Type: %s', type(record))
+  ############################
+  def write_records(self, records):
+    """Write a list of records (or a RecordBatch) to the data table
+    with a single insert."""
+    values = []
+    for record in records:
+      # First, check that we've got something we can work with
+      if not record:
+        continue
+      if not type(record) == DASRecord:
+        logging.error('write_record() received non-DASRecord as input. '
+                      'Type: %s', type(record))
+        continue
+      values.extend(self._record_values(record))
+
+    if not values:
       return
 
+    # Build the SQL query
+    fields = ['timestamp',
+              'field_name',
+              'int_value',
+              'float_value',
+              'str_value',
+              'bool_value']
+    if self.save_source:
+      fields.append('source')
+
+    write_cmd = 'insert into `%s` (%s) values %s' % \
+                  (self.DATA_TABLE, ','.join(fields), ','.join(values))
+    logging.debug('Inserting records into table with command: %s', write_cmd)
+    self.exec_sql_command(write_cmd)
+
+  ############################
+  def _record_values(self, record):
+    """Save record's source (if we're doing that) and return a list of
+    the '(...)' value strings for its rows in the data table."""
+
     # If we're saving source records, we have to do a little
     # legerdemain: after we've saved the record, we need to retrieve
     # the id of the record we've just saved so that we can attach it
@@ -138,15 +169,14 @@ class MySQLConnector:
       query = 'select last_insert_id()'
       cursor = self.connection.cursor()
       cursor.execute(query)
-      source_field = ', source'
       source_id = next(cursor)[0]
+      cursor.close()
     else:
-      source_field = ''
       source_id = None
 
     if not record.fields:
       logging.info('DASRecord has no parsed fields. Skipping record.')
-      return
+      return []
 
     # Write one row for each field-value pair. Columns are:
     #     timestamp
@@ -155,6 +185,7 @@ class MySQLConnector:
     #     float_value, \ Only one of these fields will be non-NULL,
     #     str_value    / depending on the type of the value.
     #     bool_value  /
+    #     source      - if we're saving source records
 
     timestamp = record.timestamp
     values = []
@@ -171,9 +202,9 @@ class MySQLConnector:
         value_array[5] = '%d' % ('1' if value else '0')
       elif value is None:
         continue
-      else:        
+      else:
         logging.error('Unknown record value type (%s) for %s: %s',
-                      type(value), key, value)
+                      type(value), field_name, value)
         continue
 
       # If we've saved this field's source record, append source's
@@ -185,22 +216,8 @@ class MySQLConnector:
       # we've already saved.
       value_str = '(%s)' % ','.join(value_array)
       values.append(value_str)
-      
-    # Build the SQL query
-    fields = ['timestamp',
-              'field_name',
-              'int_value',
-              'float_value',
-              'str_value',
-              'bool_value']
-    if source_id:
-      fields.append('source')
+    return values
 
-    write_cmd = 'insert into `%s` (%s) values %s' % \
-                  (self.DATA_TABLE, ','.join(fields), ','.join(values))
-    logging.debug('Inserting record into table with command: %s', write_cmd)
-    self.exec_sql_command(write_cmd)
-   
   ############################
   def read(self, field_list=None, start=None, num_records=1):
     """Read the next record from table. If start is specified, reset read
@@ -46,6 +46,7 @@ import time
 sys.path.append('.')
 
 from logger.readers.composed_reader import ComposedReader
+from logger.readers.demux_reader import DemuxReader
 from logger.readers.logfile_reader import LogfileReader
 from logger.readers.network_reader import NetworkReader
 from logger.readers.serial_reader import SerialReader
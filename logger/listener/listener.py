@@ -56,7 +56,8 @@ class Listener:
     listener.run()
 
     Calling listener.quit() from another thread will cause the run() loop
-    to exit.
+    to exit. When it does, the writers are closed, flushing anything
+    they may have buffered.
     """
     self.reader = ComposedReader(readers=readers, check_format=check_format)
     self.writer = ComposedWriter(transforms=transforms, writers=writers,
@@ -101,3 +102,7 @@ class Listener:
       logging.info('Listener %s received KeyboardInterrupt - exiting.',
                    self.name or '')
 
+    # Make sure anything the writers have buffered gets written
+    finally:
+      self.writer.close()
+
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Re-parse archived logfiles in parallel. Try
+
+  reparse.py --help
+
+for details.
+
+Example:
+
+  logger/listener/reparse.py \
+    --cruise_dir test/nmea/NBP1700 \
+    --processes 4 \
+    --write_file /tmp/NBP1700_parsed
+
+(Reads every raw logfile under test/nmea/NBP1700/<instrument>/raw/,
+prefixes each record with its instrument name as data_id, parses it
+with the NMEAParser definitions in local/ and writes the resulting
+DASRecords as JSON to /tmp/NBP1700_parsed.)
+
+Work is split by file and, for large files, by byte range, and
+farmed out to a pool of processes. Results come back in order, so
+records for each instrument are written in the same order they appear
+in its logfiles.
+"""
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+
+sys.path.append('.')
+
+from logger.utils import nmea_parser
+from logger.writers.text_file_writer import TextFileWriter
+
+# Files larger than this are split into multiple chunks so that one
+# big logfile can be parsed by more than one process.
+DEFAULT_CHUNK_BYTES = 4 * 1024 * 1024
+
+# Parser used by each worker process, created by _init_worker()
+_worker_parser = None
+
+################################################################################
+def _init_worker(parser_kwargs):
+  """Create the NMEAParser that this worker process will use."""
+  global _worker_parser
+  _worker_parser = nmea_parser.NMEAParser(**parser_kwargs)
+
+################################################################################
+def _parse_chunk(chunk):
+  """Parse the lines that begin in byte range [start, end) of a file,
+  prefixing each with data_id. Return a list of DASRecords (or their
+  JSON encodings, if as_json is True)."""
+  (data_id, filename, start, end, as_json) = chunk
+  prefix = data_id + ' '
+  results = []
+  with open(filename, 'rb') as f:
+    # If we're not at the start of the file, the line straddling our
+    # start belongs to the previous chunk. Back up a byte and skip to
+    # the next newline to resynchronize.
+    if start > 0:
+      f.seek(start - 1)
+      f.readline()
+    pos = f.tell()
+    while pos < end:
+      line = f.readline()
+      if not line:
+        break
+      pos += len(line)
+      record = line.decode('utf-8', errors='replace').rstrip('\n')
+      if not record:
+        continue
+      result = _worker_parser.parse_record(prefix + record)
+      if result is None:
+        continue
+      results.append(result.as_json() if as_json else result)
+  return results
+
+################################################################################
+def cruise_file_specs(cruise_dir):
+  """Return a dict of {data_id: file_spec} for each instrument directory
+  in cruise_dir, assuming the <cruise_dir>/<instrument>/raw/<files>
+  layout of our cruise archives."""
+  file_specs = {}
+  for raw_dir in sorted(glob.glob(os.path.join(cruise_dir, '*', 'raw'))):
+    data_id = os.path.basename(os.path.dirname(raw_dir))
+    file_specs[data_id] = os.path.join(raw_dir, '*')
+  return file_specs
+
+################################################################################
+class Reparser:
+  """Re-parse archived '<timestamp> <NMEA>' logfiles for one or more
+  instruments using a pool of processes, streaming the resulting
+  DASRecords to one or more Writers."""
+  ############################
+  def __init__(self, file_specs, writers=[], processes=None,
+               chunk_bytes=DEFAULT_CHUNK_BYTES, json=False,
+               message_path=nmea_parser.DEFAULT_MESSAGE_PATH,
+               sensor_path=nmea_parser.DEFAULT_SENSOR_PATH,
+               sensor_model_path=nmea_parser.DEFAULT_SENSOR_MODEL_PATH,
+               time_format=None):
+    """
+    file_specs   A dict of {data_id: file_spec}, where file_spec is a
+                 possibly-wildcarded string matching the logfiles for
+                 data_id, e.g. 'test/nmea/NBP1700/s330/raw/NBP1700_s330*'.
+                 As with LogfileReader, matching files are read in sorted
+                 order. Records in the files are expected to be in
+                 '<timestamp> <NMEA>' format; they will be prefixed with
+                 data_id before parsing.
+
+    writers      A single Writer or a list of Writers to which to send
+                 the parsed records. Records are delivered in order for
+                 each data_id, and data_ids in the order they appear in
+                 file_specs.
+
+    processes    Number of processes to parse with. Defaults to the
+                 number of CPUs.
+
+    chunk_bytes  Split files larger than this into chunks of about this
+                 size so they can be parsed in parallel.
+
+    json         Pass writers JSON-encoded DASRecords instead of DASRecords.
+
+    message_path, sensor_path, sensor_model_path, time_format
+                 Passed to the NMEAParser in each process.
+    """
+    self.file_specs = file_specs
+    # Unlike ComposedWriter, we call our writers sequentially rather
+    # than in parallel threads, so that each sees records in order.
+    if not type(writers) == type([]):
+      self.writers = [writers]
+    else:
+      self.writers = writers
+    self.processes = processes
+    self.chunk_bytes = chunk_bytes
+    self.json = json
+    self.parser_kwargs = {
+      'message_path': message_path,
+      'sensor_path': sensor_path,
+      'sensor_model_path': sensor_model_path,
+      'time_format': time_format
+    }
+
+  ############################
+  def chunks(self):
+    """Return a list of (data_id, filename, start, end, json) tuples
+    describing the work to be done, in the order in which the results
+    should be written."""
+    chunks = []
+    for data_id, file_spec in self.file_specs.items():
+      filenames = sorted(glob.glob(file_spec))
+      if not filenames:
+        logging.warning('Reparser: file_spec "%s" matches no files', file_spec)
+      for filename in filenames:
+        size = os.path.getsize(filename)
+        start = 0
+        while True:
+          end = start + self.chunk_bytes if self.chunk_bytes else size
+          chunks.append((data_id, filename, start, min(end, size), self.json))
+          start = end
+          if start >= size:
+            break
+    return chunks
+
+  ############################
+  def run(self):
+    """Parse everything and write it out. Return the number of records
+    written."""
+    chunks = self.chunks()
+    logging.info('Reparser: parsing %d chunks', len(chunks))
+    num_records = 0
+    with multiprocessing.Pool(processes=self.processes,
+                              initializer=_init_worker,
+                              initargs=(self.parser_kwargs,)) as pool:
+      # imap() hands back results in the order the chunks were
+      # submitted, while letting later chunks be parsed in the
+      # meantime.
+      for results in pool.imap(_parse_chunk, chunks):
+        for writer in self.writers:
+          writer.write_batch(results)
+        num_records += len(results)
+    return num_records
+
+################################################################################
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--cruise_dir', dest='cruise_dir', default=None,
+                      help='Cruise directory whose <instrument>/raw/* '
+                      'logfiles should be re-parsed.')
+  parser.add_argument('--logfile', dest='logfile', default=None,
+                      help='Comma-separated data_id:file_spec pairs to '
+                      're-parse, e.g. s330:/data/NBP1700/s330/raw/*')
+  parser.add_argument('--processes', dest='processes', type=int, default=None,
+                      help='Number of processes to use; defaults to the '
+                      'number of CPUs.')
+  parser.add_argument('--chunk_bytes', dest='chunk_bytes', type=int,
+                      default=DEFAULT_CHUNK_BYTES,
+                      help='Split files into chunks of this many bytes.')
+  parser.add_argument('--time_format', dest='time_format', default=None,
+                      help='Format in which to expect time strings.')
+  parser.add_argument('--write_file', dest='write_file', default=None,
+                      help='File to write JSON-encoded DASRecords to (\'-\' '
+                      'for stdout)')
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(filename)s:%(lineno)d %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  file_specs = {}
+  if args.cruise_dir:
+    file_specs.update(cruise_file_specs(args.cruise_dir))
+  if args.logfile:
+    for pair in args.logfile.split(','):
+      (data_id, file_spec) = pair.split(':', maxsplit=1)
+      file_specs[data_id] = file_spec
+  if not file_specs:
+    parser.error('Must specify at least one of --cruise_dir or --logfile')
+
+  filename = args.write_file if args.write_file != '-' else None
+  reparser = Reparser(file_specs=file_specs,
+                      writers=[TextFileWriter(filename=filename, flush=False)],
+                      processes=args.processes, chunk_bytes=args.chunk_bytes,
+                      json=True, time_format=args.time_format)
+  num_records = reparser.run()
+  logging.info('Wrote %d records', num_records)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import unittest
+import warnings
+
+sys.path.append('.')
+
+from logger.utils.nmea_parser import NMEAParser
+from logger.writers.writer import Writer
+
+from logger.listener.reparse import Reparser, cruise_file_specs
+
+S330_LINES = """2017-11-04T05:12:21.511263Z $INZDA,000001.17,07,08,2014,,*79
+2017-11-04T05:12:21.765827Z $INGGA,000001.16,3934.833674,S,03727.698164,W,1,12,0.7,0.03,M,-3.04,M,,*6D
+2017-11-04T05:12:22.016470Z $INVTG,230.21,T,248.66,M,10.8,N,20.0,K,A*34
+2017-11-04T05:12:22.267012Z $INRMC,000001.16,A,3934.833674,S,03727.698164,W,10.8,230.21,070814,18.5,W,A*06
+2017-11-04T05:12:22.520671Z $INHDT,235.50,T*14
+2017-11-04T05:12:22.770997Z $PSXN,20,1,0,0,0*3A
+2017-11-04T05:12:23.022713Z $PSXN,22,-0.05,-0.68*32
+2017-11-04T05:12:23.274388Z $PSXN,23,-2.68,-2.25,235.50,-0.88*1D""".split('\n')
+
+GYR1_LINES = """2017-11-10T01:00:06.739Z $HEHDT,143.7,T*2E
+2017-11-10T01:00:06.739Z $HEROT,-0000.8,A*3E
+2017-11-10T01:00:07.737Z $HEHDT,143.8,T*21
+2017-11-10T01:00:07.737Z $HEROT,0002.9,A*10
+2017-11-10T01:00:08.737Z $HEHDT,143.9,T*20""".split('\n')
+
+################################################################################
+class ListWriter(Writer):
+  """Accumulate written records in a list."""
+  def __init__(self):
+    super().__init__()
+    self.records = []
+  def write(self, record):
+    self.records.append(record)
+
+################################################################################
+class TestReparser(unittest.TestCase):
+  ############################
+  # To suppress resource warnings about unclosed files
+  def setUp(self):
+    warnings.simplefilter("ignore", ResourceWarning)
+
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.cruise_dir = self.tmpdir.name + '/TEST'
+    for (inst, lines) in [('s330', S330_LINES), ('gyr1', GYR1_LINES)]:
+      raw_dir = self.cruise_dir + '/' + inst + '/raw'
+      os.makedirs(raw_dir)
+      # Split lines across two daily files
+      half = len(lines) // 2
+      for (date, day_lines) in [('2017-11-04', lines[:half]),
+                                ('2017-11-05', lines[half:])]:
+        with open(raw_dir + '/TEST_' + inst + '-' + date, 'w') as f:
+          for line in day_lines:
+            f.write(line + '\n')
+
+  ############################
+  def expected_records(self):
+    parser = NMEAParser()
+    return [parser.parse_record(inst + ' ' + line)
+            for (inst, lines) in [('gyr1', GYR1_LINES), ('s330', S330_LINES)]
+            for line in lines]
+
+  ############################
+  def test_cruise_file_specs(self):
+    file_specs = cruise_file_specs(self.cruise_dir)
+    self.assertEqual(list(file_specs), ['gyr1', 's330'])
+    self.assertEqual(file_specs['s330'], self.cruise_dir + '/s330/raw/*')
+
+  ############################
+  def test_reparse(self):
+    writer = ListWriter()
+    reparser = Reparser(cruise_file_specs(self.cruise_dir), writers=writer,
+                        processes=2)
+    self.assertEqual(reparser.run(), len(GYR1_LINES) + len(S330_LINES))
+    self.assertEqual(writer.records, self.expected_records())
+
+  ############################
+  def test_reparse_chunked(self):
+    # Tiny chunks mean lines straddle chunk boundaries; make sure we
+    # neither drop nor duplicate them, and that order is preserved.
+    for chunk_bytes in [1, 7, 50, 100]:
+      writer = ListWriter()
+      reparser = Reparser(cruise_file_specs(self.cruise_dir), writers=[writer],
+                          processes=3, chunk_bytes=chunk_bytes)
+      reparser.run()
+      self.assertEqual(writer.records, self.expected_records())
+
+  ############################
+  def test_reparse_json(self):
+    writer = ListWriter()
+    reparser = Reparser({'gyr1': self.cruise_dir + '/gyr1/raw/TEST_gyr1*'},
+                        writers=writer, processes=1, json=True)
+    reparser.run()
+    self.assertEqual(len(writer.records), len(GYR1_LINES))
+    first = json.loads(writer.records[0])
+    self.assertEqual(first['data_id'], 'gyr1')
+    self.assertEqual(first['fields'], {'Gyro1HeadingTrue': 143.7})
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(filename)s:%(lineno)d %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import functools
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import weakref
+
+sys.path.append('.')
+
+from logger.readers.reader import Reader
+from logger.utils.demultiplexer import subscribe
+from logger.utils.formats import Binary_Record, Text
+from logger.utils.network import parse_network
+
+# Most records to hold for a reader that isn't keeping up before
+# dropping new ones.
+DEFAULT_QUEUE_SIZE = 10000
+
+# Default maximum number of records returned by read_batch()
+DEFAULT_BATCH_SIZE = 1000
+
+# Values of a DemuxReader's shared consumer pid when no one has read
+# from it yet, and once it's been closed
+NO_CONSUMER = 0
+CLOSED = -1
+
+################################################################################
+def _consumer_alive(consumer):
+  """Return False if the process reading a DemuxReader, whose pid is in
+  shared value consumer, has closed it or gone away."""
+  pid = consumer.value
+  if pid == NO_CONSUMER:
+    return True
+  if pid == CLOSED:
+    return False
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    return True
+  # Until its parent waits for it, a process that's exited is still
+  # around as a zombie.
+  try:
+    with open('/proc/%d/stat' % pid) as f:
+      return f.read().rsplit(')', 1)[-1].split()[0] != 'Z'
+  except (OSError, IndexError):
+    return True
+
+################################################################################
+def _unsubscribe(demux, record_queue, pid):
+  """Unsubscribe record_queue from demux, if we're in the process that
+  subscribed it; in a forked child, demux is a lifeless copy."""
+  if os.getpid() == pid:
+    demux.unsubscribe(record_queue)
+
+################################################################################
+class DemuxReader(Reader):
+  """Read the records for particular instruments from a UDP port that
+  carries many, sharing a single socket with every other DemuxReader on
+  the port in this process (see utils/demultiplexer.py).
+
+  Where N loggers each reading a NetworkReader followed by a
+  RegexFilterTransform would cost N recv() calls and N regex searches
+  per packet, N DemuxReaders cost one recv() and one dict lookup.
+  """
+  ############################
+  def __init__(self, network, data_ids=None, binary=False, multiprocess=True,
+               queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    network      Port to read UDP broadcasts from, in ':port' format
+                 (e.g. ':6224').
+
+    data_ids     A data_id, or list of data_ids, to read records for. A
+                 record's data_id is its text up to the first whitespace,
+                 e.g. 'gyr1' for 'gyr1 2017-11-04T05:12:19Z $HEHDT...'.
+                 If omitted, read every record.
+
+    binary       Return records as undecoded bytes.
+
+    multiprocess If True (default), records are handed over on a
+                 multiprocessing.Queue, so the reader may be used by a
+                 process forked after it's created, as LoggerRunner
+                 does. The first process to read claims the reader; if
+                 it closes the reader or goes away, the reader is
+                 unsubscribed. If the reader will only be used in the
+                 process that created it, False uses a cheaper
+                 queue.Queue.
+
+    queue_size   Most records to hold for us if we fall behind. Beyond
+                 that, new records are dropped.
+
+    Sample:
+
+      gyr1_reader = DemuxReader(':6224', data_ids='gyr1')
+    """
+    super().__init__(output_format=Binary_Record if binary else Text)
+
+    (host, port) = parse_network(network, 'DemuxReader')
+    if host:
+      raise ValueError('DemuxReader only reads UDP broadcasts; network must '
+                       'be in \':port\' format. Found "%s"' % network)
+    if type(data_ids) is str:
+      data_ids = [data_ids]
+
+    self.network = network
+    self.data_ids = data_ids
+    self.binary = binary
+    self.pid = os.getpid()
+    alive = None
+    if multiprocess:
+      self.queue = multiprocessing.Queue(queue_size)
+      # Don't hold up our exit flushing records to a consumer that may
+      # never read them.
+      self.queue.cancel_join_thread()
+
+      # Pid of the process reading us, shared with our forked children
+      self.consumer = multiprocessing.RawValue('i', NO_CONSUMER)
+      alive = functools.partial(_consumer_alive, self.consumer)
+    else:
+      self.queue = queue.Queue(queue_size)
+      self.consumer = None
+
+    self.demux = subscribe(port, self.queue, data_ids, alive)
+    # Unsubscribe when closed or garbage collected
+    self._unsubscribe = weakref.finalize(self, _unsubscribe, self.demux,
+                                         self.queue, self.pid)
+
+  ############################
+  def _claim(self):
+    """Let the demultiplexer know which process is reading us."""
+    pid = os.getpid()
+    if self.consumer.value != pid:
+      self.consumer.value = pid
+
+  ############################
+  def read(self):
+    """Read the next record."""
+    if self.consumer is not None:
+      self._claim()
+    record = self.queue.get()
+    logging.debug('DemuxReader.read() received %d bytes', len(record))
+    if not self.binary:
+      record = record.decode('utf-8')
+    return record
+
+  ############################
+  def read_batch(self, max_records=DEFAULT_BATCH_SIZE):
+    """Wait for at least one record, then return, as a list, all the
+    records that have arrived (up to max_records)."""
+    if self.consumer is not None:
+      self._claim()
+    records = [self.queue.get()]
+    try:
+      while len(records) < max_records:
+        records.append(self.queue.get_nowait())
+    except queue.Empty:
+      pass
+    if not self.binary:
+      records = [record.decode('utf-8') for record in records]
+    return records
+
+  ############################
+  def close(self):
+    """Stop receiving records. If called in a forked process, the
+    demultiplexer (which lives in the process that created us) notices
+    within a second or so."""
+    if self.consumer is not None:
+      self.consumer.value = CLOSED
+    self._unsubscribe()
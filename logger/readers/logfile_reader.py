@@ -1,16 +1,26 @@
 #!/usr/bin/env python3
 
-import glob
 import logging
+import math
 import sys
 import time
 
+from bisect import bisect_right
+from datetime import datetime, timezone
+
 sys.path.append('.')
 
 from logger.readers.reader import TimestampedReader
-from logger.readers.text_file_reader import TextFileReader
+from logger.readers.text_file_reader import TextFileReader, DEFAULT_BATCH_SIZE
+from logger.readers.text_file_reader import matching_files
 from logger.utils.formats import Text
 from logger.utils import timestamp
+from logger.utils.compressed_file import data_size, open_file
+from logger.utils.compressed_file import uncompressed_name
+
+# When bisecting a file for a timestamp, scan linearly once the range
+# left to search is smaller than this.
+BISECT_SCAN_BYTES = 4096
 
 ################################################################################
 # Open and read single-line records from one or more text files.
@@ -46,6 +56,10 @@ class LogfileReader(TimestampedReader):
                  How long to sleep between returning records. In general
                  this should be zero except for debugging purposes.
 
+    Daily files that have been compressed (e.g. by LogfileWriter's
+    compress option) are read transparently, and seek_time() and
+    read_time_range() work on them through their block index.
+
     Note that the order in which files are opened will probably be in
     alphanumeric by filename, but this is not strictly enforced and
     depends on how glob returns them.
@@ -71,6 +85,11 @@ class LogfileReader(TimestampedReader):
     self._first_msec_timestamp = None
     self.prev_record = None
 
+    # Earliest possible timestamp (msec) of each file's records, keyed
+    # by filename, and the length of the date suffix they come from.
+    self._file_start_msecs = {}
+    self._date_len = len(time.strftime(date_format, time.gmtime(0)))
+
     # If they give us a filebase, add wildcard to match its suffixes;
     # otherwise, we'll pass on the empty string to TextFileReader so
     # that it uses stdin. NOTE: we should really use a pattern that
@@ -136,19 +155,16 @@ class LogfileReader(TimestampedReader):
     return record
 
   ############################
-  def _read_until(self, desired_time_msec):
-    while True:
-      record = self.reader.read()
-      if record is None:
-        return
-      self.prev_record = record
-      if self._get_msec_timestamp(record) >= desired_time_msec:
-        self.reader.seek(-1, 'current')
-        return
-
-  ############################
-  def _reset(self):
-    self.reader.seek(0, 'start')
+  def read_batch(self, max_records=DEFAULT_BATCH_SIZE):
+    """Return up to max_records records at once as a list, or an empty
+    list if there are no more records. See TextFileReader.read_batch().
+    """
+    if self.use_timestamps:
+      raise ValueError('read_batch() incompatible with use_timestamps=True')
+    records = self.reader.read_batch(max_records)
+    if records:
+      self.prev_record = records[-1]
+    return records
 
   ############################
   def _get_msec_timestamp(self, record):
@@ -156,25 +172,155 @@ class LogfileReader(TimestampedReader):
     return timestamp.timestamp(time_str, time_format=self.time_format) * 1000
 
   ############################
-  def _peek_msec(self):
-    record = self.reader.read()
-    if record is None:
+  def _line_msec(self, line):
+    """Timestamp in msec of a line of text or bytes, or None if it doesn't
+    start with a timestamp we can parse."""
+    time_str = line.split(maxsplit=1)[0] if line.strip() else ''
+    if type(time_str) is bytes:
+      time_str = time_str.decode('utf-8', 'replace')
+    try:
+      return timestamp.timestamp(time_str,
+                                 time_format=self.time_format) * 1000
+    except ValueError:
       return None
-    self.reader.seek(-1, 'current')
-    return self._get_msec_timestamp(record)
 
   ############################
-  # Note: this will change the file position if necessary, and should not be used
-  # except where that behavior is appropriate.
+  def _file_list(self):
+    return matching_files(self.file_spec)
+
+  ############################
+  def _file_start_msec(self, filename):
+    """Earliest time (msec) that records in filename can have: the start
+    of the date in its filename suffix, or failing that, the timestamp
+    of its first record."""
+    start_msec = self._file_start_msecs.get(filename)
+    if start_msec is None:
+      date_str = uncompressed_name(filename)[-self._date_len:]
+      try:
+        date = datetime.strptime(date_str, self.date_format)
+        start_msec = date.replace(tzinfo=timezone.utc).timestamp() * 1000
+      except ValueError:
+        with open_file(filename, 'rb') as f:
+          for line in f:
+            start_msec = self._line_msec(line)
+            if start_msec is not None:
+              break
+      if start_msec is None:
+        start_msec = -math.inf
+      self._file_start_msecs[filename] = start_msec
+    return start_msec
+
+  ############################
+  def _find_offset(self, filename, desired_time_msec):
+    """Return the byte offset of the first line in filename with a
+    timestamp at or after desired_time_msec, or None if there is no
+    such line. Assumes the file is in chronological order, and skips
+    over lines without timestamps.
+
+    Bisects on byte offsets: after seeking to the middle of the range
+    in question we throw away the partial line we've landed in, and
+    look at the first complete line with a timestamp. Once the range
+    is small enough, scan it line by line.
+    """
+    with open_file(filename, 'rb') as f:
+      lo = 0  # start of a line; all lines before it are too early
+      hi = data_size(f)  # answer lies at or before here
+      while hi - lo > BISECT_SCAN_BYTES:
+        mid = (lo + hi) // 2
+        f.seek(mid - 1)
+        f.readline()
+        pos = f.tell()
+        line_msec = None
+        while pos < hi:
+          line = f.readline()
+          line_msec = self._line_msec(line)
+          if line_msec is not None:
+            break
+          pos += len(line)
+        if line_msec is not None and line_msec < desired_time_msec:
+          lo = pos + len(line)
+        else:
+          # Nothing between mid and the first line that's late enough
+          # (if any) has a timestamp, so the answer can't be in there.
+          hi = mid
+
+      f.seek(lo)
+      pos = lo
+      for line in f:
+        line_msec = self._line_msec(line)
+        if line_msec is not None and line_msec >= desired_time_msec:
+          return pos
+        pos += len(line)
+    return None
+
+  ############################
+  def _seek_msec(self, desired_time_msec):
+    """Position the reader at the first record with a timestamp at or
+    after desired_time_msec, or at the end if there is none. Picks the
+    daily file from the filename dates, then bisects within it."""
+    file_list = self._file_list()
+    if not file_list:
+      return
+    start_msecs = [self._file_start_msec(f) for f in file_list]
+    for i in range(1, len(start_msecs)):
+      start_msecs[i] = max(start_msecs[i], start_msecs[i-1])
+    first = max(0, bisect_right(start_msecs, desired_time_msec) - 1)
+
+    # Usually the record is in the first file we look at; if that day
+    # finished before desired_time_msec, it's at the start of the next.
+    for filename in file_list[first:]:
+      offset = self._find_offset(filename, desired_time_msec)
+      if offset is not None:
+        self.reader.seek_offset(filename, offset)
+        return
+    last_file = file_list[-1]
+    self._seek_end(last_file)
+
+  ############################
+  def _seek_end(self, filename):
+    """Position the reader at the end of filename."""
+    with open_file(filename, 'rb') as f:
+      self.reader.seek_offset(filename, data_size(f))
+
+  ############################
   def _get_first_msec_timestamp(self):
+    """Timestamp in msec of the first record, or None if no records."""
     if self._first_msec_timestamp is None:
-      self._reset()
-      record = self.reader.read()
-      if record is None:
-        return None
-      self._first_msec_timestamp = self._get_msec_timestamp(record)
+      for filename in self._file_list():
+        with open_file(filename, 'rb') as f:
+          for line in f:
+            line_msec = self._line_msec(line)
+            if line_msec is not None:
+              self._first_msec_timestamp = line_msec
+              return line_msec
     return self._first_msec_timestamp
 
+  ############################
+  def _get_last_msec_timestamp(self):
+    """Timestamp in msec of the last record, or None if no records.
+    Reads backwards from the end of the last file, a block at a time."""
+    for filename in reversed(self._file_list()):
+      with open_file(filename, 'rb') as f:
+        end = data_size(f)
+        tail = b''
+        while end > 0:
+          start = max(0, end - BISECT_SCAN_BYTES)
+          f.seek(start)
+          tail = f.read(end - start) + tail
+          end = start
+          lines = tail.split(b'\n')
+          # Unless we're at the start of the file, the first line may
+          # be incomplete; hang onto it for the next pass.
+          if end > 0:
+            tail = lines.pop(0)
+          for line in reversed(lines):
+            line_msec = self._line_msec(line)
+            if line_msec is not None:
+              return line_msec
+          if end == 0:
+            break
+    return None
+
   ############################
   def seek_time(self, offset=0, origin='current'):
     """
@@ -187,6 +333,10 @@ class LogfileReader(TimestampedReader):
     records appearing before the current record but with a later 
     timestamp might be missed.
 
+    Records are found by picking the right file from its date suffix
+    and then bisecting on byte offsets within it, so seeking costs a
+    handful of reads no matter how large the archive is.
+
     Args:
       offset: offset in msec relative to origin
       origin: 'start', 'current' or 'end'
@@ -216,38 +366,34 @@ class LogfileReader(TimestampedReader):
       if first_timestamp is None:
         return None
       desired_time = first_timestamp + offset
-      if self.prev_record is None:
-        self._reset()
-      else:
-        prev_timestamp = self._get_msec_timestamp(self.prev_record)
-        if prev_timestamp >= desired_time:
-          self._reset()
-      self._read_until(desired_time) 
+      self._seek_msec(desired_time)
       return desired_time
 
     elif origin == 'current':
-      next_timestamp = self._peek_msec()
-      curr_timestamp = next_timestamp or self._get_msec_timestamp(self.prev_record)
+      next_record = self.reader.peek()
+      curr_timestamp = None
+      if next_record is not None:
+        curr_timestamp = self._line_msec(next_record)
+      if curr_timestamp is None:
+        curr_timestamp = self._get_last_msec_timestamp()
       if curr_timestamp is None:
         return None
       desired_time = curr_timestamp + offset
       if offset == 0:
         return desired_time
-      if offset < 0:
-        self._reset()
-      self._read_until(desired_time)
+      self._seek_msec(desired_time)
       return desired_time
   
     elif origin == 'end':
-      while self.read() is not None:
-        pass
-      if self.prev_record is None:
+      end_timestamp = self._get_last_msec_timestamp()
+      if end_timestamp is None:
         return None
-      end_timestamp = self._get_msec_timestamp(self.prev_record)
       desired_time = end_timestamp + offset
       if offset < 0:
-        self._reset()
-        self._read_until(desired_time) 
+        self._seek_msec(desired_time)
+      else:
+        last_file = self._file_list()[-1]
+        self._seek_end(last_file)
       return desired_time
 
     else:
@@ -1,61 +1,130 @@
 #!/usr/bin/env python3
 
 import logging
+import select
 import socket
 import sys
 
+from collections import deque
+
 sys.path.append('.')
 
-from logger.utils.formats import Text
+from logger.utils.formats import Binary_Record, Text
+from logger.utils.network import parse_network, check_framing
+from logger.utils.network import set_tcp_options, split_records
+from logger.utils.network import RecordAssembler, is_multicast
+from logger.utils.network import multicast_membership, IP_MULTICAST_ALL
+from logger.utils.network import NEWLINE_FRAMING, DEFAULT_MAX_RECORD_SIZE
 from logger.readers.reader import Reader
 
-BUFFER_SIZE = 4096
+# Big enough for the largest possible UDP datagram, so that UDP
+# records are never truncated. Over TCP, this is just how much we ask
+# for at a time; records of any size are reassembled.
+BUFFER_SIZE = 65535
+
+# Most connections we'll queue up for accept() over TCP
+TCP_BACKLOG = 16
+
+# Default maximum number of records returned by read_batch()
+DEFAULT_BATCH_SIZE = 1000
 
 ################################################################################
 # Read to the specified file. If filename is empty, read to stdout.
 class NetworkReader(Reader):
   """
   Read text records from a network socket.
-
-  NOTE: tcp is nominally implemented, but DOES NOT WORK!
-
-  TODO: code won't handle records that are larger than 4K right now,
-  which, if we start getting into Toby Martin's Total Metadata Ingestion
-  (TMI), may not be enough. We'll need to implement something that will
-  aggregate recv()'s and know when it's got an entire record?
   """
   ############################
-  def __init__(self, network, buffer_size=BUFFER_SIZE):
+  def __init__(self, network, buffer_size=BUFFER_SIZE, binary=False,
+               framing=NEWLINE_FRAMING, tcp_nodelay=True, tcp_keepalive=True,
+               max_record_size=DEFAULT_MAX_RECORD_SIZE, coalesce=False,
+               multicast_interface=None):
     """
 
     network      Network address to read, in host:port format (e.g.
                  'rvdas:6202'). If host is omitted (e.g. ':6202'),
                  read via UDP on specified port.
+
+                 If host is specified, listen for TCP connections on
+                 that address (use '0.0.0.0' to listen on all
+                 interfaces), e.g. from NetworkWriters writing to the
+                 same host:port. Any number of writers may connect at
+                 once, and may come and go as they please.
+
+                 If host is a multicast group address (e.g.
+                 '239.192.0.7:6224'), join that group and read the
+                 datagrams sent to it via UDP. On Linux the socket is
+                 bound to the group, so that broadcasts to the port
+                 aren't read too. To read several groups on the same
+                 port, omit the host (e.g. ':6224') and join them, or
+                 leave them, with join_group() and leave_group(); such
+                 a reader also reads broadcasts to the port.
+
+    binary       Return packets as undecoded bytes, e.g. for records
+                 written by a NetworkWriter fed by ToBinaryTransform.
+
+    framing, max_record_size
+                 Over TCP, how records are delimited in the stream: by
+                 'newline' (default) or by 'length' prefix, which must
+                 match the framing the writer uses (see
+                 utils/network.py). Binary records should use 'length'.
+                 A connection sending a record bigger than
+                 max_record_size bytes is dropped.
+
+    tcp_nodelay, tcp_keepalive
+                 Whether to set TCP_NODELAY and SO_KEEPALIVE on TCP
+                 connections.
+
+    coalesce     If True, UDP datagrams may each carry several records,
+                 framed as above, as sent by a NetworkWriter with
+                 coalesce=True.
+
+    multicast_interface
+                 Address of the local interface on which to join
+                 multicast groups. If omitted, the system picks one.
     """
-    super().__init__(output_format=Text)
+    super().__init__(output_format=Binary_Record if binary else Text)
 
     self.network = network
+    self.binary = binary
     self.buffer_size = buffer_size
-    if network.find(':') == -1:
-      raise ValueError('NetworkReader network argument must be in '
-                       '\'host:port\' or \':port\' format. Found "%s"', network)
-    (host, port) = network.split(':')
-    port = int(port)
-
-    # TCP if host is specified
-    if host:
+    check_framing(framing, 'NetworkReader')
+    self.framing = framing
+    self.tcp_nodelay = tcp_nodelay
+    self.tcp_keepalive = tcp_keepalive
+    self.max_record_size = max_record_size
+    self.coalesce = coalesce
+    self.multicast_interface = multicast_interface
+    (host, port) = parse_network(network, 'NetworkReader')
+
+    # TCP if host is specified, unless it's a multicast group
+    self.multicast = is_multicast(host)
+    self.tcp = bool(host) and not self.multicast
+    if self.tcp:
       self.socket = socket.socket(family=socket.AF_INET,
                                   type=socket.SOCK_STREAM,
                                   proto=socket.IPPROTO_TCP)
-      # Should this be bind()?
-      self.socket.connect((host, port))
-      
+      self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, True)
+      self.socket.bind((host, port))
+      self.socket.listen(TCP_BACKLOG)
+
+      # Connected sockets and the RecordAssemblers for their streams
+      self.connections = {}
+
     # UDP broadcast if no host specified. Note that there's some
     # dodginess I don't understand about networks: if '<broadcast>' is
     # specified, socket tries to send on *all* interfaces. if '' is
     # specified, it tries to send on *any* interface.
     else:
-      host = '' # special code for broadcast
+      group = host
+      # On Linux, a multicast reader binds to its group so it doesn't
+      # get broadcasts (and unicasts) to the port too. Elsewhere,
+      # binding to a group address isn't necessarily allowed.
+      self.bound_group = None
+      if self.multicast and sys.platform.startswith('linux'):
+        self.bound_group = group
+      else:
+        host = '' # special code for broadcast
       self.socket = socket.socket(family=socket.AF_INET,
                                   type=socket.SOCK_DGRAM,
                                   proto=socket.IPPROTO_UDP)
@@ -66,13 +135,181 @@ class NetworkReader(Reader):
         logging.warning('Unable to set socket REUSEPORT; system may not support it.')
       self.socket.bind((host, port))
 
+      # Multicast groups we've joined
+      self.groups = set()
+      if self.multicast:
+        self.join_group(group)
+
+      # Buffer that read_batch() receives datagrams into
+      self.recv_buffer = bytearray(buffer_size)
+
+    # Records we've received but not yet returned
+    self.records = deque()
+
+  ############################
+  def join_group(self, group):
+    """Start receiving datagrams sent to multicast group on our port."""
+    if self.tcp:
+      raise ValueError('NetworkReader can\'t join multicast group %s over '
+                       'TCP' % group)
+    if not is_multicast(group):
+      raise ValueError('NetworkReader: "%s" is not a multicast group' % group)
+    if group in self.groups:
+      return
+    if self.bound_group is not None and group != self.bound_group:
+      raise ValueError('NetworkReader %s is bound to multicast group %s, so '
+                       'can\'t read group %s; read several groups with a '
+                       'reader that omits the host' %
+                       (self.network, self.bound_group, group))
+    if sys.platform.startswith('linux'):
+      # Only receive datagrams for groups we've joined ourselves
+      self.socket.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, False)
+    self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                           multicast_membership(group,
+                                                self.multicast_interface))
+    self.groups.add(group)
+    logging.info('NetworkReader %s joined multicast group %s',
+                 self.network, group)
+
+  ############################
+  def leave_group(self, group):
+    """Stop receiving datagrams sent to multicast group."""
+    if group not in self.groups:
+      return
+    self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP,
+                           multicast_membership(group,
+                                                self.multicast_interface))
+    self.groups.discard(group)
+    logging.info('NetworkReader %s left multicast group %s',
+                 self.network, group)
+
   ############################
   def read(self):
     """
-    Read the next network packet.
+    Read the next network packet (or, over TCP or when coalescing, the
+    next record).
     """
-    record = self.socket.recv(self.buffer_size)
+    if self.records:
+      record = self.records.popleft()
+    elif self.tcp:
+      while not self.records:
+        self._poll_tcp()
+      record = self.records.popleft()
+    elif self.coalesce:
+      while not self.records:
+        self._add_datagram(self.socket.recv(self.buffer_size))
+      record = self.records.popleft()
+    else:
+      record = self.socket.recv(self.buffer_size)
     logging.debug('NetworkReader.read() received %d bytes', len(record))
-    if record:
+    if record and not self.binary:
       record = record.decode('utf-8')
     return record
+
+  ############################
+  def read_batch(self, max_records=DEFAULT_BATCH_SIZE):
+    """Wait for at least one record, then return, as a list, all the
+    records that have arrived (up to max_records), without waiting for
+    any more. Calls may be freely interleaved with calls to read().
+
+    Over UDP, this drains every datagram waiting on the socket at
+    once, making one select() call per batch rather than a blocking
+    recv() per record."""
+    if self.tcp:
+      while not self.records:
+        self._poll_tcp()
+      self._poll_tcp(timeout=0)
+    else:
+      self._drain_udp(max_records)
+      while not self.records:
+        select.select([self.socket], [], [])
+        self._drain_udp(max_records)
+
+    if len(self.records) <= max_records:
+      records = list(self.records)
+      self.records.clear()
+    else:
+      popleft = self.records.popleft
+      records = [popleft() for _ in range(max_records)]
+    logging.debug('NetworkReader.read_batch() received %d records',
+                  len(records))
+    if not self.binary:
+      records = [record.decode('utf-8') for record in records]
+    return records
+
+  ############################
+  def _drain_udp(self, max_records):
+    """Without waiting, receive every datagram waiting, or enough to
+    make max_records records."""
+    view = memoryview(self.recv_buffer)
+    while len(self.records) < max_records:
+      try:
+        num_bytes = self.socket.recv_into(self.recv_buffer, 0,
+                                          socket.MSG_DONTWAIT)
+      except (BlockingIOError, InterruptedError):
+        break
+      datagram = bytes(view[:num_bytes])
+      if self.coalesce:
+        self._add_datagram(datagram)
+      else:
+        self.records.append(datagram)
+
+  ############################
+  def _add_datagram(self, datagram):
+    """Queue the records in a datagram of coalesced records."""
+    try:
+      self.records.extend(split_records(datagram, self.framing))
+    except ValueError as e:
+      logging.error('NetworkReader dropping malformed datagram: %s', e)
+
+  ############################
+  def _poll_tcp(self, timeout=None):
+    """Wait up to timeout seconds (forever if None) for any of our TCP
+    connections to have data, and queue the records it completes,
+    accepting new connections and dropping closed ones as we go."""
+    (readable, _, _) = select.select([self.socket] + list(self.connections),
+                                     [], [], timeout)
+    for sock in readable:
+      if sock is self.socket:
+        self._accept()
+        continue
+      try:
+        data = sock.recv(self.buffer_size)
+      except OSError as e:
+        logging.warning('NetworkReader connection error: %s', e)
+        data = b''
+      if not data:
+        self._drop(sock)
+        continue
+      try:
+        self.records.extend(self.connections[sock].feed(data))
+      except ValueError as e:
+        logging.error('NetworkReader dropping connection: %s', e)
+        self._drop(sock)
+
+  ############################
+  def _accept(self):
+    (conn, addr) = self.socket.accept()
+    logging.info('NetworkReader %s accepted connection from %s:%d',
+                 self.network, *addr)
+    set_tcp_options(conn, self.tcp_nodelay, self.tcp_keepalive)
+    self.connections[conn] = RecordAssembler(self.framing,
+                                             self.max_record_size)
+
+  ############################
+  def _drop(self, conn):
+    logging.info('NetworkReader %s closing connection', self.network)
+    del self.connections[conn]
+    conn.close()
+
+  ############################
+  def close(self):
+    """Close our socket and any TCP connections, leaving any multicast
+    groups we've joined."""
+    if self.tcp:
+      for conn in list(self.connections):
+        self._drop(conn)
+    else:
+      for group in list(self.groups):
+        self.leave_group(group)
+    self.socket.close()
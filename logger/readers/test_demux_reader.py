@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+import unittest
+
+sys.path.append('.')
+
+from logger.readers.demux_reader import DemuxReader
+
+SAMPLE_DATA = ['gyr1 2017-11-04T05:12:19.441672Z $HEHDT,235.95,T*14',
+               'knud 2017-11-04T05:12:19.508844Z 3.5kHz,5266.11,0,,,,1500',
+               'gyr1 2017-11-04T05:12:19.694566Z $HEHDT,235.95,T*14',
+               'seap 2017-11-04T05:12:20.113214Z $GPZDA,000000.00,04,11']
+
+############################
+def broadcast(port, data):
+  sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+  sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, True)
+  sock.connect(('<broadcast>', port))
+  for line in data:
+    sock.send(line.encode('utf-8'))
+  sock.close()
+
+############################
+def read_in_child(reader, count, results):
+  for _ in range(count):
+    results.put(reader.read())
+
+################################################################################
+class TestDemuxReader(unittest.TestCase):
+  ############################
+  def test_read(self):
+    gyr1 = DemuxReader(':8032', data_ids='gyr1', multiprocess=False)
+    knud_seap = DemuxReader(':8032', data_ids=['knud', 'seap'], binary=True)
+    everything = DemuxReader(':8032')
+    broadcast(8032, SAMPLE_DATA)
+
+    self.assertEqual([SAMPLE_DATA[0], SAMPLE_DATA[2]],
+                     [gyr1.read(), gyr1.read()])
+    self.assertEqual(SAMPLE_DATA[1].encode('utf-8'), knud_seap.read())
+    self.assertEqual(SAMPLE_DATA[3].encode('utf-8'), knud_seap.read())
+    time.sleep(0.1)
+    self.assertEqual(SAMPLE_DATA, everything.read_batch())
+
+    gyr1.close()
+    knud_seap.close()
+    everything.close()
+
+    with self.assertRaises(ValueError):
+      DemuxReader('rvdas:8032')
+
+  ############################
+  def test_forked(self):
+    # As when LoggerRunner creates a logger, then forks a process to run it
+    reader = DemuxReader(':8033', data_ids='gyr1')
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    proc = context.Process(target=read_in_child, args=(reader, 2, results),
+                           daemon=True)
+    proc.start()
+    broadcast(8033, SAMPLE_DATA)
+    self.assertEqual(SAMPLE_DATA[0], results.get(timeout=5))
+    self.assertEqual(SAMPLE_DATA[2], results.get(timeout=5))
+    proc.join(timeout=5)
+    reader.close()
+
+  ############################
+  def test_consumer_gone(self):
+    # When the process reading a DemuxReader dies, its queue is
+    # unsubscribed, and when no one's left, the demultiplexer closes.
+    reader = DemuxReader(':8034', data_ids='gyr1')
+    other = DemuxReader(':8034', data_ids='knud')
+    demux = reader.demux
+    self.assertIs(demux, other.demux)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    proc = context.Process(target=read_in_child, args=(reader, 2, results),
+                           daemon=True)
+    proc.start()
+    broadcast(8034, SAMPLE_DATA[0:1])
+    self.assertEqual(SAMPLE_DATA[0], results.get(timeout=5))
+    os.kill(proc.pid, signal.SIGKILL)
+
+    for _ in range(50):
+      if not b'gyr1' in demux.routes:
+        break
+      time.sleep(0.1)
+    self.assertEqual([other.queue], demux.routes[b'knud'])
+    self.assertNotIn(b'gyr1', demux.routes)
+    self.assertFalse(demux.closed)
+    proc.join(timeout=5)
+
+    other.close()
+    self.assertTrue(demux.closed)
+    self.assertFalse(demux.thread.is_alive())
+    reader.close()
+
+    # A new reader on the port gets a new demultiplexer
+    reader = DemuxReader(':8034', data_ids='gyr1')
+    self.assertIsNot(demux, reader.demux)
+    reader.close()
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -12,6 +12,7 @@ sys.path.append('.')
 
 from logger.readers.logfile_reader import LogfileReader
 from logger.utils import formats, timestamp
+from logger.utils.compressed_file import compress_file
 
 SAMPLE_DATA = """\
 2017-11-04T05:12:19.441672Z 3.5kHz,5360.54,1,,,,1500,-39.580717,-37.461886
@@ -304,6 +305,105 @@ class TestLogfileReader(unittest.TestCase):
       with self.assertRaises(ValueError):
         records = reader.read_time_range(START_TIMESTAMP - 1, END_TIMESTAMP)
 
+  ############################
+  def test_read_batch(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filebase = tmpdirname + '/mylog-'
+      sample_lines = []
+      for f in sorted(SAMPLE_DATA_2):
+        create_file(filebase + f, SAMPLE_DATA_2[f])
+        sample_lines.extend(SAMPLE_DATA_2[f])
+
+      reader = LogfileReader(filebase)
+      records = []
+      while True:
+        batch = reader.read_batch(4)
+        if not batch:
+          break
+        self.assertLessEqual(len(batch), 4)
+        records.extend(batch)
+      self.assertEqual(sample_lines, records)
+
+      reader.seek_time(1000, 'start')
+      self.assertEqual(sample_lines[4:], reader.read_batch())
+
+      with self.assertRaises(ValueError):
+        LogfileReader(filebase, use_timestamps=True).read_batch()
+
+  ############################
+  def test_seek_time_bisect(self):
+    self.check_seek_time_bisect(compress=False)
+
+  ############################
+  # As above, but with all but the last day's file compressed
+  def test_seek_time_bisect_compressed(self):
+    self.check_seek_time_bisect(compress=True)
+
+  ############################
+  def check_seek_time_bisect(self, compress):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filebase = tmpdirname + '/mylog-'
+      # Five days of records every 30 seconds, sprinkled with lines
+      # that have no timestamp.
+      start = timestamp.timestamp('2017-11-04T00:00:10.000000Z')
+      lines_by_date = {}
+      timed_lines = []
+      for i in range(5 * 2880):
+        ts = start + 30 * i
+        line = timestamp.time_str(ts) + ' record %d' % i
+        date = timestamp.date_str(ts)
+        lines_by_date.setdefault(date, []).append(line)
+        timed_lines.append((ts * 1000, line))
+        if i % 97 == 0:
+          lines_by_date[date].append('garbage line %d' % i)
+      for date, lines in lines_by_date.items():
+        create_file(filebase + date, lines)
+        if compress and date != '2017-11-08':
+          compress_file(filebase + date)
+
+      reader = LogfileReader(filebase)
+      line_msec = reader._line_msec
+      calls = []
+      def counting_line_msec(line):
+        calls.append(line)
+        return line_msec(line)
+      reader._line_msec = counting_line_msec
+
+      first_msec = timed_lines[0][0]
+      for offset in [0, 1, 29999, 30000, 86400000 - 10001, 86400000 - 10000,
+                     86400000 * 2 + 12345, 86400000 * 5 - 40000]:
+        calls.clear()
+        self.assertEqual(first_msec + offset, reader.seek_time(offset, 'start'))
+        expected = [line for ts, line in timed_lines
+                    if ts >= first_msec + offset]
+        self.assertEqual(expected[0] if expected else None, reader.read())
+        # We shouldn't have looked at more than a few blocks' worth of lines
+        self.assertLess(len(calls), 1000)
+
+      # Last 10 minutes
+      calls.clear()
+      self.assertEqual(timed_lines[-1][0] - 600000,
+                       reader.seek_time(-600000, 'end'))
+      records = []
+      while True:
+        record = reader.read()
+        if record is None:
+          break
+        records.append(record)
+      self.assertEqual(records, [line for line in lines_by_date['2017-11-08']
+                                 if not line.startswith('garbage')][-21:])
+      self.assertLess(len(calls), 1000)
+
+      # Seek past the end, then back from current position
+      reader.seek_time(86400000 * 10, 'start')
+      self.assertEqual(None, reader.read())
+      reader.seek_time(-60000, 'current')
+      self.assertEqual(timed_lines[-3][1], reader.read())
+
+      records = reader.read_time_range(first_msec + 86400000,
+                                       first_msec + 86400000 + 90000)
+      self.assertEqual(records, [line for ts, line in timed_lines[2880:2883]])
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
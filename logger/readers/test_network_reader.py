@@ -91,7 +91,136 @@ class TestNetworkReader(unittest.TestCase):
       self.assertTrue(False, 'NetworkReader timed out in test - is port '
                       '%s open?' % addr)
     signal.alarm(0)
-    
+
+  ############################
+  def test_tcp(self):
+    addr = 'localhost:8010'
+    reader = NetworkReader(addr)
+    long_line = 'tmi ' + 'x' * 20000
+
+    # Two writers, one after the other, each sending records in
+    # fragments; the second sends one bigger than our buffer.
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(5)
+    try:
+      for lines in [SAMPLE_DATA, [long_line] + SAMPLE_DATA]:
+        sock = socket.create_connection(('localhost', 8010))
+        stream = ''.join([line + '\n' for line in lines]).encode('utf-8')
+        for i in range(0, len(stream), 5):
+          sock.send(stream[i:i+5])
+        for line in lines:
+          self.assertEqual(line, reader.read())
+        sock.close()
+    except ReaderTimeout:
+      self.assertTrue(False, 'NetworkReader timed out in test - is port '
+                      '%s open?' % addr)
+    signal.alarm(0)
+    reader.close()
+
+  ############################
+  def test_tcp_length_framing(self):
+    reader = NetworkReader('localhost:8011', binary=True, framing='length')
+    sock = socket.create_connection(('localhost', 8011))
+    records = [b'\x00\n\xff', b'x' * 100000, b'']
+    for record in records:
+      sock.sendall(len(record).to_bytes(4, 'big') + record)
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(5)
+    for record in records:
+      self.assertEqual(record, reader.read())
+    signal.alarm(0)
+    sock.close()
+    reader.close()
+
+    with self.assertRaises(ValueError):
+      NetworkReader('localhost:8011', framing='smoke signals')
+
+  ############################
+  def test_udp_read_batch(self):
+    reader = NetworkReader(':8013')
+    sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, True)
+    sock.connect(('<broadcast>', 8013))
+
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(5)
+    lines = ['line %d' % i for i in range(20)]
+    for line in lines:
+      sock.send(line.encode('utf-8'))
+    time.sleep(0.2)
+    # Everything waiting arrives in one batch, unless we ask for less
+    self.assertEqual(lines[0:5], reader.read_batch(max_records=5))
+    self.assertEqual(lines[5], reader.read())
+    self.assertEqual(lines[6:], reader.read_batch())
+    signal.alarm(0)
+    sock.close()
+    reader.close()
+
+  ############################
+  def test_udp_coalesce(self):
+    reader = NetworkReader(':8014', coalesce=True)
+    sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, True)
+    sock.connect(('<broadcast>', 8014))
+
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(5)
+    sock.send(b'f1 line 1\nf1 line 2\n')
+    with self.assertLogs(logging.getLogger(), logging.ERROR):
+      sock.send(b'no trailing newline')
+      sock.send(b'f1 line 3\n')
+      time.sleep(0.2)
+      self.assertEqual(SAMPLE_DATA[0], reader.read())
+      self.assertEqual(SAMPLE_DATA[1:], reader.read_batch())
+    signal.alarm(0)
+    sock.close()
+    reader.close()
+
+  ############################
+  def test_multicast(self):
+    reader = NetworkReader('239.192.0.1:8017')
+    sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, True)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, True)
+
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(5)
+    # Only datagrams for groups we've joined get through - on Linux,
+    # not even broadcasts to our port.
+    sock.sendto(b'not for us', ('239.192.0.2', 8017))
+    if sys.platform.startswith('linux'):
+      sock.sendto(b'broadcast, not for us', ('<broadcast>', 8017))
+    sock.sendto(SAMPLE_DATA[0].encode('utf-8'), ('239.192.0.1', 8017))
+    self.assertEqual(SAMPLE_DATA[0], reader.read())
+    signal.alarm(0)
+    if sys.platform.startswith('linux'):
+      with self.assertRaises(ValueError):
+        reader.join_group('239.192.0.2')
+    reader.close()
+
+    # A reader without a group of its own can join and leave several
+    reader = NetworkReader(':8017')
+    reader.join_group('239.192.0.1')
+    self.assertEqual({'239.192.0.1'}, reader.groups)
+    signal.alarm(5)
+    sock.sendto(b'not for us', ('239.192.0.2', 8017))
+    sock.sendto(SAMPLE_DATA[0].encode('utf-8'), ('239.192.0.1', 8017))
+    self.assertEqual(SAMPLE_DATA[0], reader.read())
+
+    reader.join_group('239.192.0.2')
+    reader.leave_group('239.192.0.1')
+    self.assertEqual({'239.192.0.2'}, reader.groups)
+    sock.sendto(b'no longer for us', ('239.192.0.1', 8017))
+    sock.sendto(SAMPLE_DATA[1].encode('utf-8'), ('239.192.0.2', 8017))
+    self.assertEqual(SAMPLE_DATA[1], reader.read())
+    signal.alarm(0)
+
+    with self.assertRaises(ValueError):
+      reader.join_group('10.0.0.1')
+    reader.close()
+    self.assertEqual(set(), reader.groups)
+    sock.close()
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import logging
+import os
 import sys
 import tempfile
 import threading
@@ -8,10 +9,15 @@ import time
 import unittest
 import warnings
 
+from unittest import mock
+
 sys.path.append('.')
 
-from logger.readers.text_file_reader import TextFileReader
+from logger.readers.text_file_reader import TextFileReader, matching_files
 from logger.utils import formats
+from logger.utils.compressed_file import compress_file
+from logger.utils import file_watcher
+from logger.utils.file_watcher import FileWatcher
 
 SAMPLE_DATA = {
   'f1' : ['f1 line 1',
@@ -119,6 +125,47 @@ class TestTextFileReader(unittest.TestCase):
       for line in SAMPLE_DATA[target]:
         self.assertEqual(line, reader.read())
 
+  ############################
+  # With a FileWatcher, tailing readers should wake as soon as lines
+  # or files are written, not after retry_interval.
+  def test_tail_watch_files(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      if not FileWatcher([tmpdirname]).event_driven():
+        self.skipTest('inotify not available')
+      tmpfilename = tmpdirname + '/f1'
+      threading.Thread(target=create_file,
+                       args=(tmpfilename, SAMPLE_DATA['f1'],
+                             0.1, 0.2)).start()
+
+      start = time.time()
+      with self.assertLogs(logging.getLogger(), logging.WARNING):
+        reader = TextFileReader(tmpdirname + '/f*', tail=True,
+                                refresh_file_spec=True, retry_interval=10)
+      for line in SAMPLE_DATA['f1']:
+        self.assertEqual(line, reader.read())
+      self.assertLess(time.time() - start, 5)
+
+  ############################
+  # If the files are somewhere inotify can't see changes, e.g. on NFS,
+  # tailing readers should poll every retry_interval as usual.
+  def test_tail_network_filesystem(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      tmpfilename = tmpdirname + '/f1'
+      create_file(tmpfilename, SAMPLE_DATA['f1'][:1])
+      with mock.patch.object(file_watcher, 'filesystem_type',
+                             return_value='nfs'):
+        reader = TextFileReader(tmpfilename, tail=True, retry_interval=0.05)
+        self.assertEqual(SAMPLE_DATA['f1'][0], reader.read())
+        def append():
+          time.sleep(0.3)
+          with open(tmpfilename, 'a') as f:
+            f.write(SAMPLE_DATA['f1'][1] + '\n')
+        threading.Thread(target=append).start()
+        start = time.time()
+        self.assertEqual(SAMPLE_DATA['f1'][1], reader.read())
+        self.assertLess(time.time() - start, 1.5)
+        self.assertFalse(reader.watcher.event_driven())
+
   ############################
   # Check that reader output_formats work the way we expect
   def test_formats(self):
@@ -361,5 +408,130 @@ class TestTextFileReader(unittest.TestCase):
 
       self.assertEqual(expected_lines[1:4], reader.read_range(1, 4))
 
+  ############################
+  # Check seeking with an index that checkpoints every other line,
+  # and that the index keeps up when the last file grows.
+  def test_seek_with_index(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      expected_lines = []
+      for f in sorted(SAMPLE_DATA):
+        create_file(tmpdirname + '/' + f, SAMPLE_DATA[f])
+        expected_lines.extend(SAMPLE_DATA[f])
+
+      reader = TextFileReader(tmpdirname + '/f*', index_interval=2,
+                              save_index=True)
+      for start in range(9):
+        for stop in range(start, 11):
+          self.assertEqual(expected_lines[start:stop],
+                           reader.read_range(start, stop))
+      self.assertEqual(4, reader.seek(-5, 'end'))
+      self.assertEqual(expected_lines[4], reader.read())
+      self.assertEqual(1, reader.seek(-4, 'current'))
+      self.assertEqual(expected_lines[1], reader.read())
+
+      # Indexes are saved alongside the files if asked, and reused
+      self.assertTrue(os.path.exists(tmpdirname + '/.f1.lineidx'))
+      reader = TextFileReader(tmpdirname + '/f*', index_interval=2,
+                              save_index=True)
+      self.assertEqual(expected_lines[5:7], reader.read_range(5, 7))
+
+      # Append to last file; seeking from end should see new lines
+      with open(tmpdirname + '/f3', 'a') as f:
+        f.write('f3 line 4\nf3 line 5\n')
+      expected_lines.extend(['f3 line 4', 'f3 line 5'])
+      self.assertEqual(9, reader.seek(-2, 'end'))
+      self.assertEqual(expected_lines[9:], [reader.read(), reader.read()])
+
+      # If we can't save indexes, we carry on without
+      reader = TextFileReader(tmpdirname + '/f*', save_index=True,
+                              index_dir='/nonexistent')
+      self.assertEqual(expected_lines[6:], reader.read_range(6))
+
+  ############################
+  def test_read_batch(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      expected_lines = []
+      for f in sorted(SAMPLE_DATA):
+        create_file(tmpdirname + '/' + f, SAMPLE_DATA[f])
+        expected_lines.extend(SAMPLE_DATA[f])
+      # An empty file and a last line with no newline
+      create_file(tmpdirname + '/f4', [])
+      with open(tmpdirname + '/f5', 'w') as f:
+        f.write('f5 line 1\r\nf5 line 2')
+      expected_lines.extend(['f5 line 1', 'f5 line 2'])
+
+      reader = TextFileReader(tmpdirname + '/f*')
+      self.assertEqual(expected_lines[0:2], reader.read_batch(2))
+      self.assertEqual(2, reader.pos)
+      # Batches stop at the end of each file...
+      self.assertEqual(expected_lines[2:3], reader.read_batch(2))
+      self.assertEqual(expected_lines[3], reader.read())
+      self.assertEqual(expected_lines[4:6], reader.read_batch())
+      self.assertEqual({'f1': 0, 'f2': 3},
+                       {os.path.basename(f): pos
+                        for f, pos in reader.start_pos.items()})
+      self.assertEqual({'f1': 3},
+                       {os.path.basename(f): pos
+                        for f, pos in reader.end_pos.items()})
+      # ...and can be mixed with seeks
+      self.assertEqual(1, reader.seek(1, 'start'))
+      self.assertEqual(expected_lines[1:3], reader.read_batch())
+      self.assertEqual(expected_lines[3:6], reader.read_batch())
+      self.assertEqual(expected_lines[6:9], reader.read_batch())
+      self.assertEqual(expected_lines[9:10], reader.read_batch())
+      self.assertEqual(expected_lines[10:], reader.read_batch())
+      self.assertEqual(11, reader.pos)
+      self.assertEqual([], reader.read_batch())
+      self.assertEqual(None, reader.read())
+
+      with self.assertRaises(ValueError):
+        TextFileReader().read_batch()
+
+  ############################
+  def test_compressed_files(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      expected_lines = []
+      for f in sorted(SAMPLE_DATA):
+        create_file(tmpdirname + '/' + f, SAMPLE_DATA[f])
+        expected_lines.extend(SAMPLE_DATA[f])
+      compress_file(tmpdirname + '/f1')
+      compress_file(tmpdirname + '/f2')
+
+      reader = TextFileReader(tmpdirname + '/f*', index_interval=2)
+      for line in expected_lines:
+        self.assertEqual(line, reader.read())
+      self.assertEqual(None, reader.read())
+
+      for start in range(9):
+        self.assertEqual(expected_lines[start:start+4],
+                         reader.read_range(start, start+4))
+      self.assertEqual(1, reader.seek(1, 'start'))
+      self.assertEqual(expected_lines[1:3], reader.read_batch())
+      self.assertEqual(expected_lines[3:6], reader.read_batch())
+      self.assertEqual(expected_lines[6:9], reader.read_batch())
+
+  ############################
+  def test_compressed_while_reading(self):
+    # A file compressed after we've read it isn't a new file.
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      for f in ['f1', 'f2']:
+        create_file(tmpdirname + '/' + f, SAMPLE_DATA[f])
+      reader = TextFileReader(tmpdirname + '/f*', refresh_file_spec=True)
+      for line in SAMPLE_DATA['f1']:
+        self.assertEqual(line, reader.read())
+      compress_file(tmpdirname + '/f1')
+      for line in SAMPLE_DATA['f2']:
+        self.assertEqual(line, reader.read())
+      create_file(tmpdirname + '/f3', SAMPLE_DATA['f3'])
+      for line in SAMPLE_DATA['f3']:
+        self.assertEqual(line, reader.read())
+
+      # While a file is being compressed, both it and its compressed
+      # version exist; only the latter is listed.
+      compress_file(tmpdirname + '/f3', remove=False)
+      self.assertEqual([tmpdirname + '/f1.gz', tmpdirname + '/f2',
+                        tmpdirname + '/f3.gz'],
+                       matching_files(tmpdirname + '/f*'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,13 +2,50 @@
 
 import glob
 import logging
+import mmap
+import os
+import re
 import sys
 import time
 
+from functools import lru_cache
+
 sys.path.append('.')
 
 from logger.readers.reader import StorageReader
+from logger.utils.compressed_file import is_compressed, open_file
+from logger.utils.compressed_file import uncompressed_name, COMPRESSED_SUFFIX
+from logger.utils.file_watcher import FileWatcher
 from logger.utils.formats import Text
+from logger.utils.line_index import LineIndex, DEFAULT_INTERVAL
+
+# Default maximum number of records returned by read_batch()
+DEFAULT_BATCH_SIZE = 10000
+
+# When tailing with a FileWatcher that wakes us on changes, how long
+# to wait for one before taking a look anyway.
+WATCHED_RETRY_INTERVAL = 2.0
+
+################################################################################
+@lru_cache(maxsize=None)
+def _up_to_lines_re(count):
+  """Regex matching as many as count complete lines."""
+  return re.compile(b'(?:[^\n]*\n){1,%d}' % count)
+
+################################################################################
+def matching_files(file_spec):
+  """Return a sorted list of the files matching wildcarded file_spec.
+
+  While a logfile 'x' is being compressed (see compress_file() in
+  logger/utils/compressed_file.py), both 'x' and 'x.gz' briefly exist,
+  with the same contents. Only 'x.gz' is listed, so that no one reads
+  them both."""
+  files = {}
+  for filename in glob.glob(file_spec):
+    name = uncompressed_name(filename)
+    if not name in files or is_compressed(filename):
+      files[name] = filename
+  return [files[name] for name in sorted(files)]
 
 ################################################################################
 # Open and read single-line records from one or more text files.
@@ -18,7 +55,9 @@ class TextFileReader(StorageReader):
   """
   ############################
   def __init__(self, file_spec=None, tail=False, refresh_file_spec=False,
-               retry_interval=0.1, interval=0):
+               retry_interval=0.1, interval=0,
+               index_interval=DEFAULT_INTERVAL, save_index=False,
+               index_dir=None, watch_files=True):
     """
     file_spec    Possibly wildcarded string speficying files to be opened.
                  Special case: if file_spec is None, read from stdin.
@@ -41,6 +80,27 @@ class TextFileReader(StorageReader):
                  How long to sleep between returning records. In general
                  this should be zero except for debugging purposes.
 
+    index_interval, save_index, index_dir
+                 seek() and read_range() find their way around files using
+                 a LineIndex (see logger/utils/line_index.py) that records
+                 the offset of every index_interval-th line. If save_index
+                 is True, indexes are saved in sidecar files in index_dir
+                 (default: alongside each file) for reuse; otherwise
+                 they're kept in memory only.
+
+    watch_files  If True and the platform supports it (Linux inotify),
+                 tail/refresh_file_spec wait for the files' directories
+                 to change instead of polling every retry_interval. A
+                 check is still made every WATCHED_RETRY_INTERVAL seconds
+                 (or retry_interval, if longer) in case a change is
+                 missed. If any of the directories can't be watched
+                 (e.g. it's on a network filesystem, where inotify
+                 doesn't see other hosts' writes), we poll every
+                 retry_interval as before.
+
+    Files whose names end in '.gz' are decompressed as they're read;
+    see logger/utils/compressed_file.py.
+
     Note that the order in which files are opened will probably be in
     alphanumeric by filename, but this is not strictly enforced and
     depends on how glob returns them.
@@ -53,30 +113,65 @@ class TextFileReader(StorageReader):
     self.refresh_file_spec = refresh_file_spec
     self.retry_interval = retry_interval
     self.interval = interval
+    self.index_interval = index_interval
+    self.save_index = save_index
+    self.index_dir = index_dir
+    self.watch_files = watch_files
+
+    # Created the first time we need to wait for more records
+    self.watcher = None
 
     # If interval != 0, we need to keep track of our last_read to know
     # how long to sleep
     self.last_read = 0
-    
+
+    # Record number of the next record we'll read. After seek_offset()
+    # we don't know it until someone asks: _pos then counts records
+    # read since the position recorded in _pos_anchor.
+    self._pos = 0
+    self._pos_anchor = None
+
     # Special case if file_spec is None
     if file_spec is None:
       self.current_file = sys.stdin
       return
 
     # Which files will we use, which haven't we used yet?
-    self.unused_file_list = sorted(glob.glob(file_spec))
+    self.unused_file_list = matching_files(file_spec)
     if not self.unused_file_list:
       logging.warning('TextFileReader: file_spec "%s" matches no files',
                       file_spec)
     self.used_file_list = []
 
-    # The file we're currently using
+    # The file we're currently using, and a memory map of it if we're
+    # being read in batches
     self.current_file = None
+    self._mmap = None
+    self._mmap_file = None
 
-    self.pos = 0
     self.start_pos = {}
     self.end_pos = {}
 
+    # Line indexes for the files we've had to seek in, built on demand
+    self.line_indexes = {}
+
+  ############################
+  @property
+  def pos(self):
+    """Record number of the next record to be read."""
+    if self._pos_anchor is not None:
+      (prev_files, filename, offset) = self._pos_anchor
+      self._pos_anchor = None
+      self._pos += sum(self._line_index(prev).num_lines()
+                       for prev in prev_files)
+      self._pos += self._line_index(filename).line_number(offset)
+    return self._pos
+
+  @pos.setter
+  def pos(self, value):
+    self._pos = value
+    self._pos_anchor = None
+
   ############################
   def _get_next_file(self):
     """Internal - Open and assign the next unused file to
@@ -86,24 +181,36 @@ class TextFileReader(StorageReader):
     # If no more unused files, but refresh_file_spec is specified, see
     # if more files have shown up
     if not self.unused_file_list and self.refresh_file_spec:
-      matching_files = sorted(glob.glob(self.file_spec))
-      self.unused_file_list = [f for f in matching_files
-                               if not f in self.used_file_list]
+      # A file we've read may since have been compressed, i.e. renamed
+      # 'x.gz'; that's not a new file.
+      used = {uncompressed_name(f) for f in self.used_file_list}
+      self.unused_file_list = [f for f in matching_files(self.file_spec)
+                               if not uncompressed_name(f) in used]
       logging.info('TextFileReader found %d new files matching spec "%s": %s',
                    len(self.unused_file_list), self.file_spec,
                    self.unused_file_list)
 
     # Are there any more files? If so, get the next one and open it
     if self.unused_file_list:
-      # First, save the record count for the file we're about to close.
-      if self.used_file_list:
+      # First, save the record count for the file we're about to
+      # close, if we know it.
+      known_pos = self._pos_anchor is None
+      if self.used_file_list and known_pos:
         prev_filename = self.used_file_list[-1]
         self.end_pos[prev_filename] = self.pos
 
       next_filename = self.unused_file_list.pop(0)
       logging.info('TextFileReader opening next file "%s"', next_filename)
-      self.start_pos[next_filename] = self.pos
-      self.current_file = open(next_filename, 'r')
+      try:
+        self.current_file = open_file(next_filename)
+      except FileNotFoundError:
+        # Compressed since we listed it?
+        if is_compressed(next_filename):
+          raise
+        next_filename += COMPRESSED_SUFFIX
+        self.current_file = open_file(next_filename)
+      if known_pos:
+        self.start_pos[next_filename] = self.pos
       self.used_file_list.append(next_filename)
       return self.current_file
 
@@ -140,7 +247,7 @@ class TextFileReader(StorageReader):
           self.last_read = time.time()
           record = record.rstrip('\n')
           logging.debug('TextFileReader got record "%s"', record)
-          self.pos += 1
+          self._pos += 1
           return record
 
         # No record: our current_file has reached EOF. See if more
@@ -155,9 +262,139 @@ class TextFileReader(StorageReader):
         return None
 
       # User wants refresh or tail, so sleep and try again.
+      self._wait_for_changes()
+
+  ############################
+  def _watch_dirs(self):
+    """Directories in which new records or files may show up."""
+    if self.file_spec is None:
+      return set()
+    dirname = os.path.dirname(self.file_spec) or '.'
+    if glob.has_magic(dirname):
+      dirs = set(glob.glob(dirname))
+    else:
+      dirs = {dirname}
+    if self.used_file_list:
+      dirs.add(os.path.dirname(self.used_file_list[-1]) or '.')
+    return dirs
+
+  ############################
+  def _wait_for_changes(self):
+    """We're tailing and have run out of records: wait until there may
+    be more to read."""
+    if self.watcher is None:
+      self.watcher = FileWatcher(self._watch_dirs(),
+                                 use_inotify=self.watch_files)
+      if self.watcher.event_driven():
+        # Anything written before we started watching won't wake us,
+        # so take another look right away.
+        return
+    elif self.refresh_file_spec:
+      # New directories may have appeared that match a wildcarded spec
+      self.watcher.watch(self._watch_dirs())
+
+    # If inotify isn't available, or can't see changes in one of our
+    # directories (e.g. it's on NFS), poll at our usual rate.
+    if not self.watcher.event_driven():
       logging.debug('TextFileReader - tail/refresh specified, so sleeping '
                     '%f seconds before trying again', self.retry_interval)
       time.sleep(self.retry_interval)
+      return
+
+    self.watcher.wait(max(self.retry_interval, WATCHED_RETRY_INTERVAL))
+
+  ############################
+  def _map_current_file(self):
+    """Return an mmap of current_file covering all of it that's been
+    written so far, or None if it's empty."""
+    size = os.fstat(self.current_file.fileno()).st_size
+    if (self._mmap is not None and self._mmap_file is self.current_file and
+        len(self._mmap) == size):
+      return self._mmap
+    if self._mmap is not None:
+      self._mmap.close()
+      self._mmap = None
+    if not size:
+      return None
+    self._mmap = mmap.mmap(self.current_file.fileno(), size,
+                           access=mmap.ACCESS_READ)
+    self._mmap_file = self.current_file
+    return self._mmap
+
+  ############################
+  def _read_lines_from_current_file(self, max_records):
+    """Return up to max_records lines from current_file, stripped of
+    their newlines, and advance past them."""
+    if is_compressed(self.used_file_list[-1]):
+      # Can't map a compressed file; it's decompressed a block at a
+      # time anyway.
+      lines = []
+      for _ in range(max_records):
+        line = self.current_file.readline()
+        if not line:
+          break
+        lines.append(line.rstrip('\n'))
+      return lines
+
+    file_map = self._map_current_file()
+    if file_map is None:
+      return []
+    start = self.current_file.tell()
+    match = _up_to_lines_re(max_records).match(file_map, start)
+    if match:
+      end = match.end()
+    elif start < len(file_map):
+      # Final line with no newline: return it, as readline() would
+      end = len(file_map)
+    else:
+      return []
+    text = file_map[start:end].decode()
+    self.current_file.seek(end)
+
+    # Translate newlines as our text-mode readline() would
+    if '\r' in text:
+      text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if text.endswith('\n'):
+      text = text[:-1]
+    return text.split('\n')
+
+  ############################
+  def read_batch(self, max_records=DEFAULT_BATCH_SIZE):
+    """Get up to max_records lines of text at once, as a list. Return
+    an empty list if there are no more records.
+
+    Meant for bulk jobs (replays, reparsing, exports): lines are cut
+    out of a memory map of each file in one pass, rather than read
+    one Python call at a time, and no interval sleeps are taken. Calls
+    may be freely interleaved with calls to read().
+    """
+    if self.file_spec is None:
+      raise ValueError('read_batch() not supported when reading from stdin')
+    while True:
+      if self.current_file or self._get_next_file():
+        records = self._read_lines_from_current_file(max_records)
+        if records:
+          self.last_read = time.time()
+          self._pos += len(records)
+          return records
+
+        if self._get_next_file():
+          continue
+
+      if not self.refresh_file_spec and not self.tail:
+        return []
+
+      self._wait_for_changes()
+
+  ############################
+  def _line_index(self, filename):
+    """Return the LineIndex for filename, creating it if needed."""
+    line_index = self.line_indexes.get(filename)
+    if line_index is None:
+      line_index = LineIndex(filename, interval=self.index_interval,
+                             save=self.save_index, index_dir=self.index_dir)
+      self.line_indexes[filename] = line_index
+    return line_index
 
   ############################
   # Current behavior is to just go to the end if we run out of records,
@@ -165,53 +402,63 @@ class TextFileReader(StorageReader):
   # QUESTION: To really behave like seek(), we'd have to keep track of self.pos
   # beyond the end of the file, e.g. seek(100, 'start') would always return
   # 100, even if there are < 100 records. Is this what we want?
-  def _seek_forward_from_current(self, offset=0):
-    if offset == 0:
-      return
-    if offset < 0:
-      return self._seek_back_from_current(offset)
-    i = 0
-    while i < offset:
-      if self.current_file or self._get_next_file():
-        if self.current_file.readline():
-          i += 1
-          self.pos += 1
-        else:
-          if self._get_next_file() is None:
-            break
-    # TODO: take advantage of self.start_pos and self.end_pos if we've
-    # already processed later files.
-
-  ############################
-  def _seek_back_from_current(self, offset=0):
-    if offset == 0:
-      return
-    if offset > 0:
-      return self._seek_forward_from_current(offset)
-    target = self.pos + offset
+  def _seek_to(self, target, file_list):
+    """Position ourselves so that the next record read is record number
+    target of the files in file_list. Uses each file's LineIndex to
+    count its lines and find the target line."""
     if target < 0:
       raise ValueError("Can't back up past earliest record")
 
-    # Find the right file.
-    current_filename = self.used_file_list[-1]
-    while target < self.start_pos[current_filename]:
-      self.unused_file_list.insert(0, current_filename)
-      self.used_file_list.pop()
+    # If the target is in the file we've already got open, just move
+    # within it.
+    if self.current_file and self.used_file_list:
       current_filename = self.used_file_list[-1]
-
-    self.current_file = open(current_filename, 'r')
-
-    # TODO: implement backwards search within the file
-    for _ in range(target - self.start_pos[current_filename]):
-      self.current_file.readline()
-    self.pos = target
+      start = self.start_pos.get(current_filename)
+      if (file_list[:len(self.used_file_list)] == self.used_file_list and
+          start is not None and start <= target):
+        line_index = self._line_index(current_filename)
+        num_lines = line_index.num_lines()
+        if (target < start + num_lines or
+            len(file_list) == len(self.used_file_list)):
+          line = min(target - start, num_lines)
+          self.current_file.seek(line_index.offset(line))
+          self.unused_file_list = file_list[len(self.used_file_list):]
+          self.pos = start + line
+          return
+
+    # Otherwise count our way through the files until we find it,
+    # stopping at the end of the last one.
+    start = 0
+    for i, filename in enumerate(file_list):
+      line_index = self._line_index(filename)
+      num_lines = line_index.num_lines()
+      self.start_pos[filename] = start
+      if target < start + num_lines or i == len(file_list) - 1:
+        line = min(target - start, num_lines)
+        logging.info('TextFileReader opening file "%s" at line %d',
+                     filename, line)
+        self.current_file = open_file(filename)
+        self.current_file.seek(line_index.offset(line))
+        self.used_file_list = file_list[:i+1]
+        self.unused_file_list = file_list[i+1:]
+        self.pos = start + line
+        return
+      start += num_lines
+      self.end_pos[filename] = start
+
+    # No files at all
+    self.current_file = None
+    self.used_file_list = []
+    self.unused_file_list = []
+    self.pos = 0
 
   ############################
   def _save_state(self):
     state = {
       'used_file_list': self.used_file_list[:],
       'unused_file_list': self.unused_file_list[:],
-      'pos': self.pos
+      'pos': self._pos,
+      'pos_anchor': self._pos_anchor
     }
     if self.current_file:
       state['current_filename'] = self.used_file_list[-1]
@@ -223,11 +470,38 @@ class TextFileReader(StorageReader):
     self.used_file_list = state['used_file_list']
     self.unused_file_list = state['unused_file_list']
     if 'current_filename' in state:
-      self.current_file = open(state['current_filename'], 'r')
+      self.current_file = open_file(state['current_filename'])
       self.current_file.seek(state['current_file_pos'])
     else:
       self.current_file = None
-    self.pos = state['pos']
+    self._pos = state['pos']
+    self._pos_anchor = state['pos_anchor']
+
+  ############################
+  def seek_offset(self, filename, offset):
+    """Position ourselves at byte offset in filename, which should be
+    one of the files matching our file_spec and offset the start of a
+    line in it. For callers that know where they want to be in bytes
+    rather than records; our record position is only worked out if
+    someone asks for it."""
+    file_list = matching_files(self.file_spec)
+    names = [uncompressed_name(f) for f in file_list]
+    i = names.index(uncompressed_name(filename))
+    filename = file_list[i]
+    self.current_file = open_file(filename)
+    self.current_file.seek(offset)
+    self.used_file_list = file_list[:i+1]
+    self.unused_file_list = file_list[i+1:]
+    self._pos = 0
+    self._pos_anchor = (file_list[:i], filename, offset)
+
+  ############################
+  def peek(self):
+    """Return the next record without consuming it."""
+    state = self._save_state()
+    record = self.read()
+    self._restore_state(state)
+    return record
 
   ############################
   # Behavior is intended to mimic file seek() behavior but with
@@ -240,42 +514,18 @@ class TextFileReader(StorageReader):
       if origin == 'start':
         if offset < 0:
           raise ValueError("Can't back up past earliest record")
-        self.used_file_list = []
-        self.unused_file_list = sorted(glob.glob(self.file_spec))
-        self.current_file = None
-        self.pos = 0
-        self._seek_forward_from_current(offset)
+        self._seek_to(offset, matching_files(self.file_spec))
 
       elif origin == 'current':
-        if offset >= 0:
-          self._seek_forward_from_current(offset)
-        else:
-          self._seek_back_from_current(offset)
+        self._seek_to(self.pos + offset,
+                      self.used_file_list + self.unused_file_list)
 
       elif origin == 'end':
-        # Have to count lines in all files that haven't been processed yet.
         # TODO: take self.refresh_file_spec into account
-        file_list = sorted(glob.glob(self.file_spec))
-        pos = 0
-        for filename in file_list:
-          if filename in self.end_pos:
-            pos = self.end_pos[filename]
-          else:
-            self.start_pos[filename] = pos
-
-            # TODO: this can be made faster, if needed
-            with open(filename) as f:
-              for n, _ in enumerate(f, 1):
-                pass
-
-            pos += n
-            self.end_pos[filename] = pos
-
-        self.used_file_list = file_list
-        self.unused_file_list = []
-        self.current_file = None
-        self.pos = pos
-        self._seek_back_from_current(offset)
+        file_list = matching_files(self.file_spec)
+        num_lines = sum(self._line_index(filename).num_lines()
+                        for filename in file_list)
+        self._seek_to(num_lines + offset, file_list)
 
       else:
         raise ValueError('Unknown origin value: "%s"' % origin)
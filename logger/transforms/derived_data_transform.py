@@ -29,6 +29,7 @@ from logger.transforms.transform import Transform
 
 from logger.utils import formats
 from logger.utils.das_record import DASRecord
+from logger.utils.record_batch import RecordBatch, column_values
 
 ################################################################################
 class DerivedDataTransform(Transform):
@@ -193,12 +194,53 @@ class ComposedDerivedDataTransform(Transform):
           results[field].append([timestamp, value])
 
     return results or None
-          
 
-      
-
-      
-
-    
+  ############################
+  def transform_batch(self, records):
+    """Take a batch of records and return a list of the anonymous
+    DASRecords that transform() would have returned for them. If
+    records is a RecordBatch, work through it a column at a time.
+
+    A RecordBatch built from records that didn't all have the same
+    fields has None where a record lacked a field. Such values are
+    skipped, rather than overwriting the last value we had, just as
+    transform() would never have seen them."""
+    if not type(records) is RecordBatch:
+      return super().transform_batch(records)
+    if not len(records):
+      return []
+
+    field_names = list(records.fields)
+    columns = [column_values(records.fields[field]) for field in field_names]
+    field_transforms = [self.fields.get(field, set()) for field in field_names]
+
+    # If no one's interested, all we need do is cache the last values
+    if not any(field_transforms):
+      for field, column in zip(field_names, columns):
+        for row in range(len(column) - 1, -1, -1):
+          if column[row] is not None:
+            self.values[field] = column[row]
+            self.timestamps[field] = records.timestamps[row]
+            break
+      return []
+
+    results = []
+    for row, timestamp in enumerate(records.timestamps):
+      transforms_to_run = set()
+      for field, column, transforms in zip(field_names, columns,
+                                           field_transforms):
+        value = column[row]
+        if value is None:
+          continue
+        self.values[field] = value
+        self.timestamps[field] = timestamp
+        transforms_to_run.update(transforms)
 
-    
+      row_results = {}
+      for transform in transforms_to_run:
+        t_results = transform.transform(self.values, self.timestamps)
+        if t_results:
+          row_results.update(t_results)
+      if row_results:
+        results.append(DASRecord(timestamp=timestamp, fields=row_results))
+    return results
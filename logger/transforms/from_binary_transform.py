@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+sys.path.append('.')
+
+from logger.utils import formats
+from logger.utils.binary_record import BinaryRecordDecoder
+from logger.transforms.transform import Transform
+
+################################################################################
+class FromBinaryTransform(Transform):
+  """Convert a binary-encoded record produced by ToBinaryTransform back
+  into a DASRecord."""
+  def __init__(self, json=False):
+    """
+    json    Return a JSON-encoded representation of the DASRecord instead
+            of DASRecord itself.
+    """
+    super().__init__(input_format=formats.Binary_Record,
+                     output_format=formats.Python_Record)
+    self.json = json
+    self.decoder = BinaryRecordDecoder()
+
+  ############################
+  def transform(self, record):
+    """Decode record, returning None if it can't be decoded."""
+    if not record:
+      return None
+    try:
+      result = self.decoder.decode(record)
+    except ValueError as e:
+      logging.warning('Unable to decode binary record: %s', e)
+      return None
+    if self.json:
+      return result.as_json()
+    return result
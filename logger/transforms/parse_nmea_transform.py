@@ -16,7 +16,8 @@ class ParseNMEATransform(Transform):
                message_path=nmea_parser.DEFAULT_MESSAGE_PATH,
                sensor_path=nmea_parser.DEFAULT_SENSOR_PATH,
                sensor_model_path=nmea_parser.DEFAULT_SENSOR_MODEL_PATH,
-               time_format=None):
+               time_format=None, check_checksum=False,
+               definition_cache_file=None, refresh_interval=0):
     """
     json    Return a JSON-encoded representation of the DASRecord instead
             of DASRecord itself.
@@ -24,13 +25,30 @@ class ParseNMEATransform(Transform):
     message_path, sensor_path, sensor_model_path
             Wildcarded path matching JSON definitions for sensor messages,
             sensors and sensor models.
+
+    time_format
+            Format in which to expect record timestamps.
+
+    check_checksum
+            If True, discard NMEA messages whose '*hh' checksum doesn't
+            match before doing any further parsing.
+
+    definition_cache_file
+            Optional JSON file in which to cache parsed definitions
+            for use by parsers in other processes.
+
+    refresh_interval
+            If non-zero, check this often (in seconds) whether definition
+            files have changed, and reload them if they have.
     """
     super().__init__(input_format=formats.NMEA,
                      output_format=formats.Python_Record)
     self.json = json
-    self.parser = nmea_parser.NMEAParser(message_path, sensor_path,
-                                         sensor_model_path,
-                                         time_format=time_format)
+    self.parser = nmea_parser.NMEAParser(
+      message_path, sensor_path, sensor_model_path,
+      time_format=time_format, check_checksum=check_checksum,
+      definition_cache_file=definition_cache_file,
+      refresh_interval=refresh_interval)
   
   ############################
   def transform(self, record):
@@ -14,15 +14,45 @@ sys.path.append('.')
 
 from logger.utils import formats
 from logger.utils.das_record import DASRecord
+from logger.utils.qc import FieldQC, QCEngine, QC_FLAGS_KEY
+from logger.utils.record_batch import RecordBatch
 from logger.transforms.transform import Transform
 
+################################################################################
+def _parse_conditions(spec, name, template, num_params, optional=0,
+                      allow_empty=False):
+  """Parse a comma-separated list of conditions of the form
+  field_name:param[:param...], of which the last optional params may be
+  omitted, into a list of (field_name, [params]). If allow_empty, empty
+  params are returned as None."""
+  conditions = []
+  for condition in spec.split(','):
+    try:
+      (field_name, *params) = condition.split(':')
+      if not num_params - optional <= len(params) <= num_params:
+        raise ValueError
+      if '' in params and not allow_empty:
+        raise ValueError
+      conditions.append(
+        (field_name, [None if p == '' else float(p) for p in params]))
+    except ValueError:
+      raise ValueError('QCFilterTransform %s must be %s. Found "%s" instead.'
+                       % (name, template, condition))
+  return conditions
+
 ################################################################################
 # 
 class QCFilterTransform(Transform):
   """
-  Transform that returns None unless values in passed DASRecord are out of
-  bounds, in which case return a warning message."""
-  def __init__(self, bounds, message=None):
+  Transform that returns None unless values in passed DASRecord fail QC
+  (see utils/qc.py), in which case return a warning message.
+
+  The flags of fields that fail are also attached to the record, as a
+  dict of {field_name: flags} in record.metadata['qc_flags'] or, for a
+  RecordBatch, as a dict of {field_name: array of flags} in its
+  qc_flags."""
+  def __init__(self, bounds=None, message=None, rate=None, stuck=None,
+               spike=None, max_gap=None):
     """
     bounds   A comma-separated list of conditions of the format
 
@@ -30,59 +60,102 @@ class QCFilterTransform(Transform):
 
              Either <lower_bound> or <upper_bound> may be empty.
 
-    message  Optional string to be output instead of default when bounds
-             are violated
+    message  Optional string to be output instead of default when QC
+             fails
+
+    rate     A comma-separated list of <field_name>:<max_rate>, the most
+             the field may change per second.
+
+    stuck    A comma-separated list of <field_name>:<count>; flag the
+             field if <count> records in a row have the same value.
+
+    spike    A comma-separated list of <field_name>:<threshold>[:<window>];
+             flag the field if it differs by more than <threshold> from
+             the median of its previous <window> (default 10) values.
+
+    max_gap  Flag records arriving more than this many seconds after the
+             previous record with the same data_id.
+
+    The rate, stuck, spike and max_gap checks compare each record with
+    those before it, so records must be passed in order.
     """
     super().__init__(input_format=formats.Python_Record,
                      output_format=formats.Text)
 
     self.message = message
     self.bounds = {}
-    for condition in bounds.split(','):
-      try:
-        (var, lower_str, upper_str) = condition.split(':')
-        lower = None if lower_str == '' else float(lower_str)
-        upper = None if upper_str == '' else float(upper_str)
+    rules = {}
+    if bounds:
+      for (var, params) in _parse_conditions(
+          bounds, 'bounds', 'colon-separated triples of '
+          'field_name:lower_bound:upper_bound', 2, allow_empty=True):
+        (lower, upper) = params
         self.bounds[var] = (lower, upper)
-      except ValueError:
-        raise ValueError('QCFilterTransform bounds must be colon-separated '
-                         'triples of field_name:lower_bound:upper_bound. '
-                         'Found "%s" instead.' % condition)
+        rules.setdefault(var, {}).update(lower=lower, upper=upper)
+    if rate:
+      for (var, [max_rate]) in _parse_conditions(
+          rate, 'rate', 'colon-separated pairs of field_name:max_rate', 1):
+        rules.setdefault(var, {})['max_rate'] = max_rate
+    if stuck:
+      for (var, [count]) in _parse_conditions(
+          stuck, 'stuck', 'colon-separated pairs of field_name:count', 1):
+        rules.setdefault(var, {})['stuck_count'] = int(count)
+    if spike:
+      for (var, params) in _parse_conditions(
+          spike, 'spike', 'of the form field_name:threshold[:window]', 2,
+          optional=1):
+        rules.setdefault(var, {})['spike_threshold'] = params[0]
+        if len(params) > 1:
+          rules[var]['spike_window'] = int(params[1])
+    self.engine = QCEngine({var: FieldQC(**kwargs)
+                            for var, kwargs in rules.items()},
+                           max_gap=max_gap)
 
   ############################
   def transform(self, record):
-    """Does record violate any bounds?"""
+    """Does record fail QC?"""
     if not record:
       return None
 
-    errors = []
-
     if not type(record) is DASRecord:
-      errors.append('Improper format record: %s' % str(record))
-
-    else:
-      for bound in self.bounds:
-        if not bound in record.fields:
-          continue
-        value = record.fields.get(bound)
-        (lower, upper) = self.bounds[bound]
-        if type(value) is not int and type(value) is not float:
-          errors.append('%s: non-numeric value: "%s"' % (bound, value))
-          continue
-
-        if lower is not None and value < lower:
-          errors.append('%s: %g < lower bound %g' % (bound, value, lower))
-        if upper is not None and value > upper:
-          errors.append('%s: %g > upper bound %g' % (bound, value, upper))
-
-    # If no errors, return None. Otherwise either return the specified
+      return self.message or 'Improper format record: %s' % str(record)
+
+    # If no flags, return None. Otherwise either return the specified
     # message (if we've been given one), or the joined string of
     # specific failures.
-    if not errors:
+    flags = self.engine.check(record)
+    if not flags:
       return None
+    record.metadata[QC_FLAGS_KEY] = flags
 
     if self.message:
       return self.message
-    else:
-      return '; '.join(errors)
+    return '; '.join(self.engine.describe(flags, record.fields))
 
+  ############################
+  def transform_batch(self, records):
+    """Check a batch of records, returning a list of the messages that
+    transform() would have returned for each. If records is a
+    RecordBatch, check its columns directly."""
+    if not type(records) is RecordBatch:
+      return super().transform_batch(records)
+
+    # Field name -> array of flags, for fields with any non-zero flags
+    flag_columns = self.engine.check_batch(records)
+    records.qc_flags = flag_columns
+    if not flag_columns:
+      return []
+
+    rows = sorted({i for column in flag_columns.values()
+                   for i, flags in enumerate(column) if flags})
+    if self.message:
+      return [self.message for i in rows]
+
+    messages = []
+    for i in rows:
+      flags = {field_name: column[i]
+               for field_name, column in flag_columns.items() if column[i]}
+      fields = {field_name: records.fields[field_name][i]
+                for field_name in flags if field_name in records.fields}
+      messages.append('; '.join(self.engine.describe(flags, fields)))
+    return messages
@@ -3,33 +3,163 @@
 import re
 import sys
 
+from operator import methodcaller
+
 sys.path.append('.')
 
 from logger.utils import formats
 from logger.transforms.transform import Transform
 
+# A run of literal regex text: anything but a metacharacter, or a
+# backslash-escaped non-alphanumeric (e.g. '\ ', '\.').
+_LITERAL = r'(?:[^.^$*+?{}\[\]\\|()]|\\[^A-Za-z0-9])*'
+
+# Patterns we can handle without the regex engine: '^lit',
+# '^lit1|^lit2', and '^(lit1|lit2)lit' or '^(?:lit1|lit2)lit'.
+_ANCHORED_LITERALS_RE = re.compile(r'\^(%s)(?:\|\^(%s))*' % (_LITERAL, _LITERAL))
+_ANCHORED_GROUP_RE = re.compile(r'\^\((?:\?:)?(%s(?:\|%s)*)\)(%s)'
+                                % (_LITERAL, _LITERAL, _LITERAL))
+_UNANCHORED_LITERAL_RE = re.compile(_LITERAL)
+
+# With more than this many prefixes, all of the form 'data_id ', we look
+# up records' first tokens in a set rather than try each prefix in turn.
+TOKEN_SET_THRESHOLD = 16
+
+############################
+def _unescape(literal):
+  return re.sub(r'\\(.)', r'\1', literal)
+
+############################
+def _split_alternatives(pattern):
+  """Split pattern at each '|' that isn't escaped."""
+  alternatives = ['']
+  for token in re.findall(r'\\.|\||[^\\|]+', pattern):
+    if token == '|':
+      alternatives.append('')
+    else:
+      alternatives[-1] += token
+  return alternatives
+
+############################
+def _literal_prefixes(pattern):
+  """If pattern only matches strings beginning with one of a set of
+  literal prefixes, return a tuple of them; otherwise return None."""
+  if _ANCHORED_LITERALS_RE.fullmatch(pattern):
+    return tuple([_unescape(alt[1:]) for alt in _split_alternatives(pattern)])
+  match = _ANCHORED_GROUP_RE.fullmatch(pattern)
+  if match:
+    suffix = _unescape(match.group(2))
+    return tuple([_unescape(alt) + suffix
+                  for alt in _split_alternatives(match.group(1))])
+  return None
+
 ################################################################################
 class RegexFilterTransform(Transform):
   """Only return records matching the specified regular expression."""
   ############################
   def __init__(self, pattern, flags=0, negate=False):
-    """If negate=True, only return records that *don't* match the pattern."""
+    """If negate=True, only return records that *don't* match the pattern.
+
+    pattern may also be a list of patterns, in which case records
+    matching any of them are returned.
+
+    Most patterns are used to pick out records beginning with a
+    particular data_id, e.g. '^gyr1 ' or '^(gyr1|knud) '. Patterns that
+    can only match a literal prefix (or, unanchored, a literal
+    substring) are checked with string methods rather than by the
+    regex engine; with a list of patterns, all such prefixes are
+    checked at once.
+    """
     super().__init__(input_format=formats.Text, output_format=formats.Text)
-    self.pattern = re.compile(pattern, flags)
+    patterns = [pattern] if isinstance(pattern, str) else list(pattern)
+    self.pattern = re.compile(patterns[0], flags) if len(patterns) == 1 else None
     self.negate = negate
 
+    prefixes = []
+    self.substrings = []
+    self.regexes = []
+    for pattern in patterns:
+      literals = _literal_prefixes(pattern) if flags == 0 else None
+      if literals is not None:
+        prefixes.extend(literals)
+      elif flags == 0 and _UNANCHORED_LITERAL_RE.fullmatch(pattern):
+        self.substrings.append(_unescape(pattern))
+      else:
+        self.regexes.append(re.compile(pattern, flags))
+
+    self.prefixes = tuple(prefixes)
+    self.first_tokens = None
+    if len(prefixes) > TOKEN_SET_THRESHOLD and \
+       all([p.endswith(' ') and p.count(' ') == 1 for p in prefixes]):
+      self.first_tokens = frozenset([p[:-1] for p in prefixes])
+    self.matches = self._matcher()
+
+    # Whether the first-token set is all there is to check, in which
+    # case transform_batch() can check it inline.
+    self._use_token_set = (self.first_tokens is not None and
+                           not self.substrings and not self.regexes)
+
+  ############################
+  def _matcher(self):
+    """Return the quickest function we can for testing whether a record
+    matches: it returns something true if it does. Where we can, it's a
+    builtin, to save the cost of a Python function call per record."""
+    prefixes = self.prefixes
+    first_tokens = self.first_tokens
+    substrings = self.substrings
+    searches = [regex.search for regex in self.regexes]
+
+    if first_tokens is not None:
+      prefix_match = self._token_match
+    elif prefixes:
+      prefix_match = methodcaller('startswith', prefixes)
+    else:
+      prefix_match = None
+
+    if prefix_match and not substrings and not searches:
+      return prefix_match
+    if len(searches) == 1 and not prefixes and not substrings:
+      return searches[0]
+
+    def match(record):
+      if prefix_match and prefix_match(record):
+        return True
+      for substring in substrings:
+        if substring in record:
+          return True
+      for search in searches:
+        if search(record):
+          return True
+      return False
+    return match
+
+  ############################
+  def _token_match(self, record):
+    """Does record begin with one of our first tokens and a space?"""
+    (token, sep, _) = record.partition(' ')
+    return bool(sep) and token in self.first_tokens
+
   ############################
   def transform(self, record):
     """Does record contain pattern?"""
     if not record:
       return None
 
-    match = self.pattern.search(record)
-    if match is None:
-      if self.negate:
-        return record
-      return None
-    else:
-      if self.negate:
-        return None
-      return record
+    if self.matches(record):
+      return None if self.negate else record
+    return record if self.negate else None
+
+  ############################
+  def transform_batch(self, records):
+    """Return the records in a list that pass the filter."""
+    matches = self.matches
+    negate = self.negate
+    first_tokens = self.first_tokens
+    if self._use_token_set:
+      heads = [record.partition(' ') if record else ('', '', '')
+               for record in records]
+      return [record for record, (token, sep, _) in zip(records, heads)
+              if record and (bool(sep) and token in first_tokens) != negate]
+    if negate:
+      return [record for record in records if record and not matches(record)]
+    return [record for record in records if record and matches(record)]
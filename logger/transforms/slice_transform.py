@@ -60,12 +60,68 @@ class SliceTransform(Transform):
       logging.error('Bad field format "%s" - %s', field, e)
       raise e
 
+    # Simple, common specs (e.g. '1:' to strip a leading timestamp) are
+    # done with a bounded split or partition of the record rather than
+    # splitting all of it and joining what we want back together.
+    self.simple_slice = self._compile_simple()
+
+  ############################
+  def _compile_simple(self):
+    """If our field spec is a single index, or drops or keeps the first
+    N fields, return a function taking a record and returning its slice
+    as split by sep (or ' ', if sep is None). Otherwise return None."""
+    if len(self.fields) != 1:
+      return None
+    field = self.fields[0]
+    sep = self.sep or ' '
+
+    if type(field) is int:
+      if field == 0:
+        return lambda record: record.partition(sep)[0]
+      if field > 0:
+        return lambda record: record.split(sep, field + 1)[field]
+      if field == -1:
+        return lambda record: record.rpartition(sep)[2]
+      return lambda record: record.rsplit(sep, -field)[field]
+
+    (start, end) = field
+    if start < 0 or end < 0:
+      return None
+    if end == sys.maxsize:
+      if start == 0:       # ':'
+        return lambda record: record
+      if start == 1:       # '1:'
+        return lambda record: record.partition(sep)[2]
+      def drop_first(record):
+        parts = record.split(sep, start)
+        return parts[start] if len(parts) > start else ''
+      return drop_first
+
+    if start == 0 and end > 0:  # ':N'
+      def keep_first(record):
+        parts = record.split(sep, end)
+        if len(parts) <= end:
+          return record
+        return record[:len(record) - len(parts[end]) - len(sep)]
+      return keep_first
+    return None
+
   ############################
   def transform(self, record):
     """Strip and return only the requested fields."""
     if record is None:
       return None
 
+    # Splitting on whitespace (sep=None) also normalizes it, which the
+    # simple slicers don't, so they're only used on records separated by
+    # single spaces - those with no leading, trailing or doubled spaces
+    # and no other whitespace (which isprintable() rules out).
+    if self.simple_slice and (
+        self.sep is not None or
+        (record.isprintable() and '  ' not in record and
+         record[:1] != ' ' and record[-1:] != ' ' and record)):
+      return self.simple_slice(record)
+
     in_record = record.split(self.sep)
     out_record = []
     for field in self.fields:
@@ -11,6 +11,7 @@ sys.path.append('.')
 from logger.transforms.derived_data_transform import *
 from logger.transforms.true_winds_transform import TrueWindsTransform
 from logger.transforms.parse_nmea_transform import ParseNMEATransform
+from logger.utils.record_batch import RecordBatch
 
 LINES = """mwx1 2017-11-04T05:12:19.537917Z PUS,A,071,010.90,M,+340.87,+015.31,60,08
 s330 2017-11-04T05:12:20.240177Z $INRMC,000000.16,A,3934.831698,S,03727.695242,W,10.8,227.19,070814,18.5,W,A*00
@@ -275,6 +276,75 @@ class TestComposedDerivedDataTransform(unittest.TestCase):
       else:
         self.assertRecursiveAlmostEqual(result.fields, expected)
 
+  ############################
+  def test_record_batch(self):
+    """Test feeding runs of records in as RecordBatches."""
+    parse = ParseNMEATransform()
+    port_winds = TrueWindsTransform(course_field='S330CourseTrue',
+                                    speed_field='S330Speed',
+                                    heading_field='S330HeadingTrue',
+                                    wind_dir_field='MwxPortRelWindDir',
+                                    wind_speed_field='MwxPortRelWindSpeed',
+                                    true_dir_name='PortTrueWindDir',
+                                    true_speed_name='PortTrueWindSpeed',
+                                    apparent_dir_name='PortApparentWindDir',
+                                    convert_speed_factor=0.5144)
+    t = ComposedDerivedDataTransform(transforms=[RecipTransform(), port_winds])
+
+    # Group consecutive records with the same data_id and message_type
+    runs = []
+    for line in LINES:
+      record = parse.transform(line)
+      if runs and (runs[-1][-1].data_id, runs[-1][-1].message_type) == \
+         (record.data_id, record.message_type):
+        runs[-1].append(record)
+      else:
+        runs.append([record])
+    self.assertLess(len(runs), len(LINES))
+
+    results = []
+    for run in runs:
+      results.extend(t.transform_batch(RecordBatch.from_records(run)))
+    expected = [r for r in DAS_RECORD_RESULTS if r]
+    self.assertEqual(len(results), len(expected))
+    for result, expected_fields in zip(results, expected):
+      self.assertRecursiveAlmostEqual(result.fields, expected_fields)
+
+    # Plain lists of records go through transform() one at a time
+    self.assertEqual(t.transform_batch([]), [])
+
+  ############################
+  def test_sparse_record_batch(self):
+    """A batch built from records with differing fields should give the
+    same results as feeding the records in one at a time."""
+    def make_transform():
+      port_winds = TrueWindsTransform(course_field='S330CourseTrue',
+                                      speed_field='S330Speed',
+                                      heading_field='S330HeadingTrue',
+                                      wind_dir_field='MwxPortRelWindDir',
+                                      wind_speed_field='MwxPortRelWindSpeed',
+                                      true_dir_name='PortTrueWindDir',
+                                      true_speed_name='PortTrueWindSpeed',
+                                      apparent_dir_name='PortApparentWindDir',
+                                      convert_speed_factor=0.5144)
+      return ComposedDerivedDataTransform(
+        transforms=[RecipTransform(), port_winds])
+
+    parse = ParseNMEATransform()
+    records = [parse.transform(line) for line in LINES]
+    for record in records:
+      record.data_id = 'all'
+      record.message_type = ''
+    batch = RecordBatch.from_records(records)
+
+    t = make_transform()
+    expected = [r for r in map(t.transform, records) if r]
+    results = make_transform().transform_batch(batch)
+    self.assertEqual(len(results), len(expected))
+    for result, expected_record in zip(results, expected):
+      self.assertEqual(result.timestamp, expected_record.timestamp)
+      self.assertRecursiveAlmostEqual(result.fields, expected_record.fields)
+
   ############################
   def test_field_dict(self):
     parse = ParseNMEATransform()
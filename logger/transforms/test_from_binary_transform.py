@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import unittest
+
+sys.path.append('.')
+
+from logger.transforms.from_binary_transform import FromBinaryTransform
+from logger.transforms.to_binary_transform import ToBinaryTransform
+from logger.utils.das_record import DASRecord
+
+class TestFromBinaryTransform(unittest.TestCase):
+
+  def test_default(self):
+    record = DASRecord(data_id='gyr1', timestamp=1510265335,
+                       fields={'GYR_Heading': 314.15})
+    to_binary = ToBinaryTransform()
+    first = to_binary.transform(record)
+    second = to_binary.transform(record)
+
+    from_binary = FromBinaryTransform()
+    self.assertIsNone(from_binary.transform(None))
+    self.assertIsNone(from_binary.transform(b''))
+
+    # Second record refers to names defined in the first, so it can't
+    # be decoded without it.
+    with self.assertLogs(level=logging.WARNING):
+      self.assertIsNone(from_binary.transform(second))
+    self.assertEqual(from_binary.transform(first), record)
+    self.assertEqual(from_binary.transform(second), record)
+
+    with self.assertLogs(level=logging.WARNING):
+      self.assertIsNone(from_binary.transform(b'not a binary record'))
+
+if __name__ == '__main__':
+  unittest.main()
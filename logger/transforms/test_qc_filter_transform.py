@@ -9,6 +9,10 @@ sys.path.append('.')
 
 from logger.transforms.qc_filter_transform import QCFilterTransform
 from logger.transforms.parse_nmea_transform import ParseNMEATransform
+from logger.utils.das_record import DASRecord
+from logger.utils.nmea_parser import NMEAParser
+from logger.utils.qc import QC_RATE, QC_STUCK, QC_SPIKE, QC_GAP
+from logger.utils.record_batch import RecordBatch, typed_column
 
 LINES = """grv1 2017-11-04T05:12:21.018622Z 01:025876 00
 grv1 2017-11-04T05:12:21.273413Z 01:022013 00
@@ -66,6 +70,115 @@ class TestQCFilterTransform(unittest.TestCase):
     record = 'knud 2017-11-04T05:12:21.981359Z'
     self.assertEqual(q.transform(record), 'The sky is falling!')
     
+  ############################
+  def test_transform_batch(self):
+    q = QCFilterTransform(bounds='Grav1ValueMg:20000:25000,Grav1Error::2')
+    lines = LINES + ['grv1 2017-11-04T05:12:23.553121Z 01:023013 03']
+    batch = NMEAParser().parse_records(lines)[('grv1', '')]
+    self.assertEqual(batch.fields['Grav1ValueMg'].typecode, 'q')
+
+    # Should get the same messages as record by record
+    expected = [m for m in map(q.transform, batch.records()) if m]
+    self.assertEqual(len(expected), 6)
+    self.assertEqual(q.transform_batch(batch), expected)
+    self.assertEqual(q.transform_batch(batch.records()), expected)
+
+    # Non-numeric values get flagged; missing floats are skipped
+    batch = RecordBatch(data_id='knud', timestamps=[1, 2, 3],
+                        fields={'KnudLFDepth': [5146.29, 'bad', 7000],
+                                'KnudHFDepth': typed_column([None, 10.0, -1.0])})
+    q = QCFilterTransform(bounds='KnudLFDepth:0:6000,KnudHFDepth:0:5000')
+    records = batch.records()
+    del records[0].fields['KnudHFDepth']
+    expected = [m for m in map(q.transform, records) if m]
+    self.assertEqual(expected[0], 'KnudLFDepth: non-numeric value: "bad"')
+    self.assertEqual(q.transform_batch(batch), expected)
+
+    q = QCFilterTransform(bounds='KnudLFDepth:0:6000', message='Uh oh')
+    self.assertEqual(q.transform_batch(batch), ['Uh oh', 'Uh oh'])
+
+  ############################
+  def test_sparse_batch(self):
+    # A batch of records that don't all have the same fields gets the
+    # same results as the records themselves.
+    def make_records():
+      return [DASRecord(data_id='x', timestamp=t, fields=fields)
+              for t, fields in enumerate([{'a': 1.0}, {'b': 2.0}, {'a': 1.0},
+                                          {'b': 3.0}, {'a': 20.0}])]
+    def make_qc():
+      return QCFilterTransform(bounds='a:0:10', rate='a:5')
+
+    q = make_qc()
+    expected = [m for m in map(q.transform, make_records()) if m]
+    self.assertEqual(expected, ['a: 20 > upper bound 10; '
+                                'a: 20 changing faster than 5 per second'])
+    batch = RecordBatch.from_records(make_records())
+    self.assertEqual(make_qc().transform_batch(batch), expected)
+
+    q = QCFilterTransform(bounds='a:0:10')
+    batch = RecordBatch.from_records(make_records()[:3])
+    self.assertEqual(q.transform_batch(batch), [])
+
+    # Likewise gaps in int and str fields, which make list columns
+    def make_records():
+      return [DASRecord(data_id='x', timestamp=t, fields=fields)
+              for t, fields in enumerate([{'x': 1, 'y': 5, 's': 'abc'},
+                                          {'y': 6},
+                                          {'x': 20, 's': 'def'},
+                                          {'y': 6, 's': 'ghi'}])]
+    def make_qc():
+      return QCFilterTransform(bounds='x:0:10,y:0:10,s:0:1', stuck='y:2')
+
+    q = make_qc()
+    expected = [m for m in map(q.transform, make_records()) if m]
+    self.assertEqual(len(expected), 3)
+    batch = RecordBatch.from_records(make_records())
+    self.assertIs(type(batch.fields['x']), list)
+    self.assertEqual(make_qc().transform_batch(batch), expected)
+
+  ############################
+  def test_history(self):
+    def make_qc():
+      return QCFilterTransform(rate='Grav1ValueMg:10000',
+                               stuck='Grav1Error:3',
+                               spike='Grav1ValueMg:4000:3', max_gap=0.3)
+    lines = LINES + ['grv1 2017-11-04T05:12:23.553121Z 01:019470 00',
+                     'grv1 2017-11-04T05:12:24.553121Z 01:028000 00']
+    batch = NMEAParser().parse_records(lines)[('grv1', '')]
+
+    q = make_qc()
+    records = batch.records()
+    messages = [q.transform(record) for record in records]
+    self.assertEqual(messages[:2], [None, 'Grav1ValueMg: 22013 changing '
+                                    'faster than 10000 per second'])
+    self.assertEqual(messages[2], 'Grav1Error: 0 unchanged for 3 or more '
+                     'records')
+    self.assertEqual(messages[-1], '; '.join([
+      'timestamp: more than 0.3 seconds since previous record',
+      'Grav1ValueMg: 28000 spikes more than 4000 from recent median',
+      'Grav1Error: 0 unchanged for 3 or more records']))
+
+    # Flags of failing fields are attached to the record
+    self.assertNotIn('qc_flags', records[0].metadata)
+    self.assertEqual(records[1].metadata['qc_flags'], {'Grav1ValueMg': QC_RATE})
+    self.assertEqual(records[-1].metadata['qc_flags'],
+                     {'timestamp': QC_GAP, 'Grav1ValueMg': QC_SPIKE,
+                      'Grav1Error': QC_STUCK})
+
+    # Same as a batch, with flags attached to the batch
+    self.assertEqual(make_qc().transform_batch(batch),
+                     [m for m in messages if m])
+    self.assertEqual([r.metadata.get('qc_flags') for r in batch.records()],
+                     [r.metadata.get('qc_flags') for r in records])
+    self.assertEqual(RecordBatch.from_records(records), batch)
+
+    with self.assertRaises(ValueError):
+      QCFilterTransform(spike='Grav1ValueMg')
+    with self.assertRaises(ValueError):
+      QCFilterTransform(stuck='Grav1ValueMg:1')
+    with self.assertRaises(ValueError):
+      QCFilterTransform(rate='Grav1ValueMg:')
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
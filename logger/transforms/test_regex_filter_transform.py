@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import logging
+import re
 import sys
 import unittest
 import warnings
@@ -32,6 +34,67 @@ class TestRegexFilterTransform(unittest.TestCase):
     #transform = RegexFilterTransform('RegexFilter', sep='\t')
     #self.assertEqual(transform.transform('foo'), 'prefix\tfoo')
 
+  ############################
+  def test_literal_patterns(self):
+    records = ['gyr1 2017-11-04T05:12:19.441672Z $HEHDT,235.95,T*14',
+               'gyr10 2017-11-04T05:12:19.5Z $HEHDT,235.95,T*14',
+               'gyr1', 'knud 3.5kHz', 's330 $GPZDA', 'a|b c', 'x.y z',
+               'seap\t$GPGGA', 'foo bar', ' gyr1 ', '']
+    for pattern in ['^gyr1', '^gyr1 ', '^gyr1|^knud', '^(gyr1|knud) ',
+                    '^(?:gyr1|knud|s330|seap|foo|x\\.y) ', '^a\\|b',
+                    '^x\\.y', '^x.y', 'HDT', '^(gyr1)?', '^\\w+ \\$',
+                    '^s330 |^gyr1 ']:
+      regex = re.compile(pattern)
+      for negate in [False, True]:
+        transform = RegexFilterTransform(pattern, negate=negate)
+        expected = [r for r in records
+                    if r and bool(regex.search(r)) != negate]
+        self.assertEqual(expected,
+                         [r for r in records if transform.transform(r)],
+                         pattern)
+        self.assertEqual(expected, transform.transform_batch(records))
+
+    # Literal patterns skip the regex engine
+    transform = RegexFilterTransform('^(gyr1|knud) ')
+    self.assertEqual(('gyr1 ', 'knud '), transform.prefixes)
+    self.assertEqual([], transform.regexes)
+    transform = RegexFilterTransform('^x.y')
+    self.assertEqual((), transform.prefixes)
+    self.assertEqual(1, len(transform.regexes))
+
+    # Flags other than the default need the regex engine
+    transform = RegexFilterTransform('^GYR1', flags=re.IGNORECASE)
+    self.assertEqual('gyr1 x', transform.transform('gyr1 x'))
+
+  ############################
+  def test_multiple_patterns(self):
+    data_ids = ['gyr1', 'knud', 's330', 'seap', 'grv1', 'mwx1'] + \
+               ['inst%d' % i for i in range(20)]
+    transform = RegexFilterTransform(['^%s ' % d for d in data_ids])
+    self.assertEqual(set(data_ids), transform.first_tokens)
+    records = ['%s record' % d for d in data_ids + ['gyr10', 'wxt1']]
+    self.assertEqual(records[:-2], transform.transform_batch(records))
+    self.assertIsNone(transform.transform('gyr1'))
+    self.assertIsNone(transform.transform('gyr1\trecord'))
+
+    # Batches take the same first-token shortcut, and agree with
+    # record-by-record filtering, records without a space included.
+    self.assertTrue(transform._use_token_set)
+    records += ['gyr1', 'gyr1\trecord', '', None, 'knud  two spaces']
+    for negate in [False, True]:
+      transform = RegexFilterTransform(['^%s ' % d for d in data_ids],
+                                       negate=negate)
+      self.assertEqual([r for r in records if transform.transform(r)],
+                       transform.transform_batch(records))
+    self.assertEqual(['gyr10 record', 'wxt1 record', 'gyr1', 'gyr1\trecord'],
+                     transform.transform_batch(records))
+
+    # Mixed literal and regex patterns
+    transform = RegexFilterTransform(['^gyr1 ', 'HDT', '^\\d'], negate=True)
+    self.assertEqual(['knud 3.5kHz'],
+                     transform.transform_batch(['gyr1 x', 'knud 3.5kHz',
+                                                'x $HEHDT', '9foo']))
+
 if __name__ == '__main__':
   import argparse
   parser = argparse.ArgumentParser()
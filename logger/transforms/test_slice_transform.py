@@ -42,6 +42,41 @@ class TestSliceTransform(unittest.TestCase):
     transform = SliceTransform('')
     self.assertEqual(transform.transform(alpha), alpha)
 
+  ############################
+  def test_simple_specs(self):
+    # Specs with a fast path, with and without a separator, on records
+    # that do and don't need whitespace normalized.
+    for (spec, sep, record, expected) in [
+        ('1:', None, '2017-11-04T05:12:19Z $HEHDT,235.95,T*14',
+         '$HEHDT,235.95,T*14'),
+        ('1:', None, '2017-11-04T05:12:19Z  $HEHDT\t235.95 ', '$HEHDT 235.95'),
+        ('1:', None, 'lonely', ''),
+        ('2:', ',', 'a,b,,c', ',c'),
+        (':2', None, 'a b c', 'a b'),
+        (':2', None, ' a\tb   c', 'a b'),
+        (':2', '::', 'a::b::c', 'a::b'),
+        (':5', ',', 'a,b', 'a,b'),
+        ('0', None, 'a b c', 'a'),
+        ('2', ',', 'a,b,c,d', 'c'),
+        ('-2', ',', 'a,b,c,d', 'c'),
+        ('-1', None, 'a b  c ', 'c'),
+        (':', None, 'a  b c', 'a b c'),
+        (':', ',', 'a,,b', 'a,,b')]:
+      transform = SliceTransform(spec, sep=sep)
+      self.assertIsNotNone(transform.simple_slice)
+      self.assertEqual(expected, transform.transform(record),
+                       '%s %s' % (spec, sep))
+
+    transform = SliceTransform('5')
+    with self.assertRaises(IndexError):
+      transform.transform('a b c')
+    with self.assertRaises(IndexError):
+      transform.transform('')
+
+    # Anything else takes the general path
+    self.assertIsNone(SliceTransform('1:3').simple_slice)
+    self.assertIsNone(SliceTransform('0,2').simple_slice)
+
     
 ################################################################################
 if __name__ == '__main__':
@@ -36,5 +36,14 @@ class TestTimestampTransform(unittest.TestCase):
     self.assertEqual(result.split()[0], today)
     self.assertEqual(result.split()[1], 'blah')
 
+  def test_cache_time_str(self):
+    for cache_time_str in [True, False]:
+      transform = TimestampTransform(cache_time_str=cache_time_str)
+      results = [transform.transform('blah %d' % i) for i in range(100)]
+      times = [timestamp.timestamp(r.split()[0]) for r in results]
+      self.assertEqual(times, sorted(times))
+      self.assertAlmostEqual(times[-1], timestamp.timestamp(), places=1)
+      self.assertEqual(results[-1].split()[1:], ['blah', '99'])
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import sys
+import unittest
+
+sys.path.append('.')
+
+from logger.transforms.from_binary_transform import FromBinaryTransform
+from logger.transforms.parse_nmea_transform import ParseNMEATransform
+from logger.transforms.to_binary_transform import ToBinaryTransform
+from logger.utils import formats
+
+LINES = """gyr1 2017-11-10T01:00:07.737Z $HEROT,0002.9,A*10
+grv1 2017-11-10T01:00:08.572Z 01:024303 00
+seap 2017-11-04T07:00:33.174207Z $GPGGA,002706.69,3938.138360,S,03732.638933,W,1,09,1.0,-4.90,M,,M,,*66
+gyr1 2017-11-10T01:00:08.737Z $HEROT,0003.1,A*11""".split('\n')
+
+class TestToBinaryTransform(unittest.TestCase):
+
+  def test_round_trip(self):
+    parse = ParseNMEATransform()
+    to_binary = ToBinaryTransform()
+    from_binary = FromBinaryTransform()
+
+    self.assertTrue(to_binary.output_format().can_accept(
+      from_binary.input_format()))
+    self.assertIsNone(to_binary.transform(None))
+
+    for line in LINES:
+      record = parse.transform(line)
+      encoded = to_binary.transform(record)
+      self.assertEqual(to_binary.output_format(), formats.Binary_Record)
+      self.assertLess(len(encoded), len(record.as_json()))
+      self.assertEqual(from_binary.transform(encoded), record)
+
+  def test_json(self):
+    parse = ParseNMEATransform(json=True)
+    to_binary = ToBinaryTransform(reset_interval=1)
+    from_binary = FromBinaryTransform(json=True)
+    for line in LINES:
+      record = parse.transform(line)
+      self.assertEqual(from_binary.transform(to_binary.transform(record)),
+                       record)
+
+if __name__ == '__main__':
+  unittest.main()
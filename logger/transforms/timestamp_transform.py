@@ -10,14 +10,25 @@ from logger.transforms.transform import Transform
 ################################################################################
 """Prepend a timestamp to a text record."""
 class TimestampTransform(Transform):
-  def __init__(self, time_format=timestamp.TIME_FORMAT):
-    """If timestamp_format is not specified, use default format"""
+  def __init__(self, time_format=timestamp.TIME_FORMAT, cache_time_str=True):
+    """If timestamp_format is not specified, use default format.
+
+    cache_time_str  If True (default), use a TimeFormatter of our own that
+                    only re-renders the microseconds of timestamps that
+                    fall in the same second as the previous record. If
+                    False, format each timestamp from scratch.
+    """
     super().__init__(input_format=formats.Text, output_format=formats.Text)
     self.time_format = time_format
+    self.formatter = None
+    if cache_time_str:
+      self.formatter = timestamp.TimeFormatter(time_format=time_format)
 
   ############################
   def transform(self, record):
     """Prepend a timestamp"""
     if record is None:
       return None
-    return timestamp.time_str(time_format=self.time_format) + ' ' + record
+    if self.formatter:
+      return self.formatter.time_str() + ' ' + record
+    return timestamp.datetime_obj().strftime(self.time_format) + ' ' + record
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import sys
+sys.path.append('.')
+
+from logger.utils import formats
+from logger.utils.binary_record import BinaryRecordEncoder
+from logger.utils.binary_record import DEFAULT_RESET_INTERVAL
+from logger.utils.das_record import DASRecord
+from logger.transforms.transform import Transform
+
+################################################################################
+class ToBinaryTransform(Transform):
+  """Convert a DASRecord (or its JSON encoding) to the compact binary
+  encoding defined in logger/utils/binary_record.py."""
+  def __init__(self, reset_interval=DEFAULT_RESET_INTERVAL):
+    """
+    reset_interval
+            Re-send interned field names every this many records, so
+            that a receiver that misses a record can recover. Set to
+            1 to make every record self-contained.
+    """
+    super().__init__(input_format=formats.Python_Record,
+                     output_format=formats.Binary_Record)
+    self.encoder = BinaryRecordEncoder(reset_interval=reset_interval)
+
+  ############################
+  def transform(self, record):
+    """Encode record."""
+    if record is None:
+      return None
+    if type(record) is str:
+      record = DASRecord.from_json(record)
+    return self.encoder.encode(record)
@@ -46,3 +46,18 @@ class Transform:
     raise NotImplementedError('Class %s (subclass of Transform) is missing '
                               'implementation of transform() method.'
                               % self.__class__.__name__)
+
+  ############################
+  def transform_batch(self, records):
+    """Transform a batch of records - a list of records or a
+    RecordBatch - and return a list of the non-None results, in order.
+
+    By default this just calls transform() on each record in turn;
+    transforms that can do better by working a column at a time
+    should override it."""
+    results = []
+    for record in records:
+      result = self.transform(record)
+      if result is not None:
+        results.append(result)
+    return results
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""Compact binary encoding of DASRecords, for shipping parsed records
+between processes and hosts without the overhead of JSON.
+
+Each encoded record is a self-delimiting byte string:
+
+  header   struct '<BBI': MAGIC, VERSION, length of body in bytes
+  body     table_id (uint32), then typed values for timestamp,
+           data_id, message_type, fields and metadata
+
+Values are tagged with a single type byte (None, True, False, int,
+float, str, name, list, dict). Ints are zigzag varints, floats are
+8-byte doubles and strs are varint-length-prefixed UTF-8.
+
+Strings that repeat from record to record - data_ids, message types
+and dict keys such as field names - are interned as 'names'. The
+first time an encoder uses a name it sends the name along with the
+index it has assigned it; after that, it sends only the index. Every
+reset_interval records the encoder starts a fresh name table under a
+new random table_id, re-sending the names it needs. This bounds the
+damage if a record carrying a name definition is lost on the way (as
+UDP packets may be): the decoder will be unable to decode records
+that refer to the missing name until the next reset, but will never
+misattribute a value to the wrong name.
+
+A reset_interval of 1 makes every record self-contained.
+"""
+import random
+import struct
+import sys
+import threading
+
+sys.path.append('.')
+
+from logger.utils.das_record import DASRecord
+
+MAGIC = 0xDA
+VERSION = 1
+
+HEADER = struct.Struct('<BBI')  # magic, version, body length
+TABLE_ID = struct.Struct('<I')
+FLOAT = struct.Struct('<d')
+
+DEFAULT_RESET_INTERVAL = 100
+
+# Decoders remember name tables for this many encoders at once
+DEFAULT_MAX_TABLES = 16
+
+# Value type tags
+NONE_TAG = 0
+TRUE_TAG = 1
+FALSE_TAG = 2
+INT_TAG = 3
+FLOAT_TAG = 4
+STR_TAG = 5
+NAME_TAG = 6
+LIST_TAG = 7
+DICT_TAG = 8
+
+################################################################################
+def _pack_varint(value, out):
+  """Append non-negative int value to bytearray out as a varint."""
+  while value > 0x7f:
+    out.append((value & 0x7f) | 0x80)
+    value >>= 7
+  out.append(value)
+
+################################################################################
+def _unpack_varint(data, pos):
+  """Return (value, new_pos) for the varint starting at data[pos]."""
+  byte = data[pos]
+  pos += 1
+  if byte < 0x80:
+    return (byte, pos)
+  value = byte & 0x7f
+  shift = 7
+  while True:
+    byte = data[pos]
+    pos += 1
+    value |= (byte & 0x7f) << shift
+    if byte < 0x80:
+      return (value, pos)
+    shift += 7
+
+################################################################################
+def record_length(data):
+  """Return the total encoded length of the record at the start of
+  data, or None if data is too short to contain a header. Useful for
+  pulling records out of a byte stream."""
+  if len(data) < HEADER.size:
+    return None
+  (magic, version, body_length) = HEADER.unpack_from(data)
+  if magic != MAGIC:
+    raise ValueError('Bad binary record magic number: 0x%02x' % magic)
+  return HEADER.size + body_length
+
+################################################################################
+class BinaryRecordEncoder:
+  """Encode DASRecords as bytes. An encoder carries the name table for
+  the stream it is producing, so use one encoder per stream."""
+  ############################
+  def __init__(self, reset_interval=DEFAULT_RESET_INTERVAL):
+    """
+    reset_interval  Start a new name table every this many records.
+                    If zero, never start a new table.
+    """
+    self.reset_interval = reset_interval
+    self.lock = threading.Lock()
+    self._reset()
+
+  ############################
+  def _reset(self):
+    """Start a new name table."""
+    self.table_id = random.getrandbits(32)
+    self.names = {}
+    self.records_since_reset = 0
+
+  ############################
+  def encode(self, record):
+    """Return the bytes encoding DASRecord record."""
+    with self.lock:
+      if self.reset_interval and self.records_since_reset >= self.reset_interval:
+        self._reset()
+      self.records_since_reset += 1
+
+      body = bytearray(TABLE_ID.pack(self.table_id))
+      try:
+        self._pack_value(record.timestamp, body)
+        self._pack_name_value(record.data_id, body)
+        self._pack_name_value(record.message_type, body)
+        self._pack_value(record.fields, body)
+        self._pack_value(record.metadata, body)
+      except Exception:
+        # Whatever went wrong (an unencodable type, a name that isn't
+        # valid UTF-8...), we may have assigned names that will now
+        # never be sent
+        self._reset()
+        raise
+    return HEADER.pack(MAGIC, VERSION, len(body)) + body
+
+  ############################
+  def _pack_name(self, name, out):
+    """Append a reference to name, defining it if it's new to this table."""
+    index = self.names.get(name)
+    if index is not None:
+      _pack_varint(index << 1, out)
+      return
+    index = len(self.names)
+    self.names[name] = index
+    _pack_varint((index << 1) | 1, out)
+    encoded = name.encode('utf-8')
+    _pack_varint(len(encoded), out)
+    out += encoded
+
+  ############################
+  def _pack_name_value(self, value, out):
+    """Append value, interning it if it's a string."""
+    if type(value) is str:
+      out.append(NAME_TAG)
+      self._pack_name(value, out)
+    else:
+      self._pack_value(value, out)
+
+  ############################
+  def _pack_value(self, value, out):
+    """Append a typed value."""
+    value_type = type(value)
+    if value_type is float:
+      out.append(FLOAT_TAG)
+      out += FLOAT.pack(value)
+    elif value_type is str:
+      encoded = value.encode('utf-8')
+      out.append(STR_TAG)
+      _pack_varint(len(encoded), out)
+      out += encoded
+    elif value_type is int:
+      out.append(INT_TAG)
+      _pack_varint(value << 1 if value >= 0 else ((-value) << 1) - 1, out)
+    elif value is None:
+      out.append(NONE_TAG)
+    elif value is True:
+      out.append(TRUE_TAG)
+    elif value is False:
+      out.append(FALSE_TAG)
+    elif isinstance(value, dict):
+      out.append(DICT_TAG)
+      _pack_varint(len(value), out)
+      for key, item in value.items():
+        self._pack_name_value(key, out)
+        self._pack_value(item, out)
+    elif isinstance(value, (list, tuple)):
+      out.append(LIST_TAG)
+      _pack_varint(len(value), out)
+      for item in value:
+        self._pack_value(item, out)
+    elif isinstance(value, int):
+      self._pack_value(int(value), out)
+    elif isinstance(value, float):
+      self._pack_value(float(value), out)
+    else:
+      raise TypeError('Object of type %s can not be binary encoded'
+                      % value_type.__name__)
+
+################################################################################
+class BinaryRecordDecoder:
+  """Decode bytes produced by a BinaryRecordEncoder back into DASRecords.
+  A decoder may be fed records from several encoders at once."""
+  ############################
+  def __init__(self, max_tables=DEFAULT_MAX_TABLES):
+    """
+    max_tables  Number of name tables to remember. When a new table
+                shows up and we already have this many, forget the
+                least recently created one.
+    """
+    self.max_tables = max_tables
+    self.tables = {}
+    self.lock = threading.Lock()
+
+  ############################
+  def decode(self, data):
+    """Return the DASRecord encoded in data. Raise ValueError if data
+    isn't a complete binary record, or refers to names we haven't seen
+    defined."""
+    length = record_length(data)
+    if length is None or len(data) != length:
+      raise ValueError('Binary record length mismatch: expected %s, got %d '
+                       'bytes' % (length, len(data)))
+    version = data[1]
+    if version != VERSION:
+      raise ValueError('Unsupported binary record version: %d' % version)
+
+    pos = HEADER.size
+    (table_id,) = TABLE_ID.unpack_from(data, pos)
+    pos += TABLE_ID.size
+
+    with self.lock:
+      table = self.tables.get(table_id)
+      if table is None:
+        if len(self.tables) >= self.max_tables:
+          del self.tables[next(iter(self.tables))]
+        table = self.tables[table_id] = {}
+      try:
+        record = DASRecord.__new__(DASRecord)
+        (record.timestamp, pos) = self._unpack_value(data, pos, table)
+        (record.data_id, pos) = self._unpack_value(data, pos, table)
+        (record.message_type, pos) = self._unpack_value(data, pos, table)
+        (record.fields, pos) = self._unpack_value(data, pos, table)
+        (record.metadata, pos) = self._unpack_value(data, pos, table)
+      except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError('Malformed binary record: %s' % e)
+    if pos != length:
+      raise ValueError('Malformed binary record: %d trailing bytes'
+                       % (length - pos))
+    return record
+
+  ############################
+  def _unpack_name(self, data, pos, table):
+    """Return (name, new_pos) for the name reference at data[pos],
+    recording the name in table if this is its definition."""
+    (ref, pos) = _unpack_varint(data, pos)
+    index = ref >> 1
+    if ref & 1:
+      (length, pos) = _unpack_varint(data, pos)
+      end = pos + length
+      if end > len(data):
+        raise IndexError('name runs past end of record')
+      name = bytes(data[pos:end]).decode('utf-8')
+      table[index] = name
+      return (name, end)
+    name = table.get(index)
+    if name is None:
+      raise ValueError('Binary record refers to unknown name index %d' % index)
+    return (name, pos)
+
+  ############################
+  def _unpack_value(self, data, pos, table):
+    """Return (value, new_pos) for the typed value at data[pos]."""
+    tag = data[pos]
+    pos += 1
+    if tag == FLOAT_TAG:
+      return (FLOAT.unpack_from(data, pos)[0], pos + FLOAT.size)
+    if tag == NAME_TAG:
+      return self._unpack_name(data, pos, table)
+    if tag == INT_TAG:
+      (zigzag, pos) = _unpack_varint(data, pos)
+      return ((zigzag >> 1) if not zigzag & 1 else -((zigzag + 1) >> 1), pos)
+    if tag == STR_TAG:
+      (length, pos) = _unpack_varint(data, pos)
+      end = pos + length
+      if end > len(data):
+        raise IndexError('string runs past end of record')
+      return (bytes(data[pos:end]).decode('utf-8'), end)
+    if tag == NONE_TAG:
+      return (None, pos)
+    if tag == TRUE_TAG:
+      return (True, pos)
+    if tag == FALSE_TAG:
+      return (False, pos)
+    if tag == DICT_TAG:
+      (count, pos) = _unpack_varint(data, pos)
+      result = {}
+      for i in range(count):
+        # Inline the common case of a previously-defined name key
+        # and float value; fields dicts are mostly made of them.
+        if data[pos] == NAME_TAG and not data[pos + 1] & 0x81:
+          key = table.get(data[pos + 1] >> 1)
+          if key is None:
+            raise ValueError('Binary record refers to unknown name index %d'
+                             % (data[pos + 1] >> 1))
+          pos += 2
+        else:
+          (key, pos) = self._unpack_value(data, pos, table)
+        if data[pos] == FLOAT_TAG:
+          result[key] = FLOAT.unpack_from(data, pos + 1)[0]
+          pos += 1 + FLOAT.size
+        else:
+          (result[key], pos) = self._unpack_value(data, pos, table)
+      return (result, pos)
+    if tag == LIST_TAG:
+      (count, pos) = _unpack_varint(data, pos)
+      result = []
+      for i in range(count):
+        (item, pos) = self._unpack_value(data, pos, table)
+        result.append(item)
+      return (result, pos)
+    raise ValueError('Unknown binary record value tag: %d' % tag)
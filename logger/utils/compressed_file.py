@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Reading and writing compressed logfiles.
+
+Closed logfiles are compressed into 'block gzip' files: a series of
+independent gzip members, each holding at most BLOCK_SIZE bytes of
+text and recording its own compressed size in a 'BC' extra field (the
+layout used by BGZF, as in samtools/htslib). A block gzip file is a
+valid gzip file - gunzip, zcat and Python's gzip module read it as
+usual - but because each block can be found from the header of the one
+before and decompressed on its own, a BlockGzipReader can seek to any
+uncompressed offset by decompressing a single block.
+
+open_file() opens plain files, block gzip files and ordinary gzip
+files alike, so that readers needn't care which they've been given.
+Ordinary gzip files can be read, but seeking in them means
+decompressing everything before the seek target.
+"""
+import gzip
+import io
+import logging
+import os
+import shutil
+import struct
+import sys
+import zlib
+
+from array import array
+from bisect import bisect_right
+
+sys.path.append('.')
+
+COMPRESSED_SUFFIX = '.gz'
+
+# Uncompressed bytes per block; as in BGZF, small enough that a block
+# always compresses to less than 64K.
+BLOCK_SIZE = 0xff00
+
+DEFAULT_COMPRESSLEVEL = 6
+
+# Block header: gzip magic, CM=deflate, FLG=FEXTRA, MTIME, XFL, OS,
+# XLEN=6, then subfield 'BC' of length 2 holding the block size - 1.
+BLOCK_HEADER = struct.Struct('<4sIBBH2sHH')
+BLOCK_MAGIC = b'\x1f\x8b\x08\x04'
+BLOCK_TRAILER = struct.Struct('<II')  # CRC32, uncompressed size
+
+################################################################################
+def is_compressed(filename):
+  """Does filename name a compressed file?"""
+  return filename.endswith(COMPRESSED_SUFFIX)
+
+################################################################################
+def uncompressed_name(filename):
+  """Filename with any compression suffix removed."""
+  if is_compressed(filename):
+    return filename[:-len(COMPRESSED_SUFFIX)]
+  return filename
+
+################################################################################
+def _compress_block(data, compresslevel):
+  """Return data as a single block gzip member."""
+  compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+  deflated = compressor.compress(data) + compressor.flush()
+  block_size = BLOCK_HEADER.size + len(deflated) + BLOCK_TRAILER.size
+  return b''.join([
+    BLOCK_HEADER.pack(BLOCK_MAGIC, 0, 0, 0xff, 6, b'BC', 2, block_size - 1),
+    deflated,
+    BLOCK_TRAILER.pack(zlib.crc32(data), len(data))])
+
+################################################################################
+def compress_file(filename, compresslevel=DEFAULT_COMPRESSLEVEL, remove=True):
+  """Compress filename into a block gzip file of the same name plus
+  COMPRESSED_SUFFIX, and return the new name. If the compressed file
+  already exists, append to it. If remove is True, delete the original
+  once it's been compressed.
+
+  We write to a hidden temporary file - when appending, a copy of the
+  existing compressed file - and then rename it into place, so readers
+  never see a partially-written file, and a crash part way through
+  leaves the compressed file as it was. Until the original is removed,
+  both it and the compressed file exist, with the same contents;
+  readers should only read one of them (see matching_files() in
+  logger/readers/text_file_reader.py).
+  """
+  compressed_filename = filename + COMPRESSED_SUFFIX
+  (dirname, basename) = os.path.split(compressed_filename)
+  tmp_filename = os.path.join(dirname, '.%s.%d.tmp' % (basename, os.getpid()))
+  try:
+    try:
+      shutil.copyfile(compressed_filename, tmp_filename)
+    except FileNotFoundError:
+      pass
+    with open(filename, 'rb') as in_file, \
+         open(tmp_filename, 'ab') as out_file:
+      while True:
+        data = in_file.read(BLOCK_SIZE)
+        if not data:
+          break
+        out_file.write(_compress_block(data, compresslevel))
+    os.replace(tmp_filename, compressed_filename)
+  except:
+    if os.path.exists(tmp_filename):
+      os.remove(tmp_filename)
+    raise
+  if remove:
+    os.remove(filename)
+  return compressed_filename
+
+################################################################################
+def _block_size(header):
+  """Total size of the block gzip member whose header begins header, or
+  None if it isn't a block gzip member."""
+  if len(header) < 12 or header[:4] != BLOCK_MAGIC:
+    return None
+  (xlen,) = struct.unpack_from('<H', header, 10)
+  pos = 12
+  end = min(12 + xlen, len(header))
+  while pos + 4 <= end:
+    (subfield_id, subfield_len) = struct.unpack_from('<2sH', header, pos)
+    if subfield_id == b'BC' and subfield_len == 2 and pos + 6 <= end:
+      return struct.unpack_from('<H', header, pos + 4)[0] + 1
+    pos += 4 + subfield_len
+  return None
+
+################################################################################
+def is_block_gzip(filename):
+  """Does filename begin with a block gzip member?"""
+  with open(filename, 'rb') as f:
+    return _block_size(f.read(64)) is not None
+
+################################################################################
+class BlockGzipReader(io.RawIOBase):
+  """Seekable, read-only binary file over the uncompressed contents of
+  a block gzip file. Offsets are offsets into the uncompressed data."""
+  ############################
+  def __init__(self, filename):
+    super().__init__()
+    self.name = filename
+    self.file = open(filename, 'rb')
+    self.pos = 0
+    self._block = None  # (index, uncompressed data) of last block read
+    try:
+      self._index_blocks()
+    except:
+      self.file.close()
+      raise
+
+  ############################
+  def _index_blocks(self):
+    """Find the compressed and uncompressed start of each block by
+    reading the header and trailer of each; no decompression needed."""
+    self.block_offsets = array('q')  # where each block starts in the file
+    self.block_starts = array('q')   # uncompressed offset of each block
+    file_size = os.fstat(self.file.fileno()).st_size
+    offset = 0
+    uncompressed = 0
+    while offset < file_size:
+      self.file.seek(offset)
+      block_size = _block_size(self.file.read(64))
+      if block_size is None or offset + block_size > file_size:
+        raise ValueError('%s: not a block gzip file (bad block at offset %d)'
+                         % (self.name, offset))
+      self.file.seek(offset + block_size - 4)
+      (isize,) = struct.unpack('<I', self.file.read(4))
+      self.block_offsets.append(offset)
+      self.block_starts.append(uncompressed)
+      offset += block_size
+      uncompressed += isize
+    self.block_offsets.append(offset)
+    self.block_starts.append(uncompressed)
+    self.size = uncompressed
+
+  ############################
+  def _read_block(self, index):
+    """Return the uncompressed contents of block number index."""
+    if self._block and self._block[0] == index:
+      return self._block[1]
+    start = self.block_offsets[index]
+    self.file.seek(start)
+    member = self.file.read(self.block_offsets[index + 1] - start)
+    (xlen,) = struct.unpack_from('<H', member, 10)
+    data = zlib.decompress(member[12 + xlen:-BLOCK_TRAILER.size],
+                           -zlib.MAX_WBITS)
+    self._block = (index, data)
+    return data
+
+  ############################
+  def readable(self):
+    return True
+
+  ############################
+  def seekable(self):
+    return True
+
+  ############################
+  def fileno(self):
+    return self.file.fileno()
+
+  ############################
+  def tell(self):
+    return self.pos
+
+  ############################
+  def seek(self, offset, whence=io.SEEK_SET):
+    if whence == io.SEEK_CUR:
+      offset += self.pos
+    elif whence == io.SEEK_END:
+      offset += self.size
+    elif whence != io.SEEK_SET:
+      raise ValueError('Invalid whence: %s' % whence)
+    if offset < 0:
+      raise ValueError('Negative seek position %d' % offset)
+    self.pos = offset
+    return self.pos
+
+  ############################
+  def readinto(self, buffer):
+    """Fill as much of buffer as we can, crossing blocks if need be."""
+    filled = 0
+    while filled < len(buffer) and self.pos < self.size:
+      index = bisect_right(self.block_starts, self.pos) - 1
+      data = self._read_block(index)
+      start = self.pos - self.block_starts[index]
+      chunk = data[start:start + len(buffer) - filled]
+      buffer[filled:filled + len(chunk)] = chunk
+      filled += len(chunk)
+      self.pos += len(chunk)
+    return filled
+
+  ############################
+  def close(self):
+    if not self.closed:
+      self.file.close()
+    super().close()
+
+################################################################################
+def open_file(filename, mode='r'):
+  """Open filename for reading in mode 'r' or 'rb', decompressing it on
+  the fly if it's compressed."""
+  if mode not in ('r', 'rb'):
+    raise ValueError('open_file() mode must be "r" or "rb"; got "%s"' % mode)
+  if not is_compressed(filename):
+    return open(filename, mode)
+
+  if is_block_gzip(filename):
+    binary = io.BufferedReader(BlockGzipReader(filename))
+  else:
+    logging.debug('%s is not block compressed; seeking in it will be slow',
+                  filename)
+    binary = gzip.open(filename, 'rb')
+  if mode == 'rb':
+    return binary
+  return io.TextIOWrapper(binary)
+
+################################################################################
+def data_size(f):
+  """Size of the (uncompressed) data in a file opened by open_file()."""
+  try:
+    return f.seek(0, io.SEEK_END)
+  except (ValueError, io.UnsupportedOperation):
+    # An ordinary gzip file can't seek from the end; read our way there.
+    f.seek(0)
+    size = 0
+    while True:
+      data = f.read(BLOCK_SIZE)
+      if not data:
+        return size
+      size += len(data)
@@ -1,16 +1,42 @@
 #!/usr/bin/env python3
 
 import json
+import math
 import pprint
 
+from json.encoder import encode_basestring_ascii
+
 from logger.utils.read_json import parse_json
 from logger.utils.timestamp import timestamp as timestamp_method
 
+# Same encoding as json.dumps() with default arguments, minus the
+# per-call argument handling.
+_json_encode = json.JSONEncoder().encode
+
+JSON_TEMPLATE = ('{"data_id": %s, "message_type": %s, "timestamp": %s, '
+                 '"fields": %s, "metadata": %s}')
+
+################################################################################
+def _json_value(value):
+  """Encode value as json.dumps() would, taking shortcuts for common types."""
+  value_type = type(value)
+  if value_type is str:
+    return encode_basestring_ascii(value)
+  if value_type is float and math.isfinite(value):
+    return float.__repr__(value)
+  if value_type is dict and not value:
+    return '{}'
+  return _json_encode(value)
+
 ################################################################################
 class DASRecord:
   """DASRecord is a structured representation of the field names and
   values (and metadata) contained in a sensor record.
   """
+  # Records are created for every line we parse, so skip the
+  # per-instance __dict__.
+  __slots__ = ('data_id', 'message_type', 'timestamp', 'fields', 'metadata')
+
   ############################
   def __init__(self, json=None, data_id=None, message_type=None,
                timestamp=0, fields=None, metadata=None):
@@ -44,17 +70,29 @@ class DASRecord:
       else:
         self.metadata = metadata
 
+  ############################
+  @classmethod
+  def from_json(cls, json_str):
+    """Create a DASRecord from a JSON string such as one produced by
+    as_json(). Unlike DASRecord(json=...), don't look for comments to
+    strip, as machine-generated records won't have any."""
+    parsed = json.loads(json_str)
+    record = cls.__new__(cls)
+    record.data_id = parsed.get('data_id', None)
+    record.message_type = parsed.get('message_type', None)
+    record.timestamp = parsed.get('timestamp', None)
+    record.fields = parsed.get('fields', {})
+    record.metadata = parsed.get('metadata', {})
+    return record
+
   ############################
   def as_json(self):
     """Return DASRecord as a JSON string."""
-    json_dict = {
-      'data_id': self.data_id,
-      'message_type': self.message_type,
-      'timestamp': self.timestamp,
-      'fields': self.fields,
-      'metadata': self.metadata
-    }
-    return json.dumps(json_dict)
+    return JSON_TEMPLATE % (_json_value(self.data_id),
+                            _json_value(self.message_type),
+                            _json_value(self.timestamp),
+                            _json_value(self.fields),
+                            _json_value(self.metadata))
 
   ############################
   def __str__(self):
@@ -69,10 +107,13 @@ class DASRecord:
 
   ############################
   def __eq__(self, other):
-    return (self.data_id == other.data_id and
+    if other is self:
+      return True
+    if not isinstance(other, DASRecord):
+      return NotImplemented
+    # Cheapest, most-likely-to-differ comparisons first
+    return (self.timestamp == other.timestamp and
+            self.data_id == other.data_id and
             self.message_type == other.message_type and
-            self.timestamp == other.timestamp and
             self.fields == other.fields and
             self.metadata == other.metadata)
-
-
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Share one UDP port among many consumers, each wanting only the
+records for particular instruments.
+
+On a data bus where every instrument is broadcast to one port, each
+logger would otherwise open its own socket on the port, receive every
+packet, and throw away the ones that aren't its own. A
+UDPDemultiplexer instead owns the one socket, and a background thread
+receives each packet once, takes its data_id from the text before its
+first whitespace, and looks that up in a dict of subscribers, putting
+the packet on the queue of each one that wants it.
+
+  demux = shared_demultiplexer(6224)
+  gyr1_queue = queue.Queue()
+  demux.subscribe(gyr1_queue, ['gyr1'])
+  record = gyr1_queue.get()   # b'gyr1 2017-11-04T05:12:19.441672Z $HEHDT...'
+
+Queues may be queue.Queues, for consumers in the same process, or
+multiprocessing.Queues, for consumers in processes forked after the
+queue was created (as LoggerRunner forks each logger). If a consumer
+falls so far behind that its queue fills, packets for it are dropped
+rather than holding up everyone else. A subscriber may also say how to
+tell whether its consumer is still there; the receiving thread checks
+every CONSUMER_CHECK_INTERVAL seconds and unsubscribes any that aren't.
+Once its last subscriber has gone, a UDPDemultiplexer closes.
+
+See readers/demux_reader.py for a Reader that subscribes to a
+UDPDemultiplexer.
+"""
+import logging
+import queue
+import select
+import socket
+import sys
+import threading
+import time
+
+sys.path.append('.')
+
+# Big enough for the largest possible UDP datagram
+BUFFER_SIZE = 65535
+
+# How often (seconds) the receiving thread checks whether it's been
+# told to quit.
+QUIT_CHECK_INTERVAL = 0.5
+
+# How often (seconds) the receiving thread checks that subscribers'
+# consumers are still there.
+CONSUMER_CHECK_INTERVAL = 1.0
+
+_shared_demultiplexers = {}
+_shared_demultiplexers_lock = threading.Lock()
+
+################################################################################
+def shared_demultiplexer(port):
+  """Return the process-wide UDPDemultiplexer for port, creating it if
+  needed."""
+  with _shared_demultiplexers_lock:
+    demux = _shared_demultiplexers.get(port)
+    if demux is None or demux.closed:
+      demux = UDPDemultiplexer(port)
+      _shared_demultiplexers[port] = demux
+    return demux
+
+################################################################################
+def subscribe(port, record_queue, data_ids=None, alive=None):
+  """Subscribe record_queue to the process-wide UDPDemultiplexer for
+  port, as with UDPDemultiplexer.subscribe(), and return the
+  UDPDemultiplexer."""
+  while True:
+    demux = shared_demultiplexer(port)
+    if demux.subscribe(record_queue, data_ids, alive):
+      return demux
+    # Closed as its last subscriber left; shared_demultiplexer() will
+    # make a new one.
+
+################################################################################
+class UDPDemultiplexer:
+  """Receive UDP packets on a port and route them by data_id."""
+  ############################
+  def __init__(self, port, buffer_size=BUFFER_SIZE):
+    """
+    port         UDP port to receive broadcasts on.
+
+    buffer_size  Largest packet we can receive without truncating it.
+    """
+    self.port = port
+    self.closed = False
+
+    # Subscribers: data_id (as bytes) -> list of queues, and the queues
+    # that want every packet. subscribe() and unsubscribe() replace
+    # these lists rather than modify them, so the receiving thread can
+    # use them without taking the lock.
+    self.routes = {}
+    self.catch_all = []
+    self.lock = threading.Lock()
+
+    # (queue, alive) for subscribers whose consumers we check on
+    self.watched = []
+    self.num_dropped = 0
+
+    self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM,
+                                proto=socket.IPPROTO_UDP)
+    self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, True)
+    try: # Raspbian doesn't recognize SO_REUSEPORT
+      self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, True)
+    except AttributeError:
+      logging.warning('Unable to set socket REUSEPORT; system may not support it.')
+    self.socket.bind(('', port))
+    self.recv_buffer = bytearray(buffer_size)
+
+    self.quit_flag = threading.Event()
+    self.thread = threading.Thread(target=self._run, daemon=True,
+                                   name='UDPDemultiplexer :%d' % port)
+    self.thread.start()
+
+  ############################
+  def subscribe(self, record_queue, data_ids=None, alive=None):
+    """Put packets whose data_id is in data_ids (a list of strings) on
+    record_queue, or every packet if data_ids is None. If alive is
+    given, it's called now and then from our receiving thread, and
+    should return False once no one is reading record_queue.
+
+    Return False, without subscribing, if we've been closed."""
+    with self.lock:
+      if self.closed:
+        return False
+      if alive is not None:
+        self.watched = self.watched + [(record_queue, alive)]
+      if data_ids is None:
+        self.catch_all = self.catch_all + [record_queue]
+        return True
+      for data_id in data_ids:
+        key = data_id.encode('utf-8')
+        self.routes[key] = self.routes.get(key, []) + [record_queue]
+      return True
+
+  ############################
+  def unsubscribe(self, record_queue):
+    """Stop putting packets on record_queue. If it was our last
+    subscriber, close."""
+    with self.lock:
+      self.catch_all = [q for q in self.catch_all if q is not record_queue]
+      self.watched = [(q, alive) for (q, alive) in self.watched
+                      if q is not record_queue]
+      for key, queues in list(self.routes.items()):
+        queues = [q for q in queues if q is not record_queue]
+        if queues:
+          self.routes[key] = queues
+        else:
+          del self.routes[key]
+      last = not self.routes and not self.catch_all and not self.closed
+      if last:
+        self.closed = True
+    if last:
+      logging.info('UDPDemultiplexer :%d has no more subscribers; closing',
+                   self.port)
+      self.close()
+
+  ############################
+  def close(self):
+    """Stop receiving and close our socket. shared_demultiplexer()
+    will create a new UDPDemultiplexer for the port if asked again."""
+    with self.lock:
+      self.closed = True
+    self.quit_flag.set()
+    if self.thread is not threading.current_thread():
+      self.thread.join()
+
+  ############################
+  def _check_consumers(self):
+    """Unsubscribe queues whose consumers have gone."""
+    for (record_queue, alive) in self.watched:
+      try:
+        still_there = alive()
+      except Exception as e:
+        logging.error('UDPDemultiplexer :%d unable to check on consumer: %s',
+                      self.port, e)
+        continue
+      if not still_there:
+        logging.info('UDPDemultiplexer :%d consumer has gone; unsubscribing',
+                     self.port)
+        self.unsubscribe(record_queue)
+
+  ############################
+  def _route(self, packet):
+    """Put packet on the queues of everyone who wants it."""
+    fields = packet.split(None, 1)
+    queues = self.routes.get(fields[0]) if fields else None
+    if queues:
+      queues = queues + self.catch_all if self.catch_all else queues
+    else:
+      queues = self.catch_all
+    for record_queue in queues:
+      try:
+        record_queue.put_nowait(packet)
+      except queue.Full:
+        self.num_dropped += 1
+        if self.num_dropped % 1000 == 1:
+          logging.warning('UDPDemultiplexer :%d consumer falling behind; '
+                          '%d packets dropped', self.port, self.num_dropped)
+
+  ############################
+  def _run(self):
+    """Receiving thread: wait for packets, then receive and route every
+    one waiting, until told to quit."""
+    view = memoryview(self.recv_buffer)
+    last_check = time.monotonic()
+    try:
+      while not self.quit_flag.is_set():
+        (readable, _, _) = select.select([self.socket], [], [],
+                                         QUIT_CHECK_INTERVAL)
+        if self.watched:
+          now = time.monotonic()
+          if now - last_check >= CONSUMER_CHECK_INTERVAL:
+            last_check = now
+            self._check_consumers()
+            if self.quit_flag.is_set():
+              break
+        while readable:
+          try:
+            num_bytes = self.socket.recv_into(self.recv_buffer, 0,
+                                              socket.MSG_DONTWAIT)
+          except (BlockingIOError, InterruptedError):
+            break
+          self._route(bytes(view[:num_bytes]))
+    finally:
+      self.socket.close()
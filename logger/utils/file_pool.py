@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""A pool of open files, written to from a single background I/O
+thread, for processes that write many files at once (e.g. one
+LogfileWriter per instrument).
+
+Callers hand text to FilePool.write() and carry on: the text is put on
+a bounded queue, and the I/O thread appends it to the named file,
+opening the file if need be. At most max_open_files files are kept
+open; when another is needed, the least recently written one is
+closed. Files are flushed whenever the queue runs dry, and at least
+every FLUSH_INTERVAL seconds while it doesn't.
+
+If the disk falls so far behind that the queue fills, write() drops
+the text rather than hold up its caller, counting and now and then
+logging what it's dropped; a pool created with put_timeout will wait
+that long for room first (or, if None, as long as it takes).
+close_file() always waits for room, since a dropped close would leave
+its file open and its callback uncalled. If a file can't be
+opened or written, what's queued for it is kept and tried again every
+RETRY_INTERVAL seconds, and when the file is closed; only then, or if
+too much piles up, are records dropped, with an error logged.
+
+The I/O thread is started by the first write, in the process that
+makes it: a pool created before a fork (as LoggerRunner does with its
+writers) works in the child, which gets its own thread and files.
+Once shutdown() has been called, write() and close_file() raise
+ValueError.
+
+  pool = FilePool(max_open_files=32)
+  pool.write('/var/log/gyr1-2017-11-04', '2017-11-04T05:12:19.441672Z ...\n')
+  pool.close_file('/var/log/gyr1-2017-11-04')
+  pool.sync()  # wait for everything queued so far to be written
+"""
+import atexit
+import errno
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import weakref
+
+from collections import OrderedDict, deque
+
+sys.path.append('.')
+
+DEFAULT_MAX_OPEN_FILES = 64
+DEFAULT_QUEUE_SIZE = 10000
+
+# Flush at least this often (seconds) even if the queue never empties
+FLUSH_INTERVAL = 1.0
+
+# How often (seconds) to try again to write files we couldn't
+RETRY_INTERVAL = 1.0
+
+# Queued operations
+_WRITE = 'write'
+_CLOSE = 'close'
+_QUIT = 'quit'
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+# Pools to shut down when the process exits
+_pools = weakref.WeakSet()
+
+################################################################################
+@atexit.register
+def _shutdown_pools():
+  for pool in list(_pools):
+    pool.shutdown()
+
+################################################################################
+def _reset_after_fork():
+  """A forked child has none of its parent's threads, so pools it
+  inherits start afresh."""
+  global _shared_pool_lock
+  _shared_pool_lock = threading.Lock()
+  for pool in list(_pools):
+    pool._reset()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+################################################################################
+def shared_pool():
+  """Return the process-wide FilePool, creating it if needed."""
+  global _shared_pool
+  with _shared_pool_lock:
+    if _shared_pool is None:
+      _shared_pool = FilePool()
+    return _shared_pool
+
+################################################################################
+class FilePool:
+  """Append text to many files from a single I/O thread."""
+  ############################
+  def __init__(self, max_open_files=DEFAULT_MAX_OPEN_FILES,
+               queue_size=DEFAULT_QUEUE_SIZE, put_timeout=0):
+    """
+    max_open_files  Most files to hold open at once.
+
+    queue_size      Most writes/closes to queue up.
+
+    put_timeout     How long (seconds) write() may wait for room in a
+                    full queue before dropping its text. By default, it
+                    doesn't wait; if None, it waits as long as it takes.
+    """
+    if max_open_files < 1:
+      raise ValueError('FilePool max_open_files must be positive; got %s'
+                       % max_open_files)
+    self.max_open_files = max_open_files
+    self.queue_size = queue_size
+    self.put_timeout = put_timeout
+    self.closed = False
+    self.num_dropped = 0
+    self._reset()
+    _pools.add(self)
+
+  ############################
+  def _reset(self):
+    """Start with an empty queue and no files or I/O thread, as in a
+    newly-forked child."""
+    # The parent has its own copies of any files we inherited, and
+    # writes and closes them itself; point ours at /dev/null so that
+    # nothing they buffered gets written twice when we drop them.
+    files = getattr(self, 'files', {})
+    if files:
+      null_fd = os.open(os.devnull, os.O_WRONLY)
+      for f in files.values():
+        try:
+          os.dup2(null_fd, f.fileno())
+        except (OSError, ValueError):
+          pass
+      os.close(null_fd)
+
+    self.queue = queue.Queue(maxsize=self.queue_size)
+    self.thread = None
+    self.thread_lock = threading.Lock()
+
+    # Only touched by the I/O thread
+    self.files = OrderedDict()  # filename -> file, least recent first
+    self.unflushed = set()
+    self.pending = {}           # filename -> deque of text we couldn't write
+
+  ############################
+  def _put(self, operation, filename, arg, timeout=None):
+    """Queue an operation, starting the I/O thread if this is the first.
+    Wait up to timeout seconds (forever if None) for room in the queue,
+    raising queue.Full if there is none."""
+    if self.closed:
+      raise ValueError('FilePool has been shut down')
+    if self.thread is None:
+      with self.thread_lock:
+        if self.thread is None:
+          self.thread = threading.Thread(target=self._run, daemon=True,
+                                         name='FilePool I/O')
+          self.thread.start()
+    if timeout == 0:
+      self.queue.put_nowait((operation, filename, arg))
+    else:
+      self.queue.put((operation, filename, arg), timeout=timeout)
+
+  ############################
+  def write(self, filename, text):
+    """Queue text to be appended to filename. If the queue is full (and
+    stays full for put_timeout seconds), drop it."""
+    try:
+      self._put(_WRITE, filename, text, self.put_timeout)
+    except queue.Full:
+      self.num_dropped += 1
+      if self.num_dropped % 1000 == 1:
+        logging.warning('FilePool falling behind writing to disk; %d '
+                        'writes dropped', self.num_dropped)
+
+  ############################
+  def close_file(self, filename, callback=None):
+    """Queue filename to be flushed and closed, after anything already
+    queued for it is written. If callback is given, the I/O thread
+    calls it once the file is closed, so it should be quick."""
+    self._put(_CLOSE, filename, callback)
+
+  ############################
+  def sync(self):
+    """Wait until everything queued so far has been written and flushed."""
+    if self.thread is not None and self.thread.is_alive():
+      self.queue.join()
+
+  ############################
+  def shutdown(self):
+    """Write everything queued, close all files and stop the I/O thread."""
+    self.closed = True
+    if self.thread is not None and self.thread.is_alive():
+      self.queue.put((_QUIT, None, None))
+      self.thread.join()
+
+    # Anything that slipped in after we quit won't be written; don't
+    # leave callers blocked on a full queue.
+    dropped = 0
+    while True:
+      try:
+        self.queue.get_nowait()
+      except queue.Empty:
+        break
+      dropped += 1
+    if dropped:
+      logging.error('FilePool dropped %d operations queued after shutdown',
+                    dropped)
+    _pools.discard(self)
+
+  ############################
+  def _open(self, filename):
+    """Return an open file for filename, closing others if we need to."""
+    f = self.files.get(filename)
+    if f is not None:
+      self.files.move_to_end(filename)
+      return f
+
+    while len(self.files) >= self.max_open_files:
+      self._close_least_recent()
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    try:
+      f = open(filename, 'a')
+    except OSError as e:
+      # Out of file descriptors: give up half of ours and try again
+      if e.errno not in (errno.EMFILE, errno.ENFILE) or not self.files:
+        raise
+      logging.warning('FilePool out of file descriptors with %d files open',
+                      len(self.files))
+      for _ in range((len(self.files) + 1) // 2):
+        self._close_least_recent()
+      f = open(filename, 'a')
+    self.files[filename] = f
+    return f
+
+  ############################
+  def _close(self, filename):
+    f = self.files.pop(filename, None)
+    if f is None:
+      return
+    self.unflushed.discard(filename)
+    try:
+      f.close()
+    except OSError as e:
+      logging.error('FilePool unable to close %s: %s', filename, e)
+
+  ############################
+  def _close_least_recent(self):
+    self._close(next(iter(self.files)))
+
+  ############################
+  def _flush(self):
+    for filename in self.unflushed:
+      try:
+        self.files[filename].flush()
+      except OSError as e:
+        logging.error('FilePool unable to flush %s: %s', filename, e)
+    self.unflushed.clear()
+
+  ############################
+  def _write(self, filename, text):
+    """Append text to filename, or keep it to try again later."""
+    pending = self.pending.get(filename)
+    if pending is not None:
+      pending.append(text)
+      return
+    try:
+      self._open(filename).write(text)
+      self.unflushed.add(filename)
+    except OSError as e:
+      logging.error('FilePool unable to write %s; will keep trying: %s',
+                    filename, e)
+      self.pending[filename] = deque([text], maxlen=self.queue_size)
+
+  ############################
+  def _retry(self, filename):
+    """Try again to write what's pending for filename. Return True if
+    we managed to."""
+    pending = self.pending[filename]
+    try:
+      self._open(filename).write(''.join(pending))
+    except OSError as e:
+      if len(pending) == pending.maxlen:
+        logging.error('FilePool still unable to write %s; keeping only the '
+                      'latest %d records: %s', filename, pending.maxlen, e)
+      return False
+    logging.info('FilePool wrote %d held-up records to %s',
+                 len(pending), filename)
+    del self.pending[filename]
+    self.unflushed.add(filename)
+    return True
+
+  ############################
+  def _give_up(self, filename):
+    """Make a last attempt to write what's pending for filename, and if
+    it fails, drop it."""
+    if filename in self.pending and not self._retry(filename):
+      logging.error('FilePool dropping %d records: unable to write %s',
+                    len(self.pending.pop(filename)), filename)
+
+  ############################
+  def _run(self):
+    """I/O thread: carry out queued operations until told to quit."""
+    last_flush = last_retry = time.time()
+    while True:
+      try:
+        (operation, filename, arg) = self.queue.get(
+          timeout=RETRY_INTERVAL if self.pending else None)
+      except queue.Empty:
+        operation = None
+      try:
+        if operation == _WRITE:
+          self._write(filename, arg)
+        elif operation == _CLOSE:
+          self._give_up(filename)
+          self._close(filename)
+          if arg:
+            arg()
+        elif operation == _QUIT:
+          for filename in list(self.pending):
+            self._give_up(filename)
+          for filename in list(self.files):
+            self._close(filename)
+          self.queue.task_done()
+          return
+      except Exception as e:
+        logging.error('FilePool unable to %s %s: %s', operation, filename, e)
+
+      # Flush when we've caught up, or if it's been a while; likewise
+      # try again with any files we couldn't write.
+      try:
+        now = time.time()
+        if self.pending and now - last_retry > RETRY_INTERVAL:
+          for filename in list(self.pending):
+            self._retry(filename)
+          last_retry = now
+        if self.queue.empty() or now - last_flush > FLUSH_INTERVAL:
+          self._flush()
+          last_flush = now
+      finally:
+        if operation is not None:
+          self.queue.task_done()
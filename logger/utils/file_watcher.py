@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Wait for files in a set of directories to be created or written to.
+
+Readers that tail files (e.g. TextFileReader with tail=True or
+refresh_file_spec=True) would otherwise have to sleep and poll. On
+Linux, a FileWatcher uses inotify (via ctypes) so that wait() returns
+as soon as something changes in one of the watched directories. On
+other platforms, or if inotify can't be set up, wait() just sleeps for
+its timeout, which gives the caller the same polling behavior as
+before.
+
+inotify only sees changes made through the local kernel, so directories
+on network filesystems (NFS, CIFS...), where other hosts write, aren't
+watched. If any directory we're asked to watch can't be, event_driven()
+is False, so callers know to poll at their usual rate.
+
+  watcher = FileWatcher(['/var/log/openrvdas'])
+  while not new_data():
+    watcher.wait(timeout=5)
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import select
+import sys
+import time
+
+sys.path.append('.')
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# How much of the event queue to drain per read
+EVENT_BUFFER_SIZE = 65536
+
+# Filesystem types (as named in /proc/mounts) whose changes inotify
+# may never hear about
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ncpfs',
+                       'afs', 'ceph', 'glusterfs', 'lustre', 'gpfs', '9p',
+                       'fuse.sshfs', 'fuse.glusterfs', 'fuse.ceph'}
+
+_libc = None
+
+################################################################################
+def _inotify_libc():
+  """Return libc if it provides inotify, otherwise None."""
+  global _libc
+  if _libc is None:
+    _libc = False
+    if sys.platform.startswith('linux'):
+      try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        _libc = libc
+      except (OSError, AttributeError) as e:
+        logging.info('inotify not available (%s); will poll for changes', e)
+  return _libc or None
+
+################################################################################
+def filesystem_type(path):
+  """Return the type of the filesystem that path is on, as listed in
+  /proc/self/mounts, or None if we can't tell."""
+  path = os.path.realpath(path)
+  best = (-1, None)
+  try:
+    with open('/proc/self/mounts') as f:
+      for line in f:
+        fields = line.split()
+        if len(fields) < 3:
+          continue
+        # Spaces etc. in mount points are octal-escaped, e.g. '\040'
+        mount_point = re.sub(r'\\([0-7]{3})',
+                             lambda m: chr(int(m.group(1), 8)), fields[1])
+        if (path == mount_point or mount_point == '/' or
+            path.startswith(mount_point + '/')):
+          if len(mount_point) > best[0]:
+            best = (len(mount_point), fields[2])
+  except OSError:
+    return None
+  return best[1]
+
+################################################################################
+class FileWatcher:
+  """Wait for changes in a set of directories."""
+  ############################
+  def __init__(self, dirnames=(), use_inotify=True):
+    """
+    dirnames     Directories to watch. Changes to any file in them
+                 (creation, appending, renaming into) wake up wait().
+
+    use_inotify  If False, or if inotify isn't available, wait() simply
+                 sleeps for its timeout.
+    """
+    self.fd = None
+    self.watched = {}     # dirname -> watch descriptor
+    self.unwatched = {}   # dirname -> why we can't watch it
+
+    libc = _inotify_libc() if use_inotify else None
+    if libc:
+      fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+      if fd < 0:
+        logging.info('inotify_init1 failed (%s); will poll for changes',
+                     os.strerror(ctypes.get_errno()))
+      else:
+        self.fd = fd
+        self._libc = libc
+    self.watch(dirnames)
+
+  ############################
+  def event_driven(self):
+    """True if wait() returns on changes in all the directories we've
+    been asked to watch, rather than just sleeping."""
+    return self.fd is not None and bool(self.watched) and not self.unwatched
+
+  ############################
+  def watch(self, dirnames):
+    """Add dirnames to the directories being watched."""
+    if self.fd is None:
+      return
+    for dirname in dirnames:
+      dirname = os.path.abspath(dirname or '.')
+      if dirname in self.watched:
+        continue
+      fs_type = filesystem_type(dirname)
+      if fs_type in NETWORK_FILESYSTEMS:
+        if not dirname in self.unwatched:
+          logging.info('Not watching %s: changes on %s filesystems may not '
+                       'be seen; will poll', dirname, fs_type)
+        self.unwatched[dirname] = fs_type
+        continue
+      wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dirname),
+                                        WATCH_MASK)
+      if wd < 0:
+        # May not exist yet; try again next time we're asked
+        error = os.strerror(ctypes.get_errno())
+        if not dirname in self.unwatched:
+          logging.warning('Unable to watch directory %s: %s', dirname, error)
+        self.unwatched[dirname] = error
+        continue
+      self.unwatched.pop(dirname, None)
+      self.watched[dirname] = wd
+
+  ############################
+  def wait(self, timeout):
+    """Wait up to timeout seconds for a change. Return True if there was
+    one (or if we can't tell, because we're polling), False otherwise."""
+    if self.fd is None or not self.watched:
+      time.sleep(timeout)
+      return True
+
+    (readable, _, _) = select.select([self.fd], [], [], timeout)
+    if not readable:
+      return False
+
+    # We don't care what changed, just that something did: drain the
+    # queue so the next wait() blocks until something new happens.
+    try:
+      while os.read(self.fd, EVENT_BUFFER_SIZE):
+        pass
+    except BlockingIOError:
+      pass
+    return True
+
+  ############################
+  def close(self):
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
+      self.watched = {}
+      self.unwatched = {}
+
+  ############################
+  def __del__(self):
+    self.close()
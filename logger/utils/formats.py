@@ -42,6 +42,9 @@ Currently-defined format hierarchy is:
           XML_OSU
       Python - e.g. a dict or list
         Python_Record - a Python DAS Record
+      Binary - packed, non-text encoding
+        Binary_Record - binary encoding of a DAS Record (see
+                        logger/utils/binary_record.py)
 
 There is also a special case 'Unknown' format that can't accept
 anything, and has no common elements with any other format.
@@ -121,4 +124,8 @@ class XML(Text):
 class XML_OSU(XML):
   pass
 
+class Binary(Bytes):
+  pass
 
+class Binary_Record(Binary):
+  pass
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Sparse index of line offsets in a text file, so that readers can
+jump to line N of a large file without reading the N lines before it.
+
+A LineIndex records the byte offset at which every Kth line of a file
+begins. Finding line N means looking up the offset of line
+K * (N // K) and reading forward at most K-1 lines from there.
+
+The index is built lazily, the first time it's asked about the file,
+and is extended incrementally as the file grows (e.g. while tailing a
+logfile that's still being written). If the file shrinks, is replaced,
+or no longer looks like the file we indexed, the index is rebuilt from
+scratch.
+
+If asked to, a LineIndex also saves itself in a hidden sidecar file
+next to the file it indexes (e.g. 'NBP1700_s330-2017-11-04' gets
+'.NBP1700_s330-2017-11-04.lineidx') so that other readers, and later
+runs, can pick up where it left off. If the sidecar can't be written,
+the index lives on in memory only. Sidecars hold a one-line JSON header
+followed by the raw offsets - nothing that can run code when loaded,
+as data directories are often writable by many users.
+
+Lines are counted by '\\n' characters; a final line without a trailing
+newline counts as a line, just as readline() would return it.
+
+Compressed files (see logger/utils/compressed_file.py) are indexed by
+offsets into their uncompressed contents. They're assumed not to grow:
+if one changes at all, it's reindexed from scratch.
+"""
+import json
+import logging
+import os
+import re
+import sys
+
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+
+sys.path.append('.')
+
+from logger.utils.compressed_file import is_compressed, open_file
+
+DEFAULT_INTERVAL = 1000
+INDEX_SUFFIX = '.lineidx'
+INDEX_VERSION = 3
+
+# How much of the file to read at a time while indexing
+BLOCK_SIZE = 1024 * 1024
+
+################################################################################
+@lru_cache(maxsize=None)
+def _lines_re(count):
+  """Regex matching exactly count complete lines."""
+  return re.compile(b'(?:[^\n]*\n){%d}' % count)
+
+################################################################################
+def index_filename(filename, index_dir=None):
+  """Name of the sidecar file in which to store the index for filename."""
+  (dirname, basename) = os.path.split(os.path.abspath(filename))
+  return os.path.join(index_dir or dirname, '.' + basename + INDEX_SUFFIX)
+
+################################################################################
+class LineIndex:
+  """Byte offsets of every Kth line of a file."""
+  ############################
+  def __init__(self, filename, interval=DEFAULT_INTERVAL, save=False,
+               index_dir=None):
+    """
+    filename     File to index.
+
+    interval     Record the offset of every this-many lines.
+
+    save         If True, load/save the index from/to a sidecar file.
+
+    index_dir    Directory in which to keep the sidecar file; defaults to
+                 the directory that filename is in.
+    """
+    if interval < 1:
+      raise ValueError('LineIndex interval must be positive; got %s'
+                       % interval)
+    self.filename = filename
+    self.interval = interval
+    self.index_file = index_filename(filename, index_dir) if save else None
+
+    self._reset()
+    self._loaded = False
+
+  ############################
+  def _reset(self):
+    """Forget everything we know about the file."""
+    self.offsets = array('q', [0])  # offsets[i] = start of line i * interval
+    self.num_complete = 0           # lines ending in '\n'
+    self.scanned_size = 0           # bytes up to end of last complete line
+    self.partial = False            # trailing line without a '\n'?
+    self.size = None                # (uncompressed) bytes scanned
+    self.file_size = None           # file size and identity when last
+    self.mtime_ns = None            # scanned
+    self.inode = None
+    self._saved_offsets = 0         # len(offsets) when last saved
+
+  ############################
+  def _header(self):
+    """Everything but the offsets, for the sidecar file's header."""
+    return {
+      'version': INDEX_VERSION,
+      'interval': self.interval,
+      'byteorder': sys.byteorder,
+      'num_offsets': len(self.offsets),
+      'num_complete': self.num_complete,
+      'scanned_size': self.scanned_size,
+      'partial': self.partial,
+      'size': self.size,
+      'file_size': self.file_size,
+      'mtime_ns': self.mtime_ns,
+      'inode': self.inode,
+    }
+
+  ############################
+  def _load(self):
+    """Pick up where a previously-saved index left off, if we can."""
+    self._loaded = True
+    if not self.index_file:
+      return
+    try:
+      with open(self.index_file, 'rb') as f:
+        header = json.loads(f.readline())
+        if (type(header) is not dict or
+            header.get('version') != INDEX_VERSION or
+            header.get('interval') != self.interval or
+            header.get('byteorder') != sys.byteorder):
+          return
+        offsets = array('q')
+        offsets.frombytes(f.read())
+        if len(offsets) != header['num_offsets'] or not offsets:
+          raise ValueError('expected %s offsets, found %d'
+                           % (header['num_offsets'], len(offsets)))
+        state = (header['num_complete'], header['scanned_size'],
+                 header['partial'], header['size'], header['file_size'],
+                 header['mtime_ns'], header['inode'])
+        if (type(state[2]) is not bool or
+            not all(type(v) is int or v is None
+                    for v in state[:2] + state[3:])):
+          raise ValueError('malformed header')
+    except FileNotFoundError:
+      return
+    except Exception as e:
+      logging.warning('Ignoring unreadable line index %s: %s',
+                      self.index_file, e)
+      return
+    self.offsets = offsets
+    (self.num_complete, self.scanned_size, self.partial, self.size,
+     self.file_size, self.mtime_ns, self.inode) = state
+    self._saved_offsets = len(self.offsets)
+
+  ############################
+  def _save(self):
+    """Atomically write our state to the sidecar file."""
+    if not self.index_file:
+      return
+    tmp_file = '%s.%d.tmp' % (self.index_file, os.getpid())
+    try:
+      with open(tmp_file, 'wb') as f:
+        f.write(json.dumps(self._header()).encode('utf-8') + b'\n')
+        f.write(self.offsets.tobytes())
+      os.replace(tmp_file, self.index_file)
+      self._saved_offsets = len(self.offsets)
+    except OSError as e:
+      # Probably a read-only directory; don't keep trying.
+      logging.info('Unable to write line index %s (%s); keeping it in '
+                   'memory only', self.index_file, e)
+      self.index_file = None
+
+  ############################
+  def _still_valid(self, stat):
+    """Does what we've indexed still look like the start of the file?"""
+    if self.inode is not None and stat.st_ino != self.inode:
+      return False
+    if is_compressed(self.filename):
+      return self.file_size is None
+    if stat.st_size < self.scanned_size:
+      return False
+    if self.scanned_size == 0:
+      return True
+    # Cheap sanity check: the last line we counted should still end
+    # where we thought it did.
+    with open_file(self.filename, 'rb') as f:
+      f.seek(self.scanned_size - 1)
+      return f.read(1) == b'\n'
+
+  ############################
+  def update(self):
+    """Bring the index up to date with the file, scanning only what's
+    been added since we last looked."""
+    if not self._loaded:
+      self._load()
+    stat = os.stat(self.filename)
+    if (stat.st_size == self.file_size and
+        stat.st_mtime_ns == self.mtime_ns and stat.st_ino == self.inode):
+      return
+
+    if not self._still_valid(stat):
+      logging.info('LineIndex: %s has changed; reindexing', self.filename)
+      self._reset()
+
+    self._scan()
+    self.file_size = stat.st_size
+    self.mtime_ns = stat.st_mtime_ns
+    self.inode = stat.st_ino
+
+    # No need to save every time a growing file gets a new line; the
+    # next reader will rescan at most one interval's worth of lines.
+    if len(self.offsets) != self._saved_offsets:
+      self._save()
+
+  ############################
+  def _scan(self):
+    """Index forward from our last recorded offset to EOF."""
+    pattern = _lines_re(self.interval)
+    pos = self.offsets[-1]  # file position of buffer[0]
+    buffer = b''
+    with open_file(self.filename, 'rb') as f:
+      f.seek(pos)
+      while True:
+        data = f.read(BLOCK_SIZE)
+        if not data:
+          break
+        buffer += data
+        # Peel off as many full intervals' worth of lines as we can,
+        # recording where each one ends.
+        end = 0
+        match = pattern.match(buffer, end)
+        while match:
+          end = match.end()
+          self.offsets.append(pos + end)
+          match = pattern.match(buffer, end)
+        if end:
+          buffer = buffer[end:]
+          pos += end
+
+    # What's left is less than an interval's worth of lines
+    last_newline = buffer.rfind(b'\n')
+    self.num_complete = ((len(self.offsets) - 1) * self.interval +
+                         buffer.count(b'\n'))
+    self.scanned_size = pos + last_newline + 1
+    self.partial = len(buffer) > last_newline + 1
+    self.size = pos + len(buffer)
+
+  ############################
+  def num_lines(self):
+    """Number of lines in the file."""
+    self.update()
+    return self.num_complete + (1 if self.partial else 0)
+
+  ############################
+  def offset(self, line_number):
+    """Byte offset at which (zero-based) line line_number begins. If the
+    file has fewer lines than that, return the offset of EOF."""
+    if line_number < 0:
+      raise ValueError('LineIndex line number must be non-negative; got %d'
+                       % line_number)
+    self.update()
+    if line_number >= self.num_complete:
+      if line_number == self.num_complete:
+        return self.scanned_size
+      return self.size
+
+    (checkpoint, skip) = divmod(line_number, self.interval)
+    pos = self.offsets[checkpoint]
+    if not skip:
+      return pos
+    with open_file(self.filename, 'rb') as f:
+      f.seek(pos)
+      for _ in range(skip):
+        pos += len(f.readline())
+    return pos
+
+  ############################
+  def line_number(self, offset):
+    """Number of lines that begin before byte offset - i.e. the
+    (zero-based) line number of the line beginning at offset."""
+    self.update()
+    if offset >= self.scanned_size:
+      if offset > self.scanned_size and self.partial:
+        return self.num_complete + 1
+      return self.num_complete
+
+    checkpoint = bisect_right(self.offsets, offset) - 1
+    pos = self.offsets[checkpoint]
+    with open_file(self.filename, 'rb') as f:
+      f.seek(pos)
+      newlines = f.read(offset - pos).count(b'\n')
+    return checkpoint * self.interval + newlines
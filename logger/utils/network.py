@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Helpers shared by NetworkReader and NetworkWriter.
+
+Over TCP, records travel as a byte stream, so each one has to be
+framed for the far end to find where it stops. Two framings are
+supported:
+
+  'newline'  Each record is followed by b'\\n'. Suited to text records,
+             which never contain newlines of their own.
+
+  'length'   Each record is preceded by its length, as a 4-byte
+             big-endian unsigned int. Suited to binary records (e.g.
+             from ToBinaryTransform), which may contain any byte.
+
+The same framings let several records share a UDP datagram (see
+NetworkWriter's coalesce option); such a datagram always holds whole
+records, so can be split with split_records().
+
+A network host that's an IP multicast group address (224.0.0.0 to
+239.255.255.255) means UDP multicast to that group. Giving each
+instrument or topic its own group (e.g. from the administratively
+scoped 239.192.0.0/14 range) means hosts only receive the streams
+they've joined, rather than every broadcast on the port.
+
+  framed = frame(record, 'length')
+  assembler = RecordAssembler('length')
+  records = assembler.feed(framed[:3]) + assembler.feed(framed[3:])
+"""
+import ipaddress
+import socket
+import struct
+import sys
+
+sys.path.append('.')
+
+NEWLINE_FRAMING = 'newline'
+LENGTH_FRAMING = 'length'
+FRAMINGS = (NEWLINE_FRAMING, LENGTH_FRAMING)
+
+LENGTH_PREFIX = struct.Struct('>I')
+
+# Largest UDP payload that fits in a standard 1500-byte Ethernet frame
+# (less 20 bytes of IP header and 8 of UDP header), so won't be
+# fragmented on the way.
+MAX_DATAGRAM_SIZE = 1472
+
+# Hops a multicast datagram may take by default: 1 keeps it on the
+# local subnet.
+DEFAULT_MULTICAST_TTL = 1
+
+# Linux delivers multicast datagrams for every group joined by any
+# socket on the host to every socket bound to the port, unless this
+# (unexported) socket option is turned off.
+IP_MULTICAST_ALL = getattr(socket, 'IP_MULTICAST_ALL', 49)
+
+# Largest record we'll reassemble before deciding the stream is
+# garbage. Generous enough for TMI-sized metadata records.
+DEFAULT_MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+################################################################################
+def parse_network(network, caller):
+  """Split a 'host:port' or ':port' network spec into (host, port),
+  raising ValueError on behalf of caller if it's malformed."""
+  if network.find(':') == -1:
+    raise ValueError('%s network argument must be in \'host:port\' or '
+                     '\':port\' format. Found "%s"' % (caller, network))
+  (host, port) = network.rsplit(':', 1)
+  try:
+    port = int(port)
+  except ValueError:
+    raise ValueError('%s network port must be an integer. Found "%s"'
+                     % (caller, network))
+  return (host, port)
+
+################################################################################
+def is_multicast(host):
+  """Is host an IPv4 multicast group address?"""
+  try:
+    return ipaddress.IPv4Address(host).is_multicast
+  except ValueError:
+    return False
+
+################################################################################
+def multicast_membership(group, interface=None):
+  """Return the ip_mreq struct for joining or leaving group on the
+  local interface with address interface (any, if None)."""
+  return socket.inet_aton(group) + socket.inet_aton(interface or '0.0.0.0')
+
+################################################################################
+def check_framing(framing, caller):
+  """Raise ValueError if framing isn't one we know."""
+  if framing not in FRAMINGS:
+    raise ValueError('%s framing must be one of %s; got "%s"'
+                     % (caller, ', '.join(FRAMINGS), framing))
+
+################################################################################
+def set_tcp_options(sock, nodelay=True, keepalive=True):
+  """Set TCP_NODELAY (send small records immediately rather than
+  waiting to coalesce them) and SO_KEEPALIVE (notice when the far end
+  has silently gone away) on a TCP socket."""
+  sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, bool(nodelay))
+  sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, bool(keepalive))
+
+################################################################################
+def frame(record, framing=NEWLINE_FRAMING):
+  """Return bytes record, framed for sending over a stream."""
+  if framing == NEWLINE_FRAMING:
+    return record + b'\n'
+  return LENGTH_PREFIX.pack(len(record)) + record
+
+################################################################################
+def split_records(data, framing=NEWLINE_FRAMING):
+  """Return the list of records in data, which must consist of whole
+  framed records, raising ValueError if it doesn't."""
+  if framing == NEWLINE_FRAMING:
+    if not data.endswith(b'\n'):
+      raise ValueError('Framed records end with incomplete record')
+    return data[:-1].split(b'\n')
+  assembler = RecordAssembler(framing, max_record_size=len(data))
+  records = assembler.feed(data)
+  if assembler.buffer:
+    raise ValueError('Framed records end with incomplete record')
+  return records
+
+################################################################################
+class RecordAssembler:
+  """Reassemble framed records from the chunks a stream delivers them
+  in, however the chunks fall relative to record boundaries."""
+  ############################
+  def __init__(self, framing=NEWLINE_FRAMING,
+               max_record_size=DEFAULT_MAX_RECORD_SIZE):
+    """
+    framing          NEWLINE_FRAMING or LENGTH_FRAMING.
+
+    max_record_size  Most bytes a single record may hold. feed() raises
+                     ValueError if the stream claims a bigger one.
+    """
+    check_framing(framing, 'RecordAssembler')
+    self.framing = framing
+    self.max_record_size = max_record_size
+    self.buffer = bytearray()
+
+  ############################
+  def feed(self, data):
+    """Add bytes data from the stream, and return a (possibly empty)
+    list of the records it completes."""
+    self.buffer += data
+    if self.framing == NEWLINE_FRAMING:
+      return self._newline_records()
+    return self._length_records()
+
+  ############################
+  def _newline_records(self):
+    end = self.buffer.rfind(b'\n')
+    if end == -1:
+      if len(self.buffer) > self.max_record_size:
+        self.buffer.clear()
+        raise ValueError('Record exceeds max_record_size of %d bytes'
+                         % self.max_record_size)
+      return []
+    records = bytes(self.buffer[:end]).split(b'\n')
+    del self.buffer[:end + 1]
+    if end > self.max_record_size and \
+       max(map(len, records)) > self.max_record_size:
+      raise ValueError('Record exceeds max_record_size of %d bytes'
+                       % self.max_record_size)
+    return records
+
+  ############################
+  def _length_records(self):
+    records = []
+    pos = 0
+    buffer = self.buffer
+    while len(buffer) - pos >= LENGTH_PREFIX.size:
+      (length,) = LENGTH_PREFIX.unpack_from(buffer, pos)
+      if length > self.max_record_size:
+        buffer.clear()
+        raise ValueError('Record length %d exceeds max_record_size of %d '
+                         'bytes' % (length, self.max_record_size))
+      end = pos + LENGTH_PREFIX.size + length
+      if end > len(buffer):
+        break
+      records.append(bytes(buffer[pos + LENGTH_PREFIX.size:end]))
+      pos = end
+    del buffer[:pos]
+    return records
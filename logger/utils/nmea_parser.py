@@ -4,13 +4,18 @@
 """
 
 import glob
+import json
 import logging
+import os
 import re
 import sys
+import threading
+import time
 
 sys.path.append('.')
 from logger.utils import read_json
 from logger.utils.das_record import DASRecord
+from logger.utils.record_batch import RecordBatch, typed_column
 from logger.utils.timestamp import timestamp, TIME_FORMAT
 
 DEFAULT_MESSAGE_PATH = 'local/message/*.json'
@@ -18,9 +23,203 @@ DEFAULT_SENSOR_PATH = 'local/sensor/*.json'
 DEFAULT_SENSOR_MODEL_PATH = 'local/sensor_model/*.json'
 
 RAW_FIELDS_RE   = '(?P<raw_fields>[^*]+)'
-CHECKSUM_RE  = '(?:\*(?P<checksum>[0-9A-F]{2}))?'
+CHECKSUM_RE  = r'(?:\*(?P<checksum>[0-9A-Fa-f]{2}))?'
 NMEA_RE = re.compile(RAW_FIELDS_RE + CHECKSUM_RE)
 
+# Characters that mean a field_delimiter can't be treated as a literal
+REGEX_SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+
+
+# Map from data types named in field definitions to the functions used
+# to convert raw field strings. A missing data type leaves the string
+# as it is.
+CONVERTERS = {
+  None: str,
+  '': str,
+  'int': int,
+  'float': float,
+  'str': str,
+}
+
+################################################################################
+def _converter(data_type):
+  """Return the function that converts a raw field string to data_type."""
+  try:
+    return CONVERTERS[data_type]
+  except (KeyError, TypeError):
+    raise ValueError('Unknown data type in field definition: "%s"' % data_type)
+
+################################################################################
+def checksum(message):
+  """Return the NMEA checksum of a message: the XOR of all characters
+  between the leading '$' (or '!') and the '*', as a two-character,
+  uppercase hex string. If the message has a '*', only characters
+  before it are used."""
+  end = message.find('*')
+  if end == -1:
+    end = len(message)
+  start = 1 if message[:1] in ('$', '!') else 0
+  value = 0
+  for char in message[start:end].encode('ascii', errors='replace'):
+    value ^= char
+  return '%02X' % value
+
+################################################################################
+def bad_checksum(message):
+  """Return True if message has a '*hh' checksum that doesn't match
+  the rest of the message. Messages with no checksum pass."""
+  end = message.find('*')
+  if end == -1:
+    return False
+  expected = message[end+1:end+3]
+  if len(expected) != 2:
+    return False
+  return checksum(message) != expected.upper()
+
+################################################################################
+# Definitions read from JSON files are cached at module level so that
+# every NMEAParser in a process shares them, and can optionally be
+# cached in a JSON file so that new processes don't need to
+# re-parse the JSON either. Entries are validated by file mtime and
+# size, so edited definition files are picked up automatically.
+_file_definitions = {}     # filename -> (mtime_ns, size, definitions)
+_path_definitions = {}     # json_path -> (signature, merged definitions)
+_loaded_cache_files = set()
+_definition_lock = threading.Lock()
+
+################################################################################
+def _load_cache_file(cache_file):
+  """Merge previously-saved file definitions into our cache, if the
+  cache file exists and we haven't already loaded it.
+
+  The cache file is plain JSON, not a pickle: its path comes from
+  configuration and it may live in a shared directory, so loading it
+  must not be able to run code."""
+  if cache_file in _loaded_cache_files:
+    return
+  _loaded_cache_files.add(cache_file)
+  try:
+    with open(cache_file, 'r') as f:
+      cached = json.load(f)
+    entries = {}
+    for filename, (mtime_ns, size, definitions) in cached.items():
+      if (type(mtime_ns) is not int or type(size) is not int or
+          type(definitions) is not dict):
+        raise ValueError('malformed entry for %s' % filename)
+      entries[filename] = (mtime_ns, size, definitions)
+  except FileNotFoundError:
+    return
+  except Exception as e:
+    logging.warning('Ignoring unreadable definition cache file %s: %s',
+                    cache_file, e)
+    return
+  for filename, entry in entries.items():
+    _file_definitions.setdefault(filename, entry)
+
+################################################################################
+def _save_cache_file(cache_file):
+  """Save our file definitions to cache_file as JSON, atomically
+  replacing whatever was there."""
+  tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+  try:
+    with open(tmp_file, 'w') as f:
+      json.dump(_file_definitions, f)
+    os.replace(tmp_file, cache_file)
+  except (OSError, TypeError, ValueError) as e:
+    logging.warning('Unable to write definition cache file %s: %s',
+                    cache_file, e)
+
+################################################################################
+def read_definitions(json_path, cache_file=None):
+  """Return a dict of all definitions in the JSON files matching
+  wildcarded json_path. Files that haven't changed since they were
+  last read are not read again; if cache_file is specified, parsed
+  definitions are also loaded from/saved to that JSON file.
+
+  The returned dict is shared between callers and must not be
+  modified."""
+  with _definition_lock:
+    if cache_file:
+      _load_cache_file(cache_file)
+
+    filenames = sorted(glob.glob(json_path))
+    signature = []
+    updated = False
+    for filename in filenames:
+      filename = os.path.abspath(filename)
+      stat = os.stat(filename)
+      entry = _file_definitions.get(filename, None)
+      if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+        logging.debug('Reading definitions from %s', filename)
+        entry = (stat.st_mtime_ns, stat.st_size, read_json.read_json(filename))
+        _file_definitions[filename] = entry
+        updated = True
+      signature.append((filename,) + entry[:2])
+    signature = tuple(signature)
+
+    if updated and cache_file:
+      _save_cache_file(cache_file)
+
+    # If nothing has changed, hand back the same merged dict as before
+    cached = _path_definitions.get(json_path, None)
+    if cached and cached[0] == signature:
+      return cached[1]
+
+    definitions = {}
+    for (filename, mtime_ns, size) in signature:
+      new_defs = _file_definitions[filename][2]
+      for key in new_defs:
+        if key in definitions:
+          logging.warning('Duplicate definition for key "%s" found in %s',
+                          key, filename)
+        definitions[key] = new_defs[key]
+    _path_definitions[json_path] = (signature, definitions)
+    return definitions
+
+################################################################################
+class _MessagePlan:
+  """Precomputed recipe for the fields of one message type of a sensor
+  model: the number of leading elements that name the message type,
+  and the names and converters of the fields that follow them."""
+  def __init__(self, message_type, depth, field_definitions):
+    self.message_type = message_type
+    self.depth = depth
+    self.field_names = tuple(name for (name, data_type) in field_definitions)
+    self.converters = tuple(_converter(data_type)
+                            for (name, data_type) in field_definitions)
+    self.num_fields = len(field_definitions)
+
+################################################################################
+class _ModelPlan:
+  """Precomputed splitter for a sensor model, along with either the
+  single _MessagePlan it uses or a tree of _MessagePlans, keyed by
+  the leading message type elements of each message."""
+  def __init__(self, name, definition, split, plan=None):
+    self.name = name
+    self.definition = definition
+    self.split = split
+    self.plan = plan
+    self.messages = {}
+
+################################################################################
+class _SensorPlan:
+  """The _ModelPlan for a sensor, along with, for each message type,
+  a tuple of (field index, variable name, converter) for the fields
+  to which the sensor assigns variable names."""
+  def __init__(self, model_plan, sensor_fields):
+    self.model_plan = model_plan
+    self.sensor_fields = sensor_fields
+    self.var_plans = {}
+
+  ############################
+  def compile_var_plan(self, plan):
+    var_plan = tuple(
+      (index, self.sensor_fields[name], plan.converters[index])
+      for (index, name) in enumerate(plan.field_names)
+      if self.sensor_fields.get(name, None))
+    self.var_plans[plan.message_type] = var_plan
+    return var_plan
+
 
 ################################################################################
 class NMEAParser:
@@ -28,20 +227,151 @@ class NMEAParser:
   def __init__(self, message_path=DEFAULT_MESSAGE_PATH,
                sensor_path=DEFAULT_SENSOR_PATH,
                sensor_model_path=DEFAULT_SENSOR_MODEL_PATH,
-               time_format=None):
+               time_format=None, check_checksum=False,
+               definition_cache_file=None, refresh_interval=0):
+    """
+    message_path, sensor_path, sensor_model_path
+            Wildcarded path matching JSON definitions for sensor messages,
+            sensors and sensor models.
+
+    time_format
+            Format in which to expect record timestamps. Defaults to
+            timestamp.TIME_FORMAT.
+
+    check_checksum
+            If True, verify the '*hh' checksum of messages that have one
+            before doing any further parsing, and discard those that
+            don't match. Counts of discarded messages are kept by
+            data_id in self.checksum_errors.
+
+    definition_cache_file
+            Optional name of a JSON file in which to cache parsed
+            definitions, so that parsers created in other processes
+            don't need to re-read and re-parse the JSON files.
+
+    refresh_interval
+            If non-zero, check every refresh_interval seconds whether
+            any definition files have changed (or appeared) and, if so,
+            reload them.
+    """
+    self.message_path = message_path
+    self.sensor_path = sensor_path
+    self.sensor_model_path = sensor_model_path
+    self.definition_cache_file = definition_cache_file
+    self.refresh_interval = refresh_interval
+    self._next_refresh = time.time() + refresh_interval
+
     self.messages = self._read_definitions(message_path)
     self.sensor_models = self._read_definitions(sensor_model_path)
     self.sensors = self._read_definitions(sensor_path)
     self.time_format=time_format or TIME_FORMAT
+    self.check_checksum = check_checksum
+    self.checksum_errors = {}   # data_id -> count of bad checksums
+
+    # Compiled parse plans, filled in lazily as we encounter new
+    # sensors, sensor models and message types.
+    self._sensor_plans = {}   # data_id -> _SensorPlan
+    self._model_plans = {}    # sensor model name -> _ModelPlan
+
+  ############################
+  def refresh_definitions(self):
+    """Reload definitions if any of their files have changed. Return
+    True if anything was reloaded."""
+    messages = self._read_definitions(self.message_path)
+    sensor_models = self._read_definitions(self.sensor_model_path)
+    sensors = self._read_definitions(self.sensor_path)
+    if (messages is self.messages and sensor_models is self.sensor_models
+        and sensors is self.sensors):
+      return False
+
+    logging.info('NMEAParser definitions have changed - reloading')
+    self.messages = messages
+    self.sensor_models = sensor_models
+    self.sensors = sensors
+    self._sensor_plans = {}
+    self._model_plans = {}
+    return True
 
   ############################
   def parse_record(self, nmea_record):
     """Receive an id-prefixed, timestamped NMEA record."""
+    parsed = self._parse_values(nmea_record)
+    if parsed is None:
+      return None
+    (data_id, ts, message_type, var_plan, values) = parsed
+
+    named_fields = {}
+    for (var_entry, value) in zip(var_plan, values):
+      named_fields[var_entry[1]] = value
+
+    record = DASRecord(data_id=data_id, message_type=message_type,
+                       timestamp=ts, fields=named_fields)
+    logging.debug('created DASRecord: %s', record)
+    return record
+
+  ############################
+  def parse_records(self, nmea_records):
+    """Receive a list or iterator of id-prefixed, timestamped NMEA
+    records and parse them in bulk, without creating a DASRecord for
+    each. Records that can't be parsed are logged and skipped.
+
+    Return a dict keyed by (data_id, message_type), whose values are
+    RecordBatches, e.g.
+
+      RecordBatch(data_id='seap', message_type='$PSXN-23',
+        timestamps=array('d', [1509778839.291859, 1509778841.08167, ...]),
+        fields={'Seap200HorizQual': array('q', [1, 1, ...]),
+                'Seap200HeightQual': array('q', [0, 0, ...]),
+                ...
+               })
+
+    Float fields are returned as arrays of doubles, with empty values
+    as NaN; int fields as arrays of 64-bit ints if they have no empty
+    values. Anything else is returned as a list.
+    """
+    columns = {}   # (data_id, message_type) -> (var_plan, ts list, values)
+    for nmea_record in nmea_records:
+      parsed = self._parse_values(nmea_record)
+      if parsed is None:
+        continue
+      (data_id, ts, message_type, var_plan, values) = parsed
+
+      group = columns.get((data_id, message_type), None)
+      if group is None:
+        group = (var_plan, [], [[] for var_entry in var_plan])
+        columns[(data_id, message_type)] = group
+      group[1].append(ts)
+      for (column, value) in zip(group[2], values):
+        column.append(value)
+
+    results = {}
+    for (key, (var_plan, timestamps, values)) in columns.items():
+      fields = {}
+      for ((index, var_name, convert), column) in zip(var_plan, values):
+        fields[var_name] = typed_column(column, convert)
+      results[key] = RecordBatch(data_id=key[0], message_type=key[1],
+                                 timestamps=timestamps, fields=fields)
+    return results
+
+  ############################
+  def _parse_values(self, nmea_record):
+    """Parse an id-prefixed, timestamped NMEA record into a tuple of
+
+      (data_id, timestamp, message_type, var_plan, values)
+
+    where values is a list of converted field values, one for each
+    (field index, variable name, converter) entry in var_plan. Log an
+    error and return None if the record can't be parsed."""
     if not nmea_record:
       return None
     if not type(nmea_record) == type(''):
       logging.error('Record is not NMEA string: "%s"', nmea_record)
       return None
+    if self.refresh_interval:
+      now = time.time()
+      if now >= self._next_refresh:
+        self._next_refresh = now + self.refresh_interval
+        self.refresh_definitions()
     try:
       (data_id, raw_ts, message) = nmea_record.strip().split(maxsplit=2)
       ts = timestamp(raw_ts, time_format=self.time_format)
@@ -50,78 +380,176 @@ class NMEAParser:
                     nmea_record)
       return None
 
-    # Figure out what kind of message we're expecting, based on data_id
-    sensor = self.sensors.get(data_id, None)
-    if not sensor:
-      logging.error('Unrecognized data_id ("%s") in record: %s',
-                    data_id, nmea_record)
-      return None
+    # Figure out what kind of message we're expecting, based on
+    # data_id. Sensor plans are cached, so we only go through the
+    # definitions the first time we see a data_id.
+    sensor_plan = self._sensor_plans.get(data_id, None)
+    if sensor_plan is None:
+      sensor_plan = self._compile_sensor(data_id, nmea_record)
+      if sensor_plan is None:
+        return None
 
-    model_name = sensor.get('model', None)
-    if not model_name:
-      logging.error('No "model" for sensor %s', sensor)
+    # Drop corrupted messages before spending any time on them.
+    if self.check_checksum and bad_checksum(message):
+      errors = self.checksum_errors.get(data_id, 0) + 1
+      self.checksum_errors[data_id] = errors
+      # Noisy links produce bursts of bad lines; don't flood the logs.
+      log = logging.warning if errors == 1 else logging.debug
+      log('Bad checksum (%d so far for %s) in record: %s',
+          errors, data_id, nmea_record)
       return None
 
     # If something goes wrong during parsing, we'll get a ValueError
     try:
-      (fields, message_type) = self.parse_nmea(sensor_model_name=model_name,
-                                               message=message)
+      (plan, fields) = self._match_plan(sensor_plan.model_plan, message)
+
+      # Convert field values for variables specific to sensor, only
+      # bothering to convert the fields the sensor actually uses.
+      var_plan = sensor_plan.var_plans.get(plan.message_type, None)
+      if var_plan is None:
+        var_plan = sensor_plan.compile_var_plan(plan)
+      values = [None if fields[index] == '' else convert(fields[index])
+                for (index, var_name, convert) in var_plan]
     except ValueError as e:
       logging.error(str(e))
       return None
-    
-    # Finally, convert field values to variable names specific to sensor
-    sensor_fields = sensor.get('fields', None)
-    if not sensor_fields:
-      logging.error('No "fields" definition found for sensor %s', data_id)
-      return None
-    
-    named_fields = {}
-    for field_name in fields:
-      var_name = sensor_fields.get(field_name, None)
-      if var_name:
-        named_fields[var_name] = fields[field_name]
 
-    record = DASRecord(data_id=data_id, message_type=message_type,
-                       timestamp=ts, fields=named_fields)
-    logging.debug('created DASRecord: %s', str(record))
-    return record
+    return (data_id, ts, plan.message_type, var_plan, values)
 
   ############################
   def parse_nmea(self, sensor_model_name, message):
     """Parse a raw NMEA message; raise ValueError if there are problems."""
-    # Break the message into an optional message_type, the aggregated
-    # raw fields and an optional checksum.
+    model_plan = self._model_plans.get(sensor_model_name, None)
+    if model_plan is None:
+      model_plan = self._compile_model(sensor_model_name)
+    (plan, fields) = self._match_plan(model_plan, message)
+
+    # If still okay, map field values to their definitions
+    field_values = {}
+    for (name, convert, value) in zip(plan.field_names, plan.converters,
+                                      fields):
+      field_values[name] = None if value == '' else convert(value)
+    return (field_values, plan.message_type)
+
+  ############################
+  def _match_plan(self, model_plan, message):
+    """Split a raw NMEA message according to the compiled _ModelPlan
+    and find the _MessagePlan describing it. Return a (plan, fields)
+    tuple, where fields are the raw string values left after the
+    message type elements have been removed. Raise ValueError if
+    there are problems."""
+    # Break the message into the aggregated raw fields and an
+    # optional checksum. The first field may be a message type, but
+    # we'll deal with that below.
     match = NMEA_RE.match(message)
     if not match:
       raise ValueError('Can\'t parse NMEA record: "%s"' % message)
+    fields = model_plan.split(match.group('raw_fields'))
 
-    # Parse out the optional checksum from the raw fields. The first
-    # field may be a message type, but we'll deal with that later.
-    raw_fields = match.group('raw_fields')
-    checksum = match.group('checksum')
+    # If the sensor model only emits one type of message, we're done.
+    # Otherwise walk down the tree of message types we've already
+    # compiled, using leading fields as keys.
+    plan = model_plan.plan
+    if plan is None:
+      node = model_plan.messages
+      depth = 0
+      while True:
+        element = fields[depth] if depth < len(fields) else None
+        plan = node.get(element, None)
+        if plan is None:
+          plan = self._compile_message(model_plan, fields)
+          break
+        if type(plan) is _MessagePlan:
+          break
+        node = plan
+        depth += 1
+      fields = fields[plan.depth:]
 
-    logging.debug('Parsed "%s"', message)
-    logging.debug('raw_fields "%s"', raw_fields)
-    logging.debug('checksum "%s"', checksum)
-    
-    # Proper NMEA uses commas to delimit fields, but some serial
-    # instruments use spaces or other characters (Gravimeter, for
-    # example, uses both spaces and ':'). Look up sensor model and see
-    # if we have a non-default delimiter defined.
+    # Make sure fields line up with the number of definitions we have.
+    if len(fields) != plan.num_fields:
+      raise ValueError('Sensor model "%s": %s # of fields (%s) != '
+                       '# field definitions (%s): "%s" != "%s"' % (
+                         model_plan.name, plan.message_type,
+                         len(fields), plan.num_fields,
+                         fields, list(plan.field_names)))
+    return (plan, fields)
+
+  ############################
+  def _compile_sensor(self, data_id, nmea_record):
+    """Look up the sensor and sensor model for data_id and cache a
+    _SensorPlan for it. Log an error and return None if the
+    definitions are missing or broken."""
+    sensor = self.sensors.get(data_id, None)
+    if not sensor:
+      logging.error('Unrecognized data_id ("%s") in record: %s',
+                    data_id, nmea_record)
+      return None
+
+    model_name = sensor.get('model', None)
+    if not model_name:
+      logging.error('No "model" for sensor %s', sensor)
+      return None
+
+    sensor_fields = sensor.get('fields', None)
+    if not sensor_fields:
+      logging.error('No "fields" definition found for sensor %s', data_id)
+      return None
+
+    try:
+      model_plan = self._model_plans.get(model_name, None)
+      if model_plan is None:
+        model_plan = self._compile_model(model_name)
+    except ValueError as e:
+      logging.error(str(e))
+      return None
+
+    sensor_plan = _SensorPlan(model_plan, sensor_fields)
+    self._sensor_plans[data_id] = sensor_plan
+    return sensor_plan
+
+  ############################
+  def _compile_model(self, sensor_model_name):
+    """Precompute and cache the splitter and (if the model has only a
+    single message type) the _MessagePlan for a sensor model."""
     sensor_model = self.sensor_models.get(sensor_model_name, None)
     if not sensor_model:
       raise ValueError('No sensor_model  matching "%s"' % sensor_model_name)
 
+    # Proper NMEA uses commas to delimit fields, but some serial
+    # instruments use spaces or other characters (Gravimeter, for
+    # example, uses both spaces and ':'). Literal delimiters can use
+    # str.split(), which is much cheaper than re.split().
     field_delimiter = sensor_model.get('field_delimiter', ',')
-    fields = re.split(field_delimiter, raw_fields)
-    logging.debug('fields "%s"', fields)
+    if not set(field_delimiter) & REGEX_SPECIAL_CHARS:
+      split = lambda raw_fields: raw_fields.split(field_delimiter)
+    else:
+      split = re.compile(field_delimiter).split
+
+    # If the top-level sensor_model definition has 'fields', then it's
+    # easy: there's only one kind of message and one plan.
+    plan = None
+    if 'fields' in sensor_model:
+      plan = _MessagePlan(message_type='', depth=0,
+                          field_definitions=sensor_model['fields'])
+    elif not sensor_model.get('messages', None):
+      raise ValueError('Sensor model %s must have either "fields" or '
+                       '"messages" definition.' % sensor_model_name)
 
-    # We need to find what fields are defined by this sensor model. If
-    # the top-level sensor_model definition has 'fields', then it's
-    # easy, and we're done.
+    model_plan = _ModelPlan(sensor_model_name, sensor_model, split, plan)
+    self._model_plans[sensor_model_name] = model_plan
+    return model_plan
+
+  ############################
+  def _compile_message(self, model_plan, fields):
+    """Walk the sensor model's message definitions, using leading
+    elements of fields as keys, to find the definition of the fields
+    in this message. Cache and return the resulting _MessagePlan.
+    Raise ValueError if there are problems."""
     message_type = ''
-    definition_base = sensor_model
+    definition_base = model_plan.definition
+    sensor_model_name = model_plan.name
+    node = model_plan.messages
+    elements = []
 
     # If we don't have 'fields' defined at the top level, it means
     # that this sensor can emit multiple types of messages, which we
@@ -138,12 +566,16 @@ class NMEAParser:
         raise ValueError('Sensor model %s must have either "fields" or '
                          '"messages" definition.' % sensor_model_name)
 
-      # We count on the first field in the field list to tell us which
+      # We count on the next field in the field list to tell us which
       # message out of our dictionary of messages we actually have.
-      element = fields.pop(0)
+      if len(elements) >= len(fields):
+        raise ValueError('Message "%s" for model %s is missing its message '
+                         'type' % (message_type, sensor_model_name))
+      element = fields[len(elements)]
+      elements.append(element)
       message_type = message_type + '-' + element if message_type else element
-        
-      definition = sensor_messages.get(element, None) 
+
+      definition = sensor_messages.get(element, None)
       if not definition:
         raise ValueError('Message "%s" is not one defined by model %s (%s)'
                          % (message_type, sensor_model_name, sensor_messages))
@@ -177,46 +609,19 @@ class NMEAParser:
                          % (message_type, sensor_model_name))
 
     # End of while loop. If we're here, we darned well ought to have
-    # field_definitions in our definition_base. Get them and make sure
-    # they line up with the number of fields we have left.
-    field_definitions = definition_base.get('fields')    
-    if len(fields) != len(field_definitions):
-      raise ValueError('Sensor model "%s": %s # of fields (%s) != '
-                       '# field definitions (%s): "%s" != "%s"' % (
-                         sensor_model_name, message_type,
-                         len(fields), len(field_definitions),
-                         fields, [f[0] for f in field_definitions]))
-      
-    # If still okay, map field values to their definitions
-    field_values = {}
-    for i in range(len(fields)):
-      (name, data_type) = field_definitions[i]
-      field_values[name] = self._convert(fields[i], data_type)
-    return (field_values, message_type)
-    
-  ############################
-  def _convert(self, value, data_type):
-    if value is '':
-      return None
-    if not data_type:
-      return value
-    elif data_type == 'int':
-      return int(value)
-    elif data_type == 'float':
-      return float(value)
-    elif data_type == 'str':
-      return str(value)
-    else:
-      raise ValueError('Unknown data type in field definition: "%s"'%data_type)
+    # field_definitions in our definition_base. Compile them and file
+    # the plan in our tree of message types so we don't have to do
+    # this again.
+    plan = _MessagePlan(message_type=message_type, depth=len(elements),
+                        field_definitions=definition_base.get('fields'))
+    for element in elements[:-1]:
+      child = node.get(element, None)
+      if type(child) is not dict:
+        child = node[element] = {}
+      node = child
+    node[elements[-1]] = plan
+    return plan
 
   ############################
   def _read_definitions(self, json_path):
-    definitions = {}
-    for filename in glob.glob(json_path):
-      new_defs = read_json.read_json(filename)
-      for key in new_defs:
-        if key in definitions:
-          logging.warning('Duplicate definition for key "%s" found in %s',
-                          key, filename)
-        definitions[key] = new_defs[key]
-    return definitions
+    return read_definitions(json_path, cache_file=self.definition_cache_file)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""Quality control checks on the numeric fields of DASRecords and
+RecordBatches, as used by QCFilterTransform.
+
+Each check produces, for each field of each record, an int of QC flag
+bits; zero means the value passed everything. Flags are cheap to
+compute, store and compare, so the common case - everything in order -
+costs no string formatting. describe() turns non-zero flags into
+human-readable messages when there's something to say.
+
+Checks, per field:
+
+  bounds   value < lower (QC_BELOW_MIN) or > upper (QC_ABOVE_MAX)
+  rate     |change in value| / |change in time| since the field's
+           previous value > max_rate per second (QC_RATE)
+  stuck    value is the same as in the previous count - 1 records
+           (QC_STUCK)
+  spike    value differs from the median of the field's previous window
+           values by more than threshold (QC_SPIKE)
+
+and, per data_id, if max_gap is set:
+
+  gap      more than max_gap seconds since the previous record
+           (QC_GAP, reported against the 'timestamp' field)
+
+Values that aren't ints or floats get QC_NON_NUMERIC and are otherwise
+ignored; the rate, stuck and spike checks remember the last values
+seen for each data_id, so each data_id's records must be checked in
+order. NaN values pass, and don't count as history. In a RecordBatch,
+a record that didn't have a field has NaN (in a float column) or None
+(in a list column) for it, and check_column() skips these as check()
+skips fields a DASRecord doesn't have.
+
+  engine = QCEngine({'Grav1ValueMg': FieldQC(lower=20000, max_rate=5000)},
+                    max_gap=5)
+  flags = engine.check(record)           # e.g. {'Grav1ValueMg': QC_RATE}
+  messages = engine.describe(flags, record.fields)
+"""
+import sys
+
+from array import array
+from collections import deque
+from statistics import median
+
+sys.path.append('.')
+
+# Flag bits
+QC_NON_NUMERIC = 0x01
+QC_BELOW_MIN = 0x02
+QC_ABOVE_MAX = 0x04
+QC_RATE = 0x08
+QC_STUCK = 0x10
+QC_SPIKE = 0x20
+QC_GAP = 0x40
+
+# Field name that gap flags are reported against
+TIMESTAMP_FIELD = 'timestamp'
+
+# Metadata key under which a record's flags are attached
+QC_FLAGS_KEY = 'qc_flags'
+
+# Number of previous values a spike is measured against by default
+DEFAULT_SPIKE_WINDOW = 10
+
+# Typecode for arrays of flags
+QC_FLAG_TYPECODE = 'H'
+
+################################################################################
+class FieldQC:
+  """The checks to apply to one field, and what we remember of its
+  recent values."""
+  ############################
+  def __init__(self, lower=None, upper=None, max_rate=None, stuck_count=None,
+               spike_threshold=None, spike_window=DEFAULT_SPIKE_WINDOW):
+    """
+    lower, upper     Bounds on the field's value; either may be None.
+
+    max_rate         Most the value may change per second.
+
+    stuck_count      Flag the value if this many records in a row have it.
+
+    spike_threshold, spike_window
+                     Flag the value if it differs by more than
+                     spike_threshold from the median of the previous
+                     spike_window values. (The median, unlike the
+                     mean, isn't dragged off by the spike itself, so
+                     one bad value doesn't get its neighbors flagged.)
+    """
+    if stuck_count is not None and stuck_count < 2:
+      raise ValueError('FieldQC stuck_count must be at least 2; got %s'
+                       % stuck_count)
+    if spike_window < 1:
+      raise ValueError('FieldQC spike_window must be positive; got %s'
+                       % spike_window)
+    self.lower = lower
+    self.upper = upper
+    self.max_rate = max_rate
+    self.stuck_count = stuck_count
+    self.spike_threshold = spike_threshold
+    self.spike_window = spike_window
+
+    # Does anything need to remember previous values?
+    self.stateful = (max_rate is not None or stuck_count is not None or
+                     spike_threshold is not None)
+    self.last_value = None
+    self.last_timestamp = None
+    self.repeats = 0      # times in a row we've seen last_value
+    self.window = deque(maxlen=spike_window)
+
+  ############################
+  def copy(self):
+    """Return a FieldQC with the same checks, but no history."""
+    return FieldQC(lower=self.lower, upper=self.upper,
+                   max_rate=self.max_rate, stuck_count=self.stuck_count,
+                   spike_threshold=self.spike_threshold,
+                   spike_window=self.spike_window)
+
+  ############################
+  def check(self, value, timestamp):
+    """Return the flags for value, seen at timestamp."""
+    if type(value) is not int and type(value) is not float:
+      return QC_NON_NUMERIC
+    if value != value:  # NaN: nothing to compare
+      return 0
+
+    flags = 0
+    if self.lower is not None and value < self.lower:
+      flags = QC_BELOW_MIN
+    if self.upper is not None and value > self.upper:
+      flags |= QC_ABOVE_MAX
+    if self.stateful:
+      flags |= self._check_history(value, timestamp)
+    return flags
+
+  ############################
+  def _check_history(self, value, timestamp):
+    """Return the flags for checks against value's predecessors, and
+    remember value for next time."""
+    flags = 0
+    last_value = self.last_value
+    if last_value is not None:
+      if self.max_rate is not None:
+        elapsed = timestamp - self.last_timestamp
+        if elapsed > 0 and abs(value - last_value) > self.max_rate * elapsed:
+          flags = QC_RATE
+      if value == last_value:
+        self.repeats += 1
+      else:
+        self.repeats = 1
+      if self.stuck_count is not None and self.repeats >= self.stuck_count:
+        flags |= QC_STUCK
+    else:
+      self.repeats = 1
+
+    if self.spike_threshold is not None:
+      window = self.window
+      if len(window) == self.spike_window:
+        if abs(value - median(window)) > self.spike_threshold:
+          flags |= QC_SPIKE
+      window.append(value)
+
+    self.last_value = value
+    self.last_timestamp = timestamp
+    return flags
+
+  ############################
+  def check_column(self, column, timestamps):
+    """Return an array of flags for a column of values (a list or typed
+    column - see utils/record_batch.py) seen at timestamps, or None if
+    every value passes. NaNs in a float column, and Nones in a list
+    column, are missing values: they get no flags and don't count as
+    history."""
+    typecode = getattr(column, 'typecode', None)
+    if typecode in ('d', 'q') and not self.stateful:
+      # Just bounds to check. A typed column's values are all numeric
+      # (or NaN, in which case so is their sum), so if its sum isn't
+      # NaN, min() and max() - at C speed - tell us if we need to look
+      # any closer.
+      total = 0 if typecode == 'q' else sum(column)
+      if total == total:
+        if ((self.lower is None or min(column, default=0) >= self.lower) and
+            (self.upper is None or max(column, default=0) <= self.upper)):
+          return None
+
+    check = self.check
+    if typecode is None:
+      flags = array(QC_FLAG_TYPECODE,
+                    [0 if value is None else check(value, timestamp)
+                     for value, timestamp in zip(column, timestamps)])
+    else:
+      flags = array(QC_FLAG_TYPECODE, map(check, column, timestamps))
+    return flags if any(flags) else None
+
+  ############################
+  def describe(self, field_name, flags, value):
+    """Return a list of messages explaining field_name's flags."""
+    if flags & QC_NON_NUMERIC:
+      return ['%s: non-numeric value: "%s"' % (field_name, value)]
+    messages = []
+    if flags & QC_BELOW_MIN:
+      messages.append('%s: %g < lower bound %g'
+                      % (field_name, value, self.lower))
+    if flags & QC_ABOVE_MAX:
+      messages.append('%s: %g > upper bound %g'
+                      % (field_name, value, self.upper))
+    if flags & QC_RATE:
+      messages.append('%s: %g changing faster than %g per second'
+                      % (field_name, value, self.max_rate))
+    if flags & QC_STUCK:
+      messages.append('%s: %g unchanged for %d or more records'
+                      % (field_name, value, self.stuck_count))
+    if flags & QC_SPIKE:
+      messages.append('%s: %g spikes more than %g from recent median'
+                      % (field_name, value, self.spike_threshold))
+    return messages
+
+################################################################################
+class QCEngine:
+  """Apply FieldQC checks to records or batches of records."""
+  ############################
+  def __init__(self, fields, max_gap=None):
+    """
+    fields    A dict of {field_name: FieldQC}. Fields a record doesn't
+              have are skipped. Each data_id gets its own copy of the
+              FieldQCs that keep history, so that records from one
+              instrument aren't compared with another's.
+
+    max_gap   If not None, flag records arriving more than max_gap seconds
+              after the previous one with the same data_id.
+    """
+    self.fields = fields
+    self.max_gap = max_gap
+    self.last_timestamps = {}   # data_id -> timestamp of last record
+
+    # data_id -> {field_name: FieldQC}, and for check(), a list of
+    # (field_name, FieldQC, lower, upper, stateful). Fields with only
+    # bounds to check we can pass without a call to FieldQC.check() if
+    # their values are in bounds.
+    self.field_qcs = {}
+    self.checks = {}
+
+  ############################
+  def _field_qcs(self, data_id):
+    """Return data_id's {field_name: FieldQC}, creating it if need be."""
+    field_qcs = self.field_qcs.get(data_id)
+    if field_qcs is None:
+      field_qcs = {field_name: field_qc.copy() if field_qc.stateful
+                   else field_qc
+                   for field_name, field_qc in self.fields.items()}
+      self.field_qcs[data_id] = field_qcs
+      self.checks[data_id] = [(field_name, field_qc, field_qc.lower,
+                               field_qc.upper, field_qc.stateful)
+                              for field_name, field_qc in field_qcs.items()]
+    return field_qcs
+
+  ############################
+  def _check_gap(self, data_id, timestamp):
+    last = self.last_timestamps.get(data_id)
+    self.last_timestamps[data_id] = timestamp
+    if last is not None and timestamp - last > self.max_gap:
+      return QC_GAP
+    return 0
+
+  ############################
+  def check(self, record):
+    """Return a dict of {field_name: flags} for the fields of DASRecord
+    record that fail QC; empty if none do."""
+    result = {}
+    if self.max_gap is not None:
+      if self._check_gap(record.data_id, record.timestamp):
+        result[TIMESTAMP_FIELD] = QC_GAP
+    checks = self.checks.get(record.data_id)
+    if checks is None:
+      self._field_qcs(record.data_id)
+      checks = self.checks[record.data_id]
+    fields = record.fields
+    for (field_name, field_qc, lower, upper, stateful) in checks:
+      if not field_name in fields:
+        continue
+      value = fields[field_name]
+      if (not stateful and (type(value) is int or type(value) is float) and
+          (lower is None or value >= lower) and
+          (upper is None or value <= upper)):
+        continue
+      flags = field_qc.check(value, record.timestamp)
+      if flags:
+        result[field_name] = flags
+    return result
+
+  ############################
+  def check_batch(self, batch):
+    """Return a dict of {field_name: array of flags, one per record} for
+    the fields of RecordBatch batch that fail QC in any record."""
+    result = {}
+    timestamps = batch.timestamps
+    if self.max_gap is not None:
+      check_gap = self._check_gap
+      data_id = batch.data_id
+      flags = array(QC_FLAG_TYPECODE,
+                    [check_gap(data_id, ts) for ts in timestamps])
+      if any(flags):
+        result[TIMESTAMP_FIELD] = flags
+    for field_name, field_qc in self._field_qcs(batch.data_id).items():
+      column = batch.fields.get(field_name)
+      if column is not None:
+        flags = field_qc.check_column(column, timestamps)
+        if flags is not None:
+          result[field_name] = flags
+    return result
+
+  ############################
+  def describe(self, flags, fields):
+    """Return a list of messages explaining a record's flags, as
+    returned by check(), given its fields."""
+    messages = []
+    gap_flags = flags.get(TIMESTAMP_FIELD)
+    if gap_flags:
+      messages.append('%s: more than %g seconds since previous record'
+                      % (TIMESTAMP_FIELD, self.max_gap))
+    for field_name, field_qc in self.fields.items():
+      field_flags = flags.get(field_name)
+      if field_flags:
+        messages.extend(field_qc.describe(field_name, field_flags,
+                                          fields.get(field_name)))
+    return messages
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Columnar representation of a run of DASRecords that share a data_id
+and message_type, for use with the transform_batch()/write_batch()
+methods of Transforms and Writers.
+
+A RecordBatch holds its timestamps in an array('d') and each of its
+fields in a typed column:
+
+  array('d')  if all values are floats (or missing); missing values
+              are stored as NaN
+  array('q')  if all values are ints, with none missing
+  list        otherwise
+
+Iterating over a RecordBatch yields the equivalent DASRecords, so code
+that expects a list of records can be handed a batch. Note that NaN
+values in float columns come back out as None.
+"""
+import sys
+
+from array import array
+
+sys.path.append('.')
+
+from logger.utils.das_record import DASRecord
+from logger.utils.qc import QC_FLAG_TYPECODE, QC_FLAGS_KEY
+
+NAN = float('nan')
+
+################################################################################
+def typed_column(values, convert=None):
+  """Pack a list of values into a typed array if we can, otherwise
+  return the list itself. If convert is float or int, values are known
+  to have been produced by that converter (or to be None), and we
+  needn't check their types."""
+  if convert is None:
+    types = set(map(type, values))
+    types.discard(type(None))
+    if types == {float}:
+      convert = float
+    elif types == {int}:
+      convert = int
+    elif not types and values:
+      convert = float
+  if convert is float:
+    return array('d', [NAN if value is None else value for value in values])
+  if convert is int and not None in values:
+    try:
+      return array('q', values)
+    except OverflowError:
+      return values
+  return values
+
+################################################################################
+def column_values(column):
+  """Return the values in a column as a list, with NaNs in float
+  columns converted back to None."""
+  if type(column) is array and column.typecode == 'd':
+    return [None if value != value else value for value in column]
+  return list(column)
+
+################################################################################
+class RecordBatch:
+  """N records of one data_id and message_type, stored by column."""
+  ############################
+  def __init__(self, data_id=None, message_type=None, timestamps=None,
+               fields=None, metadata=None, qc_flags=None):
+    """
+    data_id, message_type
+               Shared by all records in the batch.
+
+    timestamps An array('d') (or other sequence) of N timestamps.
+
+    fields     A dict of {field_name: column}, where each column is a
+               sequence of N values, ideally as returned by typed_column().
+
+    metadata   Optional dict of metadata shared by all records.
+
+    qc_flags   Optional dict of {field_name: column of N QC flags}, as
+               set by QCFilterTransform (see utils/qc.py). Records with
+               non-zero flags get them in their metadata['qc_flags'].
+    """
+    self.data_id = data_id
+    self.message_type = message_type
+    if timestamps is None:
+      timestamps = array('d')
+    elif not type(timestamps) is array:
+      timestamps = array('d', timestamps)
+    self.timestamps = timestamps
+    self.fields = fields or {}
+    self.metadata = metadata or {}
+    self.qc_flags = qc_flags or {}
+
+    for field_name, column in self.fields.items():
+      if len(column) != len(timestamps):
+        raise ValueError('RecordBatch field %s has %d values for %d '
+                         'timestamps' % (field_name, len(column),
+                                         len(timestamps)))
+
+  ############################
+  @classmethod
+  def from_records(cls, records):
+    """Create a RecordBatch from a list of DASRecords sharing a data_id
+    and message_type. Records missing a field get None for its value."""
+    records = list(records)
+    if not records:
+      return cls()
+    first = records[0]
+    for record in records:
+      if (record.data_id != first.data_id or
+          record.message_type != first.message_type):
+        raise ValueError('RecordBatch records must share data_id and '
+                         'message_type; found (%s, %s) and (%s, %s)'
+                         % (first.data_id, first.message_type,
+                            record.data_id, record.message_type))
+    field_names = {}
+    for record in records:
+      for field_name in record.fields:
+        field_names[field_name] = True
+    fields = {}
+    for field_name in field_names:
+      fields[field_name] = typed_column(
+        [record.fields.get(field_name) for record in records])
+
+    # QC flags are per record, so become columns rather than metadata
+    metadata = first.metadata
+    qc_flags = {}
+    if QC_FLAGS_KEY in metadata:
+      metadata = {k: v for k, v in metadata.items() if k != QC_FLAGS_KEY}
+    for i, record in enumerate(records):
+      for field_name, flags in record.metadata.get(QC_FLAGS_KEY, {}).items():
+        if not field_name in qc_flags:
+          qc_flags[field_name] = array(QC_FLAG_TYPECODE, [0] * len(records))
+        qc_flags[field_name][i] = flags
+    return cls(data_id=first.data_id, message_type=first.message_type,
+               timestamps=[record.timestamp for record in records],
+               fields=fields, metadata=metadata, qc_flags=qc_flags)
+
+  ############################
+  def __len__(self):
+    return len(self.timestamps)
+
+  ############################
+  def __iter__(self):
+    return iter(self.records())
+
+  ############################
+  def records(self):
+    """Return the batch as a list of DASRecords."""
+    field_names = list(self.fields)
+    columns = [column_values(self.fields[name]) for name in field_names]
+    records = [DASRecord(data_id=self.data_id, message_type=self.message_type,
+                         timestamp=ts, fields=dict(zip(field_names, row)),
+                         metadata=dict(self.metadata))
+               for ts, row in zip(self.timestamps, zip(*columns)
+                                  if columns else [()] * len(self))]
+    if self.qc_flags:
+      flag_columns = list(self.qc_flags.items())
+      for i, record in enumerate(records):
+        flags = {name: column[i] for name, column in flag_columns if column[i]}
+        if flags:
+          record.metadata[QC_FLAGS_KEY] = flags
+    return records
+
+  ############################
+  def __eq__(self, other):
+    if not isinstance(other, RecordBatch):
+      return NotImplemented
+    return (self.data_id == other.data_id and
+            self.message_type == other.message_type and
+            list(self.timestamps) == list(other.timestamps) and
+            self.fields.keys() == other.fields.keys() and
+            all(column_values(self.fields[name]) ==
+                column_values(other.fields[name]) for name in self.fields) and
+            self.metadata == other.metadata and
+            self.qc_flags == other.qc_flags)
+
+  ############################
+  def __repr__(self):
+    return 'RecordBatch(data_id=%r, message_type=%r, %d records, fields=%s)' % (
+      self.data_id, self.message_type, len(self), list(self.fields))
+
+################################################################################
+def record_batches(records):
+  """Group an iterable of DASRecords into RecordBatches by data_id and
+  message_type. Batches are returned in the order their first record
+  appears, and records keep their order within each batch."""
+  groups = {}
+  for record in records:
+    key = (record.data_id, record.message_type)
+    group = groups.get(key)
+    if group is None:
+      group = groups[key] = []
+    group.append(record)
+  return [RecordBatch.from_records(group) for group in groups.values()]
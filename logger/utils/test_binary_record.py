@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import unittest
+
+sys.path.append('.')
+
+from logger.utils import binary_record
+from logger.utils.binary_record import BinaryRecordDecoder, BinaryRecordEncoder
+from logger.utils.das_record import DASRecord
+
+RECORDS = [
+  DASRecord(data_id='gyr1', message_type='', timestamp=1510265335,
+            fields={'GYR_Heading': 314.15, 'GYR_Acc': 0.11},
+            metadata={'calibration_date': '2017-01-13', 'status': 'good'}),
+  DASRecord(data_id='s330', message_type='$GPGGA', timestamp=1510265335.25,
+            fields={'S330GPSTime': 2034.17, 'S330Lat': 3934.831,
+                    'S330NorS': 'S', 'S330FixQuality': 1, 'S330NumSats': -3,
+                    'S330Big': 2**70, 'S330Empty': None, 'S330Good': True,
+                    'S330Bad': False, 'S330Name': 'café',
+                    'S330List': [1, 2.5, 'three', None]},
+            metadata={'nested': {'a': [1, {'b': 2}]}, 7: 'int key'}),
+  DASRecord(data_id=None, message_type=None, timestamp=0, fields={}),
+]
+
+################################################################################
+class TestBinaryRecord(unittest.TestCase):
+
+  ############################
+  def test_round_trip(self):
+    encoder = BinaryRecordEncoder()
+    decoder = BinaryRecordDecoder()
+    for record in RECORDS * 3:
+      encoded = encoder.encode(record)
+      self.assertEqual(type(encoded), bytes)
+      self.assertEqual(binary_record.record_length(encoded), len(encoded))
+      decoded = decoder.decode(encoded)
+      self.assertEqual(decoded, record)
+      self.assertEqual(type(decoded.timestamp), type(record.timestamp))
+
+  ############################
+  def test_interned_names(self):
+    encoder = BinaryRecordEncoder()
+    first = encoder.encode(RECORDS[1])
+    second = encoder.encode(RECORDS[1])
+    # Second time around, field names are sent as indices only
+    self.assertLess(len(second), len(first))
+    self.assertNotIn(b'S330GPSTime', second)
+    self.assertLess(len(second), len(RECORDS[1].as_json()) / 2)
+
+    # A decoder that missed the first record can't decode the second
+    with self.assertRaises(ValueError):
+      BinaryRecordDecoder().decode(second)
+
+  ############################
+  def test_reset_interval(self):
+    encoder = BinaryRecordEncoder(reset_interval=2)
+    encoded = [encoder.encode(RECORDS[0]) for i in range(5)]
+
+    # Names are re-sent at records 0, 2 and 4, so a decoder joining
+    # late (or that lost a packet) picks back up at the next reset.
+    decoder = BinaryRecordDecoder()
+    with self.assertRaises(ValueError):
+      decoder.decode(encoded[1])
+    self.assertEqual(decoder.decode(encoded[2]), RECORDS[0])
+    self.assertEqual(decoder.decode(encoded[3]), RECORDS[0])
+
+    # With an interval of 1, every record stands alone
+    encoder = BinaryRecordEncoder(reset_interval=1)
+    encoder.encode(RECORDS[0])
+    self.assertEqual(BinaryRecordDecoder().decode(encoder.encode(RECORDS[0])),
+                     RECORDS[0])
+
+  ############################
+  def test_multiple_encoders(self):
+    encoders = [BinaryRecordEncoder(), BinaryRecordEncoder()]
+    decoder = BinaryRecordDecoder()
+    for i in range(3):
+      for encoder, record in zip(encoders, RECORDS):
+        self.assertEqual(decoder.decode(encoder.encode(record)), record)
+
+  ############################
+  def test_errors(self):
+    encoder = BinaryRecordEncoder()
+    decoder = BinaryRecordDecoder()
+    encoded = encoder.encode(RECORDS[0])
+
+    self.assertEqual(binary_record.record_length(encoded[:3]), None)
+    with self.assertRaises(ValueError):
+      decoder.decode(encoded[:-1])
+    with self.assertRaises(ValueError):
+      decoder.decode(b'{"data_id": "gyr1"}')
+
+    with self.assertRaises(TypeError):
+      encoder.encode(DASRecord(data_id='gyr1', fields={'bad': object()}))
+    # A failed encode mustn't leave the decoder unable to follow along
+    self.assertEqual(decoder.decode(encoder.encode(RECORDS[0])), RECORDS[0])
+
+    # ...whatever the failure
+    with self.assertRaises(UnicodeEncodeError):
+      encoder.encode(DASRecord(data_id='new1',
+                               fields={'NewField': 1, '\ud800': 2}))
+    record = DASRecord(data_id='new1', timestamp=1, fields={'NewField': 1})
+    self.assertEqual(decoder.decode(encoder.encode(record)), record)
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
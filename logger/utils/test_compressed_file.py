@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import gzip
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+sys.path.append('.')
+
+from logger.utils import compressed_file
+from logger.utils.compressed_file import BlockGzipReader, BLOCK_SIZE
+from logger.utils.compressed_file import compress_file, data_size
+from logger.utils.compressed_file import is_block_gzip, open_file
+from logger.utils.compressed_file import uncompressed_name
+
+# Enough lines to fill several blocks
+LINES = ['2017-11-04T05:12:%02d.%06dZ line %d, with some text' %
+         (i % 60, i, i) for i in range(20000)]
+DATA = ('\n'.join(LINES) + '\n').encode()
+
+class TestCompressedFile(unittest.TestCase):
+  ############################
+  def test_compress_file(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/mylog-2017-11-04'
+      with open(filename, 'wb') as f:
+        f.write(DATA)
+      compressed = compress_file(filename)
+      self.assertEqual(filename + '.gz', compressed)
+      self.assertEqual(filename, uncompressed_name(compressed))
+      self.assertEqual([os.path.basename(compressed)], os.listdir(tmpdirname))
+      self.assertLess(os.path.getsize(compressed), len(DATA) / 4)
+
+      # Anything that reads gzip can read it
+      self.assertTrue(is_block_gzip(compressed))
+      with gzip.open(compressed, 'rb') as f:
+        self.assertEqual(DATA, f.read())
+
+      # Appending more adds more blocks
+      with open(filename, 'wb') as f:
+        f.write(b'one more line\n')
+      compress_file(filename)
+      with gzip.open(compressed, 'rb') as f:
+        self.assertEqual(DATA + b'one more line\n', f.read())
+
+  ############################
+  def test_compress_file_failure(self):
+    # If appending fails part way, the compressed file is as it was,
+    # and nothing is left lying around.
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/mylog-2017-11-04'
+      with open(filename, 'wb') as f:
+        f.write(b'first line\n')
+      compressed = compress_file(filename)
+      with open(compressed, 'rb') as f:
+        before = f.read()
+
+      with open(filename, 'wb') as f:
+        f.write(DATA)
+      real_compress_block = compressed_file._compress_block
+      calls = []
+      def failing_compress_block(data, compresslevel):
+        calls.append(data)
+        if len(calls) > 1:
+          raise OSError('disk full')
+        return real_compress_block(data, compresslevel)
+
+      with mock.patch.object(compressed_file, '_compress_block',
+                             failing_compress_block):
+        with self.assertRaises(OSError):
+          compress_file(filename)
+      with open(compressed, 'rb') as f:
+        self.assertEqual(before, f.read())
+      self.assertEqual(sorted(['mylog-2017-11-04', 'mylog-2017-11-04.gz']),
+                       sorted(os.listdir(tmpdirname)))
+
+  ############################
+  def test_block_gzip_reader(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/mylog-2017-11-04'
+      with open(filename, 'wb') as f:
+        f.write(DATA)
+      compressed = compress_file(filename)
+
+      reader = BlockGzipReader(compressed)
+      self.assertGreater(len(reader.block_offsets), 3)
+      self.assertEqual(len(DATA), reader.size)
+      for offset in [0, 1, BLOCK_SIZE - 1, BLOCK_SIZE, BLOCK_SIZE + 17,
+                     len(DATA) - 5, len(DATA)]:
+        reader.seek(offset)
+        self.assertEqual(DATA[offset:offset + 100], reader.read(100))
+        self.assertEqual(min(offset + 100, len(DATA)), reader.tell())
+      reader.close()
+
+      with open_file(compressed, 'rb') as f:
+        self.assertEqual(len(DATA), data_size(f))
+        f.seek(BLOCK_SIZE - 10)
+        self.assertEqual(DATA[BLOCK_SIZE - 10:BLOCK_SIZE * 2],
+                         f.read(BLOCK_SIZE + 10))
+      with open_file(compressed) as f:
+        self.assertEqual(LINES[0] + '\n', f.readline())
+        self.assertEqual(LINES[1:], f.read().rstrip().split('\n'))
+
+      with open(filename, 'wb') as f:
+        f.write(b'not compressed')
+      with self.assertRaises(ValueError):
+        BlockGzipReader(filename)
+
+  ############################
+  def test_plain_gzip(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/mylog-2017-11-04.gz'
+      with gzip.open(filename, 'wb') as f:
+        f.write(DATA)
+      self.assertFalse(is_block_gzip(filename))
+      with open_file(filename, 'rb') as f:
+        self.assertEqual(len(DATA), data_size(f))
+        f.seek(1000)
+        self.assertEqual(DATA[1000:1100], f.read(100))
+      with open_file(filename) as f:
+        self.assertEqual(LINES, f.read().rstrip().split('\n'))
+      with self.assertRaises(ValueError):
+        open_file(filename, 'w')
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -2,6 +2,7 @@
 
 import json
 import logging
+import pickle
 import sys
 import unittest
 import warnings
@@ -47,6 +48,61 @@ class TestDASRecord(unittest.TestCase):
 
     self.assertDictEqual(json.loads(dr.as_json()), json.loads(JSON_IN))
 
+  def test_slots(self):
+    dr = DASRecord(data_id='gyr1', fields={'GYR_Heading': 314.15})
+    self.assertFalse(hasattr(dr, '__dict__'))
+    with self.assertRaises(AttributeError):
+      dr.not_a_field = 1
+
+    # Must still survive the trip to and from a worker process
+    self.assertEqual(pickle.loads(pickle.dumps(dr)), dr)
+
+  def test_from_json(self):
+    dr = DASRecord(json=JSON_IN)
+    from_json = DASRecord.from_json(dr.as_json())
+    self.assertEqual(from_json, dr)
+    self.assertEqual(from_json.fields['GYR_Acc'], 0.11)
+
+    # Missing keys get the same defaults as the constructor
+    from_json = DASRecord.from_json('{"data_id": "gyr1"}')
+    self.assertEqual(from_json.data_id, 'gyr1')
+    self.assertEqual(from_json.timestamp, None)
+    self.assertEqual(from_json.fields, {})
+    self.assertEqual(from_json.metadata, {})
+
+  def test_as_json_matches_dumps(self):
+    records = [
+      DASRecord(json=JSON_IN),
+      DASRecord(data_id='s330', message_type='$GPGGA', timestamp=1510265335.5,
+                fields={'S330Lat': 5.0, 'S330Sats': 8, 'S330Mode': None,
+                        'S330Name': 'caf\u00e9 "quoted"',
+                        'S330NaN': float('nan'), 'S330Inf': float('inf')}),
+      DASRecord(data_id=None, message_type=None, timestamp=1510265335,
+                fields={}, metadata={}),
+    ]
+    for dr in records:
+      expected = json.dumps({'data_id': dr.data_id,
+                             'message_type': dr.message_type,
+                             'timestamp': dr.timestamp,
+                             'fields': dr.fields,
+                             'metadata': dr.metadata})
+      self.assertEqual(dr.as_json(), expected)
+
+  def test_eq(self):
+    dr = DASRecord(json=JSON_IN)
+    self.assertEqual(dr, dr)
+    self.assertEqual(dr, DASRecord(json=JSON_IN))
+    self.assertNotEqual(dr, 'not a record')
+    self.assertNotEqual(dr, None)
+
+    other = DASRecord(json=JSON_IN)
+    other.timestamp += 1
+    self.assertNotEqual(dr, other)
+
+    other = DASRecord(json=JSON_IN)
+    other.metadata['status'] = 'bad'
+    self.assertNotEqual(dr, other)
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
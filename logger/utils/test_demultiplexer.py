@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import logging
+import queue
+import socket
+import sys
+import unittest
+
+sys.path.append('.')
+
+from logger.utils.demultiplexer import UDPDemultiplexer, shared_demultiplexer
+
+PACKETS = [b'gyr1 2017-11-04T05:12:19.441672Z $HEHDT,235.95,T*14',
+           b'knud 2017-11-04T05:12:19.508844Z 3.5kHz,5266.11,0,,,,1500,-72.1',
+           b'gyr1\t2017-11-04T05:12:19.694566Z $HEHDT,235.95,T*14',
+           b'gyr10 2017-11-04T05:12:19.7Z not gyr1',
+           b'',
+           b'seap 2017-11-04T05:12:20.113214Z $GPZDA,000000.00,04,11,2017,,*6E']
+
+class TestUDPDemultiplexer(unittest.TestCase):
+  ############################
+  def test_route(self):
+    demux = UDPDemultiplexer(8030)
+    gyr1 = queue.Queue()
+    gyr1_knud = queue.Queue()
+    everything = queue.Queue()
+    full = queue.Queue(maxsize=1)
+    demux.subscribe(gyr1, ['gyr1'])
+    demux.subscribe(gyr1_knud, ['gyr1', 'knud'])
+    demux.subscribe(everything)
+    demux.subscribe(full, ['seap', 'gyr10'])
+
+    sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, True)
+    sock.connect(('<broadcast>', 8030))
+    for packet in PACKETS:
+      sock.send(packet)
+    for packet in PACKETS:
+      self.assertEqual(packet, everything.get(timeout=5))
+
+    def contents(q):
+      result = []
+      while not q.empty():
+        result.append(q.get())
+      return result
+    self.assertEqual([PACKETS[0], PACKETS[2]], contents(gyr1))
+    self.assertEqual(PACKETS[0:3], contents(gyr1_knud))
+    # Consumers that fall behind miss out
+    self.assertEqual([PACKETS[3]], contents(full))
+    self.assertEqual(1, demux.num_dropped)
+
+    # After unsubscribing, we get nothing
+    demux.unsubscribe(gyr1)
+    demux.unsubscribe(everything)
+    self.assertEqual([gyr1_knud], demux.routes[b'gyr1'])
+    self.assertEqual([], demux.catch_all)
+    sock.send(PACKETS[0])
+    self.assertEqual(PACKETS[0], gyr1_knud.get(timeout=5))
+    self.assertTrue(gyr1.empty())
+    self.assertTrue(everything.empty())
+
+    demux.close()
+    self.assertFalse(demux.thread.is_alive())
+    sock.close()
+
+  ############################
+  def test_shared_demultiplexer(self):
+    demux = shared_demultiplexer(8031)
+    self.assertIs(demux, shared_demultiplexer(8031))
+    demux.close()
+    new_demux = shared_demultiplexer(8031)
+    self.assertIsNot(demux, new_demux)
+    new_demux.close()
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
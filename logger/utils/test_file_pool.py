@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from unittest import mock
+
+sys.path.append('.')
+
+from logger.utils import file_pool
+from logger.utils.file_pool import FilePool, shared_pool
+
+class TestFilePool(unittest.TestCase):
+  ############################
+  def test_write(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      pool = FilePool(max_open_files=3)
+      expected = {}
+      for i in range(200):
+        filename = '%s/subdir/f%d' % (tmpdirname, i % 7)
+        text = 'line %d\n' % i
+        pool.write(filename, text)
+        expected[filename] = expected.get(filename, '') + text
+        # Never more than max_open_files open at once
+        self.assertLessEqual(len(pool.files), 3)
+      pool.sync()
+      self.assertLessEqual(len(pool.files), 3)
+      for filename, text in expected.items():
+        with open(filename) as f:
+          self.assertEqual(text, f.read())
+      pool.shutdown()
+      self.assertEqual({}, pool.files)
+      self.assertFalse(pool.thread.is_alive())
+
+  ############################
+  def test_close_file(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      pool = FilePool()
+      filename = tmpdirname + '/f'
+      closed = threading.Event()
+      pool.write(filename, 'line 1\n')
+      pool.close_file(filename, closed.set)
+      self.assertTrue(closed.wait(5))
+      self.assertNotIn(filename, pool.files)
+      with open(filename) as f:
+        self.assertEqual('line 1\n', f.read())
+
+      # Writing again reopens it for appending
+      pool.write(filename, 'line 2\n')
+      pool.shutdown()
+      with open(filename) as f:
+        self.assertEqual('line 1\nline 2\n', f.read())
+
+  ############################
+  def test_errors(self):
+    with self.assertRaises(ValueError):
+      FilePool(max_open_files=0)
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      pool = FilePool()
+      with self.assertLogs(logging.getLogger(), logging.ERROR):
+        pool.write(tmpdirname, 'a directory is not a file\n')
+        pool.sync()
+      pool.shutdown()
+
+  ############################
+  def test_retry(self):
+    # Records for a file we can't open are kept until we can.
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      blocker = tmpdirname + '/subdir'
+      filename = blocker + '/f'
+      with open(blocker, 'w') as f:
+        f.write('not a directory\n')
+      with mock.patch.object(file_pool, 'RETRY_INTERVAL', 0.1):
+        pool = FilePool()
+        with self.assertLogs(logging.getLogger(), logging.ERROR):
+          pool.write(filename, 'line 1\n')
+          pool.sync()
+        pool.write(filename, 'line 2\n')
+        pool.sync()
+        os.remove(blocker)
+        time.sleep(0.5)
+        with open(filename) as f:
+          self.assertEqual('line 1\nline 2\n', f.read())
+
+        # If we still can't by the time the file's closed, give up
+        with self.assertLogs(logging.getLogger(), logging.ERROR) as logs:
+          pool.write(tmpdirname, 'a directory is not a file\n')
+          pool.close_file(tmpdirname)
+          pool.sync()
+        self.assertIn('dropping 1 records', logs.output[-1])
+        pool.shutdown()
+
+  ############################
+  def test_full_queue(self):
+    # When the disk can't keep up, writes are dropped rather than
+    # holding up the caller - unless the pool's told to wait.
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/f'
+      release = threading.Event()
+      pool = FilePool(queue_size=2)
+      pool.close_file(filename, lambda: release.wait(5))  # stall the thread
+      time.sleep(0.1)
+      start = time.time()
+      with self.assertLogs(logging.getLogger(), logging.WARNING):
+        for i in range(5):
+          pool.write(filename, 'line %d\n' % i)
+      self.assertLess(time.time() - start, 0.5)
+      self.assertEqual(3, pool.num_dropped)
+      release.set()
+      pool.sync()
+      with open(filename) as f:
+        self.assertEqual('line 0\nline 1\n', f.read())
+
+      pool.put_timeout = 0.2
+      pool.close_file(filename, lambda: release.wait(5))
+      release.clear()
+      time.sleep(0.1)
+      pool.write(filename, 'line 5\n')
+      pool.write(filename, 'line 6\n')
+      start = time.time()
+      pool.write(filename, 'line 7\n')
+      self.assertGreaterEqual(time.time() - start, 0.2)
+      self.assertEqual(4, pool.num_dropped)
+      release.set()
+      pool.shutdown()
+      with open(filename) as f:
+        self.assertEqual('line 0\nline 1\nline 5\nline 6\n', f.read())
+
+  ############################
+  def test_shutdown(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      pool = FilePool()
+      self.assertIsNone(pool.thread)  # not started until needed
+      pool.write(tmpdirname + '/f', 'line 1\n')
+      pool.shutdown()
+      with self.assertRaises(ValueError):
+        pool.write(tmpdirname + '/f', 'line 2\n')
+      with self.assertRaises(ValueError):
+        pool.close_file(tmpdirname + '/f')
+      pool.sync()
+      pool.shutdown()
+      with open(tmpdirname + '/f') as f:
+        self.assertEqual('line 1\n', f.read())
+
+  ############################
+  def test_fork(self):
+    # A pool created (and used) before a fork works in the child.
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      pool = FilePool()
+      pool.write(tmpdirname + '/parent', 'parent line\n')
+      pid = os.fork()
+      if pid == 0:
+        pool.write(tmpdirname + '/child', 'child line\n')
+        pool.sync()
+        os._exit(0)
+      (_, status) = os.waitpid(pid, 0)
+      self.assertEqual(0, status)
+      pool.shutdown()
+      with open(tmpdirname + '/parent') as f:
+        self.assertEqual('parent line\n', f.read())
+      with open(tmpdirname + '/child') as f:
+        self.assertEqual('child line\n', f.read())
+
+  ############################
+  def test_shared_pool(self):
+    self.assertIs(shared_pool(), shared_pool())
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from unittest import mock
+
+sys.path.append('.')
+
+from logger.utils import file_watcher
+from logger.utils.file_watcher import FileWatcher
+
+def append_line(filename, delay):
+  time.sleep(delay)
+  with open(filename, 'a') as f:
+    f.write('line\n')
+
+class TestFileWatcher(unittest.TestCase):
+  ############################
+  def test_inotify(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      watcher = FileWatcher([tmpdirname])
+      if not watcher.event_driven():
+        self.skipTest('inotify not available')
+
+      # Nothing happening: time out
+      self.assertFalse(watcher.wait(0.05))
+
+      # New file, then appends to it, wake us up well before the timeout
+      filename = os.path.join(tmpdirname, 'f1')
+      for i in range(2):
+        threading.Thread(target=append_line, args=(filename, 0.1)).start()
+        start = time.time()
+        self.assertTrue(watcher.wait(10))
+        self.assertLess(time.time() - start, 5)
+        time.sleep(0.05)
+        watcher.wait(0)  # drain any trailing events
+
+      # Watching a directory twice is harmless; watching a nonexistent
+      # one logs a warning.
+      watcher.watch([tmpdirname])
+      self.assertEqual(1, len(watcher.watched))
+      with self.assertLogs(logging.getLogger(), logging.WARNING):
+        watcher.watch([tmpdirname + '/nonexistent'])
+
+      # ...and means we can no longer rely on events, until it shows up
+      self.assertFalse(watcher.event_driven())
+      os.mkdir(tmpdirname + '/nonexistent')
+      watcher.watch([tmpdirname + '/nonexistent'])
+      self.assertTrue(watcher.event_driven())
+      watcher.close()
+      self.assertFalse(watcher.event_driven())
+
+  ############################
+  def test_network_filesystem(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      if not FileWatcher([tmpdirname]).event_driven():
+        self.skipTest('inotify not available')
+      self.assertIsNotNone(file_watcher.filesystem_type(tmpdirname))
+
+      # inotify won't see other hosts' writes, so don't pretend to
+      with mock.patch.object(file_watcher, 'filesystem_type',
+                             return_value='nfs'):
+        watcher = FileWatcher([tmpdirname])
+      self.assertFalse(watcher.event_driven())
+      self.assertEqual({tmpdirname: 'nfs'}, watcher.unwatched)
+      watcher.close()
+
+  ############################
+  def test_polling(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      watcher = FileWatcher([tmpdirname], use_inotify=False)
+      self.assertFalse(watcher.event_driven())
+      start = time.time()
+      self.assertTrue(watcher.wait(0.1))
+      self.assertGreaterEqual(time.time() - start, 0.1)
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -15,6 +15,9 @@ class TestFormat(unittest.TestCase):
     self.assertTrue(formats.JSON.can_accept(formats.JSON_Record))
     self.assertTrue(formats.JSON_Record.can_accept(formats.JSON_Record))
     self.assertFalse(formats.JSON_Record.can_accept(formats.JSON))
+    self.assertTrue(formats.Binary.can_accept(formats.Binary_Record))
+    self.assertFalse(formats.Text.can_accept(formats.Binary_Record))
+    self.assertFalse(formats.Binary_Record.can_accept(formats.Python_Record))
     
   def test_common(self):
     self.assertEqual(formats.Python_Record.common(formats.JSON_Record),
@@ -23,6 +26,8 @@ class TestFormat(unittest.TestCase):
                      formats.Python)
     self.assertEqual(formats.JSON_Record.common(formats.JSON_Record),
                      formats.JSON_Record)
+    self.assertEqual(formats.Binary_Record.common(formats.JSON_Record),
+                     formats.Bytes)
 
   def test_unknown(self):
     self.assertFalse(formats.Unknown.can_accept(formats.JSON_Record))
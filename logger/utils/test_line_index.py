@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+
+sys.path.append('.')
+
+from logger.utils.line_index import LineIndex, index_filename
+
+LINES = ['line %d %s' % (i, 'x' * (i % 7)) for i in range(23)]
+
+################################################################################
+class TestLineIndex(unittest.TestCase):
+
+  ############################
+  def check_offsets(self, filename, line_index):
+    with open(filename, 'rb') as f:
+      data = f.read()
+    starts = [0]
+    for line in data.splitlines(keepends=True):
+      starts.append(starts[-1] + len(line))
+    num_lines = len(starts) - 1
+    self.assertEqual(line_index.num_lines(), num_lines)
+    for line_number in range(num_lines + 3):
+      self.assertEqual(line_index.offset(line_number),
+                       starts[min(line_number, num_lines)])
+    for line_number, start in enumerate(starts):
+      self.assertEqual(line_index.line_number(start), line_number)
+
+  ############################
+  def test_offsets(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/log'
+      with open(filename, 'w') as f:
+        f.write('\n'.join(LINES) + '\n')
+
+      for interval in [1, 2, 5, 23, 100]:
+        self.check_offsets(filename, LineIndex(filename, interval=interval,
+                                               save=False))
+      with self.assertRaises(ValueError):
+        LineIndex(filename, interval=0)
+      with self.assertRaises(ValueError):
+        LineIndex(filename).offset(-1)
+
+      # A last line without a newline still counts
+      with open(filename, 'a') as f:
+        f.write('partial')
+      self.check_offsets(filename, LineIndex(filename, interval=5,
+                                             save=False))
+
+      with open(filename, 'w') as f:
+        pass
+      line_index = LineIndex(filename, save=False)
+      self.assertEqual(line_index.num_lines(), 0)
+      self.assertEqual(line_index.offset(3), 0)
+
+  ############################
+  def test_growth_and_invalidation(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/log'
+      with open(filename, 'w') as f:
+        f.write('\n'.join(LINES[:10]) + '\n')
+      line_index = LineIndex(filename, interval=3)
+      self.check_offsets(filename, line_index)
+
+      # Grow the file, including a partial line, then complete it
+      with open(filename, 'a') as f:
+        f.write('\n'.join(LINES[10:20]))
+      self.check_offsets(filename, line_index)
+      with open(filename, 'a') as f:
+        f.write('\n' + '\n'.join(LINES[20:]) + '\n')
+      self.check_offsets(filename, line_index)
+
+      # Shrink it; index should notice and rebuild
+      with open(filename, 'w') as f:
+        f.write('\n'.join(LINES[:4]) + '\n')
+      self.check_offsets(filename, line_index)
+
+      # Replace it with a file whose lines fall in different places
+      os.remove(filename)
+      with open(filename, 'w') as f:
+        f.write('a\nbb\nc\nddd\n' + 'e' * 28 + '\n')
+      self.check_offsets(filename, line_index)
+
+  ############################
+  def test_sidecar(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/log'
+      with open(filename, 'w') as f:
+        f.write('\n'.join(LINES) + '\n')
+
+      index_file = index_filename(filename)
+      self.assertEqual(index_file, tmpdirname + '/.log.lineidx')
+      # Only saved if asked
+      LineIndex(filename, interval=4).num_lines()
+      self.assertFalse(os.path.exists(index_file))
+      line_index = LineIndex(filename, interval=4, save=True)
+      line_index.num_lines()
+      self.assertTrue(os.path.exists(index_file))
+
+      # A new index picks up the saved offsets without rescanning
+      # anything but the lines after the last one.
+      reloaded = LineIndex(filename, interval=4, save=True)
+      reloaded._load()
+      self.assertEqual(list(reloaded.offsets), list(line_index.offsets))
+      self.assertEqual(reloaded.num_complete, line_index.num_complete)
+      self.check_offsets(filename, reloaded)
+
+      # Saved indexes with a different interval are ignored
+      self.check_offsets(filename, LineIndex(filename, interval=5, save=True))
+
+      # Sidecars aren't pickles: a planted one is ignored, not executed
+      class Exploit:
+        def __reduce__(self):
+          return (os.mkdir, (tmpdirname + '/pwned',))
+      with open(index_file, 'wb') as f:
+        pickle.dump(Exploit(), f)
+      with self.assertLogs(level='WARNING'):
+        self.check_offsets(filename, LineIndex(filename, interval=4,
+                                               save=True))
+      self.assertFalse(os.path.exists(tmpdirname + '/pwned'))
+
+      # Index somewhere else if asked, or nowhere if we can't
+      index_dir = tmpdirname + '/indexes'
+      os.mkdir(index_dir)
+      LineIndex(filename, save=True, index_dir=index_dir).num_lines()
+      self.assertTrue(os.path.exists(index_dir + '/.log.lineidx'))
+
+      line_index = LineIndex(filename, save=True,
+                             index_dir=tmpdirname + '/missing')
+      self.check_offsets(filename, line_index)
+      self.assertIsNone(line_index.index_file)
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
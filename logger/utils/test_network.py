@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import unittest
+
+sys.path.append('.')
+
+from logger.utils.network import parse_network, frame, split_records
+from logger.utils.network import RecordAssembler, is_multicast
+
+RECORDS = [b'gyr1 2017-11-04T05:12:19.441672Z $HEHDT,235.95,T*14',
+           b'',
+           b'tmi ' + b'x' * 20000,
+           b'\x00\n\xff binary\n']
+
+class TestNetwork(unittest.TestCase):
+  ############################
+  def test_parse_network(self):
+    self.assertEqual(('rvdas', 6202), parse_network('rvdas:6202', 'Test'))
+    self.assertEqual(('', 6202), parse_network(':6202', 'Test'))
+    with self.assertRaises(ValueError):
+      parse_network('6202', 'Test')
+    with self.assertRaises(ValueError):
+      parse_network('rvdas:port', 'Test')
+
+  ############################
+  def test_is_multicast(self):
+    self.assertTrue(is_multicast('239.192.0.1'))
+    self.assertTrue(is_multicast('224.0.0.251'))
+    for host in ['', 'rvdas', '192.168.1.255', '<broadcast>', '::1']:
+      self.assertFalse(is_multicast(host))
+
+  ############################
+  def test_assemble(self):
+    for framing, records in [('newline', RECORDS[:3]), ('length', RECORDS)]:
+      stream = b''.join([frame(r, framing) for r in records])
+      # However the stream is chopped up, we get the records back
+      for chunk_size in [1, 7, 4096, len(stream)]:
+        assembler = RecordAssembler(framing)
+        result = []
+        for i in range(0, len(stream), chunk_size):
+          result.extend(assembler.feed(stream[i:i + chunk_size]))
+        self.assertEqual(records, result)
+        self.assertEqual(b'', assembler.buffer)
+
+  ############################
+  def test_split_records(self):
+    for framing, records in [('newline', RECORDS[:3]), ('length', RECORDS)]:
+      data = b''.join([frame(r, framing) for r in records])
+      self.assertEqual(records, split_records(data, framing))
+      with self.assertRaises(ValueError):
+        split_records(data[:-1], framing)
+
+  ############################
+  def test_max_record_size(self):
+    with self.assertRaises(ValueError):
+      RecordAssembler('carrier pigeon')
+    for framing in ['newline', 'length']:
+      assembler = RecordAssembler(framing, max_record_size=10)
+      self.assertEqual([b'short'], assembler.feed(frame(b'short', framing)))
+      with self.assertRaises(ValueError):
+        assembler.feed(frame(b'much too long', framing))
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
+import json
 import logging
+import math
+import os
+import pickle
 import pprint
 import sys
 import tempfile
@@ -9,9 +13,12 @@ import time
 import unittest
 import warnings
 
+from unittest import mock
+
 sys.path.append('.')
 
-from logger.utils.nmea_parser import NMEAParser
+from logger.utils import nmea_parser
+from logger.utils.nmea_parser import NMEAParser, bad_checksum, checksum
 
 GYR1_RECORDS = """gyr1 2017-11-10T01:00:06.739Z $HEHDT,143.7,T*2E
 gyr1 2017-11-10T01:00:06.739Z $HEROT,-0000.8,A*3E
@@ -293,7 +300,180 @@ class TestNMEAParser(unittest.TestCase):
     self.assertDictEqual(nmea, {'Roll': -1.47, 'HeadingTrue': 235.77,
                                 'Pitch': 0.01, 'Heave': -0.38})
 
-  
+  ############################
+  def test_parse_records_batch(self):
+    p = NMEAParser()
+    lines = SEAP_RECORDS + GRV1_RECORDS + ['seap garbage', '']
+    with self.assertLogs(logging.getLogger(), logging.ERROR):
+      results = p.parse_records(iter(lines))
+
+    # Should agree with what we get record by record
+    records = [p.parse_record(line) for line in SEAP_RECORDS + GRV1_RECORDS]
+    self.assertEqual(sum(len(batch) for batch in results.values()),
+                     len(records))
+    for key, batch in results.items():
+      self.assertEqual((batch.data_id, batch.message_type), key)
+      matching = [r for r in records
+                  if (r.data_id, r.message_type) == key]
+      self.assertEqual(list(batch.timestamps),
+                       [r.timestamp for r in matching])
+      for field, column in batch.fields.items():
+        expected = [r.fields[field] for r in matching]
+        if getattr(column, 'typecode', None) == 'd':
+          column = [None if math.isnan(v) else v for v in column]
+        self.assertEqual(list(column), expected)
+      self.assertEqual(batch.records(), matching)
+
+    psxn_23 = results[('seap', '$PSXN-23')]
+    self.assertEqual(psxn_23.timestamps.typecode, 'd')
+    self.assertEqual(psxn_23.fields['Seap200Roll'].typecode, 'd')
+    self.assertEqual(list(psxn_23.fields['Seap200Roll']), [-1.47, -1.52])
+    grv1 = results[('grv1', '')]
+    self.assertEqual(grv1.fields['Grav1ValueMg'].typecode, 'q')
+
+    # Empty float values come back as NaN
+    results = p.parse_records([
+      'seap 2017-11-04T07:00:39.547251Z $PSXN,22,,0.74*3A',
+      'seap 2017-11-04T07:00:41.335040Z $PSXN,22,0.44,0.74*3A'])
+    gyro_cal = results[('seap', '$PSXN-22')].fields['Seap200GyroCal']
+    self.assertTrue(math.isnan(gyro_cal[0]))
+    self.assertEqual(gyro_cal[1], 0.44)
+
+  ############################
+  def test_checksum(self):
+    self.assertEqual(checksum('$HEHDT,143.7,T*2E'), '2E')
+    self.assertEqual(checksum('$HEHDT,143.7,T'), '2E')
+    self.assertFalse(bad_checksum('$HEHDT,143.7,T*2E'))
+    self.assertFalse(bad_checksum('$KIDPT,5130.92,7.10,12000.0*79'))
+    self.assertFalse(bad_checksum('$GPGLL,3934.820,S,03727.675,W'))
+    self.assertTrue(bad_checksum('$HEHDT,148.7,T*2E'))
+    self.assertTrue(bad_checksum('$HEHDT,143.7,T*2F'))
+
+    good = GYR1_RECORDS[0]
+    bad = 'gyr1 2017-11-10T01:00:06.739Z $HEHDT,148.7,T*2E'
+
+    # Without checking, the corrupted record gets through
+    p = NMEAParser()
+    self.assertDictEqual(p.parse_record(bad).fields,
+                         {'Gyro1HeadingTrue': 148.7})
+    self.assertEqual(p.checksum_errors, {})
+
+    p = NMEAParser(check_checksum=True)
+    self.assertDictEqual(p.parse_record(good).fields,
+                         {'Gyro1HeadingTrue': 143.7})
+    with self.assertLogs(logging.getLogger(), logging.WARNING):
+      self.assertEqual(p.parse_record(bad), None)
+    self.assertEqual(p.parse_record(bad), None)
+    self.assertEqual(p.checksum_errors, {'gyr1': 2})
+
+    # Records with no checksum are still parsed
+    self.assertEqual(p.parse_record(GP02_RECORDS[0]).message_type, '$GPZDA')
+
+    results = p.parse_records([good, bad, good])
+    self.assertEqual(len(results[('gyr1', '$HEHDT')]), 2)
+    self.assertEqual(p.checksum_errors, {'gyr1': 3})
+
+  ############################
+  def test_definition_cache(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      for kind in ['message', 'sensor', 'sensor_model']:
+        os.mkdir(tmpdirname + '/' + kind)
+      def write_defs(kind, name, defs):
+        with open('%s/%s/%s.json' % (tmpdirname, kind, name), 'w') as f:
+          f.write('// comment\n' + json.dumps(defs))
+
+      write_defs('sensor_model', 'Gyro', {'Gyro': {'fields': [['Head', 'float']]}})
+      write_defs('sensor', 'gyr9', {'gyr9': {'model': 'Gyro',
+                                             'fields': {'Head': 'G9Head'}}})
+      kwargs = {
+        'message_path': tmpdirname + '/message/*.json',
+        'sensor_path': tmpdirname + '/sensor/*.json',
+        'sensor_model_path': tmpdirname + '/sensor_model/*.json',
+        'definition_cache_file': tmpdirname + '/defs.json',
+      }
+      p1 = NMEAParser(**kwargs)
+      with open(tmpdirname + '/defs.json') as f:
+        self.assertIn(os.path.abspath(tmpdirname + '/sensor/gyr9.json'),
+                      json.load(f))
+      self.assertEqual(p1.parse_record('gyr9 2017-11-10T01:00:06.739Z 12.5')
+                       .fields, {'G9Head': 12.5})
+
+      # A second parser shares definitions without re-reading them
+      with mock.patch.object(nmea_parser.read_json, 'read_json') as read:
+        p2 = NMEAParser(**kwargs)
+        read.assert_not_called()
+      self.assertIs(p1.sensors, p2.sensors)
+
+      # ...as does one in a "new process" with an empty in-memory cache
+      with mock.patch.dict(nmea_parser._file_definitions, clear=True), \
+           mock.patch.dict(nmea_parser._path_definitions, clear=True), \
+           mock.patch.object(nmea_parser, '_loaded_cache_files', set()), \
+           mock.patch.object(nmea_parser.read_json, 'read_json') as read:
+        p3 = NMEAParser(**kwargs)
+        read.assert_not_called()
+        self.assertEqual(p3.sensors, p1.sensors)
+
+      # A cache file that isn't our JSON (e.g. a pickle planted in a
+      # shared directory) is ignored, not executed
+      class Exploit:
+        def __reduce__(self):
+          return (os.mkdir, (tmpdirname + '/pwned',))
+      with open(tmpdirname + '/defs.json', 'wb') as f:
+        pickle.dump({'x': Exploit()}, f)
+      with mock.patch.dict(nmea_parser._file_definitions, clear=True), \
+           mock.patch.dict(nmea_parser._path_definitions, clear=True), \
+           mock.patch.object(nmea_parser, '_loaded_cache_files', set()):
+        with self.assertLogs(level='WARNING'):
+          p5 = NMEAParser(**kwargs)
+        self.assertEqual(p5.sensors, p1.sensors)
+      self.assertFalse(os.path.exists(tmpdirname + '/pwned'))
+
+      # Changing a file gets picked up on refresh
+      self.assertFalse(p1.refresh_definitions())
+      write_defs('sensor', 'gyr9', {'gyr9': {'model': 'Gyro',
+                                             'fields': {'Head': 'G9Heading'}}})
+      os.utime(tmpdirname + '/sensor/gyr9.json', ns=(1, 1))
+      self.assertTrue(p1.refresh_definitions())
+      self.assertEqual(p1.parse_record('gyr9 2017-11-10T01:00:06.739Z 12.5')
+                       .fields, {'G9Heading': 12.5})
+
+      # ...and automatically, if refresh_interval is set
+      p4 = NMEAParser(refresh_interval=0.01, **kwargs)
+      write_defs('sensor', 'gyr8', {'gyr8': {'model': 'Gyro',
+                                             'fields': {'Head': 'G8Head'}}})
+      time.sleep(0.02)
+      self.assertEqual(p4.parse_record('gyr8 2017-11-10T01:00:06.739Z 1.5')
+                       .fields, {'G8Head': 1.5})
+
+  ############################
+  def test_compiled_plans(self):
+    p = NMEAParser()
+
+    # Parsing a second time should go through the cached plans and
+    # give the same answer.
+    for line in SEAP_RECORDS + GRV1_RECORDS + SEAP_RECORDS + GRV1_RECORDS:
+      first = p.parse_record(line)
+      self.assertEqual(first, p.parse_record(line))
+    self.assertEqual(sorted(p._sensor_plans), ['grv1', 'seap'])
+    self.assertEqual(sorted(p._model_plans['Seapath200'].messages['$PSXN']),
+                     ['20', '22', '23'])
+
+    # Bad values, wrong field counts and unknown message types still
+    # get rejected once plans have been compiled.
+    with self.assertLogs(logging.getLogger(), logging.ERROR):
+      self.assertEqual(p.parse_record(
+        'seap 2017-11-04T07:00:39.547251Z $PSXN,22,x.44,0.74*3A'), None)
+    with self.assertLogs(logging.getLogger(), logging.ERROR):
+      self.assertEqual(p.parse_record(
+        'seap 2017-11-04T07:00:39.547251Z $PSXN,22,0.44*3A'), None)
+    with self.assertLogs(logging.getLogger(), logging.ERROR):
+      self.assertEqual(p.parse_record(
+        'seap 2017-11-04T07:00:39.547251Z $PSXN,99,0.44,0.74*3A'), None)
+    with self.assertLogs(logging.getLogger(), logging.ERROR):
+      self.assertEqual(p.parse_record(
+        'seap 2017-11-04T07:00:39.547251Z $PSXN'), None)
+
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import unittest
+
+sys.path.append('.')
+
+from logger.utils.das_record import DASRecord
+from logger.utils.qc import FieldQC, QCEngine
+from logger.utils.qc import QC_NON_NUMERIC, QC_BELOW_MIN, QC_ABOVE_MAX
+from logger.utils.qc import QC_RATE, QC_STUCK, QC_SPIKE, QC_GAP
+from logger.utils.record_batch import RecordBatch, typed_column
+
+################################################################################
+class TestFieldQC(unittest.TestCase):
+
+  ############################
+  def test_bounds(self):
+    qc = FieldQC(lower=0, upper=10)
+    self.assertEqual(qc.check(5, 1), 0)
+    self.assertEqual(qc.check(-1, 2), QC_BELOW_MIN)
+    self.assertEqual(qc.check(11.5, 3), QC_ABOVE_MAX)
+    self.assertEqual(qc.check('5', 4), QC_NON_NUMERIC)
+    self.assertEqual(qc.check(None, 5), QC_NON_NUMERIC)
+    self.assertEqual(qc.check(float('nan'), 6), 0)
+    self.assertEqual(qc.check(True, 7), QC_NON_NUMERIC)
+
+  ############################
+  def test_rate(self):
+    qc = FieldQC(max_rate=2)
+    self.assertEqual(qc.check(0, 0), 0)
+    self.assertEqual(qc.check(3, 2), 0)        # 1.5/sec
+    self.assertEqual(qc.check(6, 3), QC_RATE)  # 3/sec
+    self.assertEqual(qc.check(4, 4), 0)        # -2/sec
+    self.assertEqual(qc.check('x', 5), QC_NON_NUMERIC)
+    self.assertEqual(qc.check(5, 6), 0)        # measured from last number
+    self.assertEqual(qc.check(float('nan'), 7), 0)
+    self.assertEqual(qc.check(12, 8), QC_RATE)  # NaN doesn't count
+
+  ############################
+  def test_stuck(self):
+    qc = FieldQC(stuck_count=3)
+    flags = [qc.check(v, t) for t, v in enumerate([1, 1, 1, 1, 2, 2, 1])]
+    self.assertEqual(flags, [0, 0, QC_STUCK, QC_STUCK, 0, 0, 0])
+    with self.assertRaises(ValueError):
+      FieldQC(stuck_count=1)
+
+  ############################
+  def test_spike(self):
+    qc = FieldQC(spike_threshold=5, spike_window=3)
+    values = [10, 11, 9, 30, 10, 10, 20, 20, 20, 20]
+    flags = [qc.check(v, t) for t, v in enumerate(values)]
+    # A lone spike doesn't get its neighbors flagged; a step change is
+    # flagged until it's the median.
+    self.assertEqual(flags, [0, 0, 0, QC_SPIKE, 0,
+                             0, QC_SPIKE, QC_SPIKE, 0, 0])
+
+  ############################
+  def test_check_column(self):
+    qc = FieldQC(lower=0, upper=10)
+    self.assertIsNone(qc.check_column(typed_column([1, 2, 3]), [1, 2, 3]))
+    self.assertIsNone(qc.check_column(typed_column([1.0, 2.0]), [1, 2]))
+    # NaNs in float columns are missing values, not bad ones
+    self.assertEqual(list(qc.check_column(typed_column([1.0, None, 20.0]),
+                                          [1, 2, 3])),
+                     [0, 0, QC_ABOVE_MAX])
+    self.assertIsNone(qc.check_column(typed_column([1.0, None]), [1, 2]))
+    self.assertEqual(list(qc.check_column([1, 'a', -1, None], [1, 2, 3, 4])),
+                     [0, QC_NON_NUMERIC, QC_BELOW_MIN, 0])
+
+    # Stateful checks carry on from one column to the next
+    qc = FieldQC(stuck_count=3)
+    self.assertIsNone(qc.check_column(typed_column([1, 2, 2]), [1, 2, 3]))
+    self.assertEqual(list(qc.check_column(typed_column([2, 3]), [4, 5])),
+                     [QC_STUCK, 0])
+
+    # ...skipping missing values
+    qc = FieldQC(max_rate=1)
+    self.assertIsNone(qc.check_column(typed_column([0.0, None, 1.5]),
+                                      [0, 1, 2]))
+
+################################################################################
+class TestQCEngine(unittest.TestCase):
+
+  ############################
+  def test_check(self):
+    engine = QCEngine({'a': FieldQC(upper=10), 'b': FieldQC(max_rate=1)},
+                      max_gap=5)
+    record = DASRecord(data_id='x', timestamp=1, fields={'a': 1, 'b': 1})
+    self.assertEqual(engine.check(record), {})
+
+    record = DASRecord(data_id='x', timestamp=10, fields={'a': 20, 'b': 100})
+    flags = engine.check(record)
+    self.assertEqual(flags, {'timestamp': QC_GAP, 'a': QC_ABOVE_MAX,
+                             'b': QC_RATE})
+    self.assertEqual(engine.describe(flags, record.fields),
+                     ['timestamp: more than 5 seconds since previous record',
+                      'a: 20 > upper bound 10',
+                      'b: 100 changing faster than 1 per second'])
+
+    # Gaps are measured per data_id; missing fields are skipped
+    record = DASRecord(data_id='y', timestamp=20, fields={})
+    self.assertEqual(engine.check(record), {})
+
+    # A NaN isn't a non-numeric value, and isn't out of bounds
+    record = DASRecord(data_id='y', timestamp=21, fields={'a': float('nan')})
+    self.assertEqual(engine.check(record), {})
+
+  ############################
+  def test_data_ids(self):
+    # Each data_id's values are only compared with its own
+    engine = QCEngine({'a': FieldQC(max_rate=1, stuck_count=2)})
+    records = [DASRecord(data_id='x', timestamp=0, fields={'a': 0.0}),
+               DASRecord(data_id='y', timestamp=0.5, fields={'a': 100.0}),
+               DASRecord(data_id='x', timestamp=1, fields={'a': 0.5}),
+               DASRecord(data_id='y', timestamp=1.5, fields={'a': 100.0})]
+    self.assertEqual([engine.check(r) for r in records],
+                     [{}, {}, {}, {'a': QC_STUCK}])
+
+    engine = QCEngine({'a': FieldQC(max_rate=1)})
+    for record in records:
+      batch = RecordBatch.from_records([record])
+      self.assertEqual(engine.check_batch(batch), {})
+
+  ############################
+  def test_check_batch(self):
+    fields = {'a': typed_column([1, 20, 3, 3]),
+              'b': typed_column([1.0, 2.0, None, 2.0])}
+    batch = RecordBatch(data_id='x', timestamps=[1, 2, 10, 11], fields=fields)
+
+    def engine():
+      return QCEngine({'a': FieldQC(upper=10, stuck_count=2),
+                       'b': FieldQC(lower=0)}, max_gap=5)
+
+    flags = engine().check_batch(batch)
+    self.assertEqual({k: list(v) for k, v in flags.items()},
+                     {'timestamp': [0, 0, QC_GAP, 0],
+                      'a': [0, QC_ABOVE_MAX, 0, QC_STUCK]})
+
+    # Same as record by record, where the record with a missing 'b'
+    # doesn't have one
+    records = batch.records()
+    del records[2].fields['b']
+    by_record = engine()
+    self.assertEqual([by_record.check(r) for r in records],
+                     [{}, {'a': QC_ABOVE_MAX}, {'timestamp': QC_GAP},
+                      {'a': QC_STUCK}])
+
+    # Nothing to report
+    engine = QCEngine({'a': FieldQC(lower=0, upper=30)})
+    self.assertEqual(engine.check_batch(batch), {})
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(filename)s:%(lineno)d %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import logging
+import math
+import sys
+import unittest
+
+from array import array
+
+sys.path.append('.')
+
+from logger.utils.das_record import DASRecord
+from logger.utils.record_batch import RecordBatch, record_batches
+from logger.utils.record_batch import column_values, typed_column
+
+RECORDS = [
+  DASRecord(data_id='grv1', message_type='', timestamp=1509772341.018622,
+            fields={'Grav1ValueMg': 25876, 'Grav1Error': 0,
+                    'Grav1Temp': 21.5, 'Grav1Status': 'OK'}),
+  DASRecord(data_id='grv1', message_type='', timestamp=1509772341.273413,
+            fields={'Grav1ValueMg': 22013, 'Grav1Error': 0,
+                    'Grav1Temp': None, 'Grav1Status': None}),
+  DASRecord(data_id='grv1', message_type='', timestamp=1509772341.528747,
+            fields={'Grav1ValueMg': 21077, 'Grav1Error': -5,
+                    'Grav1Temp': 21.7, 'Grav1Status': 'OK'}),
+]
+
+################################################################################
+class TestRecordBatch(unittest.TestCase):
+
+  ############################
+  def test_typed_column(self):
+    self.assertEqual(typed_column([1.5, None]).typecode, 'd')
+    self.assertTrue(math.isnan(typed_column([1.5, None])[1]))
+    self.assertEqual(typed_column([1, 2]).typecode, 'q')
+    self.assertEqual(typed_column([1, None]), [1, None])
+    self.assertEqual(typed_column([1, 2.5]), [1, 2.5])
+    self.assertEqual(typed_column([True, False]), [True, False])
+    self.assertEqual(typed_column(['a', None]), ['a', None])
+    self.assertEqual(typed_column([2**70]), [2**70])
+
+    # Trust the converter, if we've been told what it was
+    self.assertEqual(typed_column(['1', '2'], convert=str), ['1', '2'])
+    self.assertEqual(typed_column([None, 2.5], convert=float).typecode, 'd')
+
+    self.assertEqual(column_values(array('d', [1.5, float('nan')])),
+                     [1.5, None])
+    self.assertEqual(column_values(array('q', [1, 2])), [1, 2])
+
+  ############################
+  def test_from_records(self):
+    batch = RecordBatch.from_records(RECORDS)
+    self.assertEqual(len(batch), 3)
+    self.assertEqual(batch.data_id, 'grv1')
+    self.assertEqual(batch.timestamps.typecode, 'd')
+    self.assertEqual(batch.fields['Grav1ValueMg'].typecode, 'q')
+    self.assertEqual(batch.fields['Grav1Temp'].typecode, 'd')
+    self.assertEqual(batch.fields['Grav1Status'], ['OK', None, 'OK'])
+
+    # Round trip, whether we ask for records or iterate
+    self.assertEqual(batch.records(), RECORDS)
+    self.assertEqual(list(batch), RECORDS)
+    self.assertEqual(RecordBatch.from_records(batch), batch)
+
+    self.assertEqual(len(RecordBatch.from_records([])), 0)
+    with self.assertRaises(ValueError):
+      RecordBatch.from_records(RECORDS + [DASRecord(data_id='gyr1')])
+    with self.assertRaises(ValueError):
+      RecordBatch(timestamps=[1, 2], fields={'a': [1]})
+
+  ############################
+  def test_record_batches(self):
+    gyr1 = [DASRecord(data_id='gyr1', message_type='$HEHDT', timestamp=i,
+                      fields={'Gyro1HeadingTrue': 143.7 + i})
+            for i in range(2)]
+    mixed = [RECORDS[0], gyr1[0], RECORDS[1], gyr1[1], RECORDS[2]]
+    batches = record_batches(mixed)
+    self.assertEqual([(b.data_id, len(b)) for b in batches],
+                     [('grv1', 3), ('gyr1', 2)])
+    self.assertEqual(batches[0].records(), RECORDS)
+    self.assertEqual(batches[1].records(), gyr1)
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 
+import logging
 import sys
+import timeit
 import unittest
 
+from datetime import datetime, timedelta, timezone
+
 sys.path.append('.')
 
 from logger.utils import timestamp
@@ -14,15 +18,71 @@ class TestTimestamp(unittest.TestCase):
                            timestamp.timestamp(), places=1)
     self.assertEqual(timestamp.timestamp('1970-01-01T00:00:10.0Z'), 10.0)
 
+  def test_fast_timestamp(self):
+    # Fast path should agree exactly with strptime
+    for time_format in timestamp.FAST_TIME_FORMATS:
+      for time_zone in [timezone.utc, timezone(timedelta(hours=-5))]:
+        for ts in [0, 10.5, 1507810403.33, 1509778839.291859, 951825599.999999]:
+          time_str = timestamp.time_str(ts, time_format=time_format)
+          expected = datetime.strptime(time_str, time_format).replace(
+            tzinfo=time_zone).timestamp()
+          self.assertEqual(timestamp.timestamp(time_str, time_zone=time_zone,
+                                               time_format=time_format),
+                           expected)
+
+    self.assertEqual(timestamp.timestamp('2017-11-10T01:00:06.739Z'),
+                     1510275606.739)
+    self.assertEqual(timestamp.timestamp('2017+314:01:00:06.739',
+                                         time_format='%Y+%j:%H:%M:%S.%f'),
+                     1510275606.739)
+
+    # Badly-formed strings still fall through to (and fail in) strptime
+    for bad in ['2017-11-10T25:00:06.739Z', '2017-13-10T01:00:06.739Z',
+                '2017-11-10T01:00:06.739', 'garbage']:
+      with self.assertRaises(ValueError):
+        timestamp.timestamp(bad)
+
+    # Other formats take the slow path
+    self.assertEqual(timestamp.timestamp('1970-01-01 00:00:10',
+                                         time_format='%Y-%m-%d %H:%M:%S'), 10.0)
+
+  def test_timestamp_benchmark(self):
+    # Timings are logged (run with -v) rather than asserted on, as wall
+    # clock comparisons are unreliable on a loaded machine.
+    time_str = '2017-11-04T05:12:21.511263Z'
+    self.assertEqual(timestamp.timestamp(time_str),
+                     timestamp.datetime_obj(time_str).timestamp())
+    number = 20000
+    fast = timeit.timeit(lambda: timestamp.timestamp(time_str), number=number)
+    slow = timeit.timeit(lambda: timestamp.datetime_obj(time_str).timestamp(),
+                         number=number)
+    logging.info('timestamp(): %.2f usec/call; strptime: %.2f usec/call '
+                 '(%.1fx speedup)', fast / number * 1e6,
+                 slow / number * 1e6, slow / fast)
+
   def test_time_str(self):
     self.assertEqual(timestamp.time_str(1507810403.33),
                      '2017-10-12T12:13:23.330000Z')
     self.assertEqual(timestamp.time_str(1507810403.33, time_format='%H/%M'), '12/13')
 
+  def test_time_formatter(self):
+    for time_format in [timestamp.TIME_FORMAT, '%Y+%j:%H:%M:%S.%f',
+                        '%H/%M', '%f:%S:%f', '100%% %f']:
+      formatter = timestamp.TimeFormatter(time_format=time_format)
+      for ts in [1507810403.33, 1507810403.5, 1507810403.9999996,
+                 1507810404.0000004, 1507810404.25, -1.3, 0]:
+        self.assertEqual(formatter.time_str(ts),
+                         datetime.fromtimestamp(ts, timezone.utc).strftime(
+                           time_format))
+    formatter = timestamp.TimeFormatter(time_zone=timezone(timedelta(hours=-5)))
+    self.assertEqual(formatter.time_str(1507810403.33),
+                     '2017-10-12T07:13:23.330000Z')
+
   def test_date_str(self):
     self.assertEqual(timestamp.date_str(1507810403.33), '2017-10-12')
     self.assertEqual(timestamp.date_str(1507810403.33, date_format='%Y+%j'),
                      '2017+285')
 
 if __name__ == '__main__':
+  logging.basicConfig(level=logging.INFO)
   unittest.main()
@@ -15,16 +15,32 @@ time_str(timestamp=None, time_zone=timezone.utc, time_format=TIME_FORMAT)
   Given a timestamp, return a string representing that time. If no
   timestamp is given, return the string for now.
 
+TimeFormatter(time_zone=timezone.utc, time_format=TIME_FORMAT)
+
+  Object whose time_str(timestamp=None) method does the same thing as
+  time_str(), caching all but the microseconds of the last second
+  formatted. time_str() uses one per time_zone/time_format.
+
 date_str(timestamp=None, time_zone=timezone.utc, time_format=TIME_FORMAT)
 
   Given a timestamp, return a string representing the date of that
   time. If no timestamp is given, return the string for today.
 
+Parsing with the default TIME_FORMAT (or the NBP Julian/Gregorian
+formats below) takes a fast path that avoids strptime() and caches the
+timestamp for the start of each date; other formats fall back to
+strptime().
+
 TODO: read date/time format from some central settings file.
 
 """
 
-from datetime import datetime, timezone
+import functools
+import math
+import re
+import threading
+
+from datetime import datetime, timedelta, timezone
 
 TIME_FORMAT ='%Y-%m-%dT%H:%M:%S.%fZ'  # ISO 8601
 DATE_FORMAT = '%Y-%m-%d'              # ISO 8601
@@ -36,6 +52,24 @@ DATE_FORMAT = '%Y-%m-%d'              # ISO 8601
 #DATE_FORMAT = '%Y-%m-%d'    # Gregorian
 #TIME_FORMAT = '%Y-%m-%d:%H:%M:%S.%f'  # Gregorian
 
+# Time formats timestamp() can parse without strptime(). Each maps to
+# a regex that picks out the date, hour, minute, second and fractional
+# second of a time string, and the format of the date part.
+FAST_TIME_FORMATS = {
+  '%Y-%m-%dT%H:%M:%S.%fZ': (
+    re.compile(r'(\d{4}-\d\d-\d\d)T(\d\d):(\d\d):(\d\d)\.(\d{1,6})Z'),
+    '%Y-%m-%d'),
+  '%Y+%j:%H:%M:%S.%f': (
+    re.compile(r'(\d{4}\+\d{3}):(\d\d):(\d\d):(\d\d)\.(\d{1,6})'),
+    '%Y+%j'),
+  '%Y-%m-%d:%H:%M:%S.%f': (
+    re.compile(r'(\d{4}-\d\d-\d\d):(\d\d):(\d\d):(\d\d)\.(\d{1,6})'),
+    '%Y-%m-%d'),
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
 ################################################################################
 def datetime_obj(time_str=None, time_zone=timezone.utc,time_format=TIME_FORMAT):
   """Return datetime object for a passed time_str. If no time_str is
@@ -53,19 +87,118 @@ def datetime_obj_from_timestamp(timestamp, time_zone=timezone.utc):
   # If they've given us a time string to convert. Set timezone as necessary.
   return datetime.fromtimestamp(timestamp, tz=time_zone)
 
+################################################################################
+@functools.lru_cache(maxsize=64)
+def _date_microseconds(date_str, date_format, time_zone):
+  """Return the start of date_str as integer microseconds since the epoch."""
+  date = datetime.strptime(date_str, date_format).replace(tzinfo=time_zone)
+  return (date - EPOCH) // ONE_MICROSECOND
+
+################################################################################
+def _fast_timestamp(time_str, time_zone, time_format):
+  """Return the numeric timestamp for time_str if time_format is one of
+  the FAST_TIME_FORMATS and time_str is well-formed, otherwise None."""
+  # Only fixed-offset time zones: with DST the start of day isn't
+  # enough to know the offset later in the day.
+  fast_format = FAST_TIME_FORMATS.get(time_format, None)
+  if fast_format is None or type(time_zone) is not timezone:
+    return None
+  (time_re, date_format) = fast_format
+  match = time_re.fullmatch(time_str)
+  if match is None:
+    return None
+  (date_str, hours, minutes, seconds, fraction) = match.groups()
+  hours, minutes, seconds = int(hours), int(minutes), int(seconds)
+  if hours > 23 or minutes > 59 or seconds > 59:
+    return None
+  microseconds = (_date_microseconds(date_str, date_format, time_zone)
+                  + ((hours * 60 + minutes) * 60 + seconds) * 1000000
+                  + int(fraction.ljust(6, '0')))
+
+  # Divide the same way datetime.timestamp() does, so that we get
+  # exactly the same float it would have given us.
+  return microseconds / 10**6
+
 ################################################################################
 def timestamp(time_str=None, time_zone=timezone.utc, time_format=TIME_FORMAT):
   """Return numeric timestamp for a passed time_str. If no time_str is
   passed, return timestamp for now."""
+  if time_str is not None:
+    ts = _fast_timestamp(time_str, time_zone, time_format)
+    if ts is not None:
+      return ts
   return datetime_obj(time_str, time_zone, time_format).timestamp()
 
+################################################################################
+class TimeFormatter:
+  """Format numeric timestamps as strings, like time_str(), but cache
+  the rendering of the most recent second so that, for timestamps that
+  fall within the same second, only the microseconds need formatting.
+
+    formatter = TimeFormatter(time_format=TIME_FORMAT)
+    formatter.time_str(1507810403.33)  -> '2017-10-12T12:13:23.330000Z'
+  """
+  ############################
+  def __init__(self, time_zone=timezone.utc, time_format=TIME_FORMAT):
+    self.time_zone = time_zone
+    self.time_format = time_format
+
+    # We can split the format around a single %f; if there are escaped
+    # '%'s, don't try to be clever.
+    self.cacheable = '%%' not in time_format and time_format.count('%f') <= 1
+    if self.cacheable and '%f' in time_format:
+      (self.prefix_format, self.suffix_format) = time_format.split('%f')
+    else:
+      (self.prefix_format, self.suffix_format) = (time_format, '')
+
+    # (second, rendered prefix, rendered suffix) for last second seen
+    self._cache = (None, None, None)
+
+  ############################
+  def time_str(self, timestamp=None):
+    """Given a timestamp, return a string representing that time. If no
+    timestamp is given, return the string for now."""
+    if timestamp is None:
+      timestamp = datetime.now(self.time_zone).timestamp()
+    if not self.cacheable:
+      return datetime.fromtimestamp(
+        timestamp, self.time_zone).strftime(self.time_format)
+
+    # Split into whole seconds and microseconds, rounding the way
+    # datetime.fromtimestamp() does.
+    (fraction, second) = math.modf(timestamp)
+    microseconds = round(fraction * 1e6)
+    if microseconds >= 1000000:
+      second += 1
+      microseconds -= 1000000
+    elif microseconds < 0:
+      second -= 1
+      microseconds += 1000000
+
+    (cached_second, prefix, suffix) = self._cache
+    if second != cached_second:
+      dt = datetime.fromtimestamp(second, self.time_zone)
+      prefix = dt.strftime(self.prefix_format)
+      suffix = dt.strftime(self.suffix_format)
+      self._cache = (second, prefix, suffix)
+    if not '%f' in self.time_format:
+      return prefix
+    return '%s%06d%s' % (prefix, microseconds, suffix)
+
+# TimeFormatters used by time_str(), by (time_zone, time_format)
+_time_formatters = {}
+_time_formatter_lock = threading.Lock()
+
 ################################################################################
 def time_str(timestamp=None, time_zone=timezone.utc, time_format=TIME_FORMAT):
   """Given a timestamp, return a string representing that time. If no
   timestamp is given, return the string for now."""
-  if timestamp is None:
-    timestamp = datetime.now(time_zone).timestamp()
-  return datetime.fromtimestamp(timestamp, time_zone).strftime(time_format)
+  formatter = _time_formatters.get((time_zone, time_format), None)
+  if formatter is None:
+    with _time_formatter_lock:
+      formatter = _time_formatters.setdefault(
+        (time_zone, time_format), TimeFormatter(time_zone, time_format))
+  return formatter.time_str(timestamp)
 
 ################################################################################
 def date_str(timestamp=None, time_zone=timezone.utc, date_format=DATE_FORMAT):
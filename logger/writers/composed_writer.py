@@ -80,6 +80,15 @@ class ComposedWriter(Writer):
     with self.writer_lock[index]:
       self.writers[index].write(record)
           
+  ############################
+  def close(self):
+    """Close all our writers."""
+    for i, writer in enumerate(self.writers):
+      close = getattr(writer, 'close', None)
+      if callable(close):
+        with self.writer_lock[i]:
+          close()
+
   ############################
   def apply_transforms(self, record):
     """Internal: apply the transforms in series."""
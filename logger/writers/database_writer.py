@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import logging
+import pprint
 import sys
 
 sys.path.append('.')
@@ -60,6 +61,17 @@ class DatabaseWriter(Writer):
     """Write record to table."""
     self.db.write_record(record)
     
+  ############################
+  def _write_records(self, records):
+    """Write a list of records to table, in one go if our connector
+    knows how."""
+    write_records = getattr(self.db, 'write_records', None)
+    if write_records:
+      write_records(records)
+    else:
+      for record in records:
+        self.db.write_record(record)
+
   ############################
   def _delete_table(self,  table_name):
     """Delete a table."""
@@ -105,3 +117,22 @@ class DatabaseWriter(Writer):
       das_record = DASRecord(timestamp=timestamp,
                              fields=values_by_timestamp[timestamp])
       self._write_record(das_record)
+
+  ############################
+  def write_batch(self, records):
+    """Write out a list of DASRecords or a RecordBatch, handing them to
+    the database connector all at once."""
+    if self.field_dict_input:
+      return super().write_batch(records)
+
+    das_records = []
+    for record in records:
+      if not record:
+        continue
+      if type(record) is DASRecord:
+        das_records.append(record)
+      else:
+        logging.error('Record passed to DatabaseWriter is not of type '
+                      '"DASRecord"; is type "%s"', type(record))
+    if das_records:
+      self._write_records(das_records)
@@ -1,20 +1,80 @@
 #!/usr/bin/env python3
 
 import logging
+import re
 import sys
+import threading
 sys.path.append('.')
 
 from logger.utils import timestamp
+from logger.utils.compressed_file import compress_file
+from logger.utils.file_pool import FilePool, shared_pool
 from logger.utils.formats import Text
 from logger.writers.writer import Writer
 from logger.writers.text_file_writer import TextFileWriter
 
+# Regexes for the strftime directives that may follow the date in a
+# time format, for checking the rest of time strings whose date we've
+# recognized by its prefix.
+_DIRECTIVE_RES = {
+  'H': r'(?:[01]\d|2[0-3])',
+  'M': r'[0-5]\d',
+  'S': r'(?:[0-5]\d|6[01])',
+  'f': r'\d{1,6}',
+  'z': r'[+-]\d{4}',
+  '%': '%',
+}
+
+################################################################################
+def _rest_of_time_re(time_format, date_format):
+  """If time_format begins with date_format and a literal character,
+  return a regex matching the rest of a time string in time_format and
+  the whitespace (or end) following it. Otherwise, or if the rest uses
+  directives we don't know, return None."""
+  if (not time_format.startswith(date_format) or
+      len(time_format) <= len(date_format) or
+      time_format[len(date_format)] == '%'):
+    return None
+  rest = time_format[len(date_format) + 1:]
+  pattern = []
+  i = 0
+  while i < len(rest):
+    if rest[i] == '%':
+      directive_re = _DIRECTIVE_RES.get(rest[i+1:i+2])
+      if directive_re is None:
+        return None
+      pattern.append(directive_re)
+      i += 2
+    else:
+      pattern.append(re.escape(rest[i]))
+      i += 1
+  return re.compile(''.join(pattern) + r'(?:\s|$)')
+
+################################################################################
+class _PooledFileWriter:
+  """Stand-in for a TextFileWriter that hands its writes to a FilePool."""
+  def __init__(self, pool, filename):
+    self.pool = pool
+    self.filename = filename
+
+  def write(self, record):
+    self.pool.write(self.filename, str(record) + '\n')
+
+  def write_batch(self, records):
+    self.pool.write(self.filename,
+                    ''.join([str(record) + '\n' for record in records]))
+
+  def close(self, callback=None):
+    self.pool.close_file(self.filename, callback)
+
 ################################################################################
 class LogfileWriter(Writer):
   """Write to the specified file. If filename is empty, write to stdout."""
   def __init__(self, filebase=None, flush=True,
                time_format=timestamp.TIME_FORMAT,
-               date_format=timestamp.DATE_FORMAT):
+               date_format=timestamp.DATE_FORMAT, compress=False,
+               flush_records=None, flush_interval=None, fsync_interval=None,
+               pool=None):
     """
     Write timestamped text records to file. Base filename will have
     date appended, in keeping with R2R format recommendations
@@ -26,8 +86,29 @@ class LogfileWriter(Writer):
 
     flush        If True (default), flush after every write() call
 
+    flush_records, flush_interval, fsync_interval
+                 Flushing policy, as for TextFileWriter: flush every N
+                 records and/or every T seconds instead of after every
+                 write() call, and/or fsync every T seconds.
+
     date_fomat   A strftime-compatible string, such as '%Y-%m-%d'; defaults
                  to whatever's defined in utils.timestamps.DATE_FORMAT.
+
+    compress     If True, when the date rolls over, compress the file
+                 we're done with into a seekable block gzip file (see
+                 utils/compressed_file.py) named with a '.gz' suffix.
+                 Compression happens in a background thread so as not
+                 to hold up writing.
+
+    pool         If a FilePool (see utils/file_pool.py), or True to use the
+                 process-wide shared pool, hand records to the pool's I/O
+                 thread to write instead of writing them ourselves. This
+                 bounds the number of files open at once across all
+                 writers using the pool, and keeps slow disks from holding
+                 up the caller: if the disk falls far enough behind, the
+                 pool drops records rather than make us wait (see
+                 FilePool's put_timeout). The pool does its own flushing,
+                 so the flush options are ignored.
     """
     super().__init__(input_format=Text)
 
@@ -35,33 +116,194 @@ class LogfileWriter(Writer):
     self.flush = flush
     self.time_format = time_format
     self.date_format = date_format
+    self.compress = compress
+    self.flush_records = flush_records
+    self.flush_interval = flush_interval
+    self.fsync_interval = fsync_interval
+    if pool is True:
+      pool = shared_pool()
+    elif pool is not None and not isinstance(pool, FilePool):
+      raise ValueError('LogfileWriter pool must be a FilePool or True; got %s'
+                       % pool)
+    self.pool = pool
+
+    # Threads compressing files we've finished with, by filename, and
+    # the files we've finished with and handed over for compression.
+    self.compress_threads = {}
+    self.compress_lock = threading.Lock()
+    self.compressing = set()
 
     self.current_date = None
     self.current_filename = None
     self.writer = None
 
+    # Working out a record's date means parsing its timestamp and
+    # formatting the date back out; we'd rather not do that for every
+    # record. If time strings begin with their date (as they do in the
+    # default ISO 8601 formats), records starting with the same date
+    # prefix as the last one parsed share its date - provided the rest
+    # of their time strings are well-formed. Otherwise, any timestamp
+    # within the [start, end) bounds of the last day parsed does.
+    self._rest_re = _rest_of_time_re(time_format, date_format)
+    self._date_prefix = None
+    self._prefix_date = None
+    self._day_start = None
+    self._day_end = None
+    self._day_date = None
+
   ############################
-  def write(self, record):
-    """Note: Assume record begins with a timestamp string."""
-    if record is None:
-      return
-    
-    # First things first: get the date string from the record
+  def _date_str(self, record):
+    """Return the date string for the file record belongs in, or None
+    (logging an error) if we can't make sense of its timestamp."""
+    prefix = self._date_prefix
+    if (prefix and record.startswith(prefix) and
+        self._rest_re.match(record, len(prefix))):
+      return self._prefix_date
     try:
       time_str = record.split()[0]
       ts = timestamp.timestamp(time_str, time_format=self.time_format)
-      date_str = timestamp.date_str(ts, date_format=self.date_format)
-      logging.debug('LogfileWriter date_str: %s', date_str)
-    except ValueError:
+    except (ValueError, IndexError):
       logging.error('LogfileWriter.write() - bad record timestamp: %s', record)
+      return None
+    if self._day_start is not None and self._day_start <= ts < self._day_end:
+      return self._day_date
+
+    date_str = timestamp.date_str(ts, date_format=self.date_format)
+    logging.debug('LogfileWriter date_str: %s', date_str)
+    self._cache_date(date_str, time_str)
+    return date_str
+
+  ############################
+  def _cache_date(self, date_str, time_str):
+    """Remember how to recognize other records from date_str without
+    fully parsing them, given a time_str we've found to be in it."""
+    self._date_prefix = None
+    if (self._rest_re is not None and
+        time_str.startswith(date_str) and len(time_str) > len(date_str)):
+      # Include the character following the date, so that e.g. '2017+3'
+      # (Julian day 3) isn't taken to be a prefix of '2017+30'.
+      self._date_prefix = time_str[:len(date_str) + 1]
+      self._prefix_date = date_str
+
+    self._day_start = None
+    try:
+      day_start = timestamp.timestamp(date_str, time_format=self.date_format)
+    except ValueError:
       return
+    day_end = day_start + 24 * 60 * 60
+    # Only trust the bounds if the whole day really is date_str, which
+    # it won't be if date_format is finer-grained than a day.
+    if timestamp.date_str(day_end - 0.001, date_format=self.date_format) \
+       == date_str:
+      self._day_start = day_start
+      self._day_end = day_end
+      self._day_date = date_str
 
-    # Is it time to create a new file to write to?
+  ############################
+  def _writer_for(self, date_str):
+    """Return the TextFileWriter for date_str, opening a new file if
+    it's time to."""
     if not self.writer or date_str != self.current_date:
+      if self.writer:
+        self._finish_file()
       self.current_filename = self.filebase + '-' + date_str
       self.current_date = date_str
+
+      # If a record has shown up late for a day we're still
+      # compressing, let the compression finish before we start a new
+      # file for that day.
+      if self.current_filename in self.compressing:
+        self.compressing.discard(self.current_filename)
+        if self.pool:
+          self.pool.sync()  # make sure compression has been started
+        with self.compress_lock:
+          thread = self.compress_threads.pop(self.current_filename, None)
+        if thread:
+          thread.join()
       logging.info('LogfileWriter opening new file: %s', self.current_filename)
-      self.writer = TextFileWriter(self.current_filename, self.flush)
+      if self.pool:
+        self.writer = _PooledFileWriter(self.pool, self.current_filename)
+      else:
+        self.writer = TextFileWriter(self.current_filename, self.flush,
+                                     flush_records=self.flush_records,
+                                     flush_interval=self.flush_interval,
+                                     fsync_interval=self.fsync_interval)
+    return self.writer
+
+  ############################
+  def _finish_file(self):
+    """Close the current file and, if we're compressing, compress it."""
+    filename = self.current_filename
+    if not self.compress:
+      self.writer.close()
+      return
+    self.compressing.add(filename)
+    if self.pool:
+      # The pool closes the file in its own time; start compressing
+      # once it has.
+      self.writer.close(lambda: self._start_compressing(filename))
+    else:
+      self.writer.close()
+      self._start_compressing(filename)
+
+  ############################
+  def _start_compressing(self, filename):
+    """Compress filename in a background thread."""
+    thread = threading.Thread(target=self._compress_file, args=(filename,),
+                              name='compress ' + filename)
+    with self.compress_lock:
+      for name, old_thread in list(self.compress_threads.items()):
+        if not old_thread.is_alive():
+          del self.compress_threads[name]
+      self.compress_threads[filename] = thread
+    thread.start()
+
+  ############################
+  def _compress_file(self, filename):
+    logging.info('LogfileWriter compressing %s', filename)
+    try:
+      compress_file(filename)
+    except OSError as e:
+      logging.error('LogfileWriter unable to compress %s: %s', filename, e)
+
+  ############################
+  def write(self, record):
+    """Note: Assume record begins with a timestamp string."""
+    if record is None:
+      return
+
+    # First things first: get the date string from the record
+    date_str = self._date_str(record)
+    if date_str is None:
+      return
 
     logging.debug('LogfileWriter writing record: %s', record)
-    self.writer.write(record)
+    self._writer_for(date_str).write(record)
+
+  ############################
+  def write_batch(self, records):
+    """Write a list of records, handing each run of records that
+    belong in the same file to its TextFileWriter in one go."""
+    run = []
+    run_date = None
+    for record in records:
+      if record is None:
+        continue
+      date_str = self._date_str(record)
+      if date_str is None:
+        continue
+      if date_str != run_date and run:
+        self._writer_for(run_date).write_batch(run)
+        run = []
+      run_date = date_str
+      run.append(record)
+    if run:
+      self._writer_for(run_date).write_batch(run)
+
+  ############################
+  def close(self):
+    """Flush and close the current file. It isn't compressed, as more
+    records for its date may come along later."""
+    if self.writer:
+      self.writer.close()
+      self.writer = None
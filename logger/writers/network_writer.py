@@ -1,49 +1,131 @@
 #!/usr/bin/env python3
 
+import errno
 import logging
 import socket
 import sys
+import time
 
 sys.path.append('.')
 
-from logger.utils.formats import Text
+from logger.utils.formats import Bytes
+from logger.utils.network import parse_network, check_framing
+from logger.utils.network import set_tcp_options, frame, NEWLINE_FRAMING
+from logger.utils.network import MAX_DATAGRAM_SIZE, DEFAULT_MULTICAST_TTL
+from logger.utils.network import is_multicast
 from logger.writers.writer import Writer
 
+# Seconds to wait before first trying to reconnect a lost TCP
+# connection; the wait doubles with each failure, up to the max.
+RECONNECT_INTERVAL = 1.0
+MAX_RECONNECT_INTERVAL = 60.0
+
+# Seconds to wait for a TCP connection to be made
+CONNECT_TIMEOUT = 5.0
+
+# Errors on which a UDP send is worth retrying: the kernel is briefly
+# out of buffer space, so the datagram wasn't sent.
+RETRY_ERRNOS = (errno.EAGAIN, errno.ENOBUFS)
+
 ################################################################################
 class NetworkWriter(Writer):
   """Write to network."""
-  def __init__(self, network, num_retry=2):
+  def __init__(self, network, num_retry=2, framing=NEWLINE_FRAMING,
+               tcp_nodelay=True, tcp_keepalive=True,
+               reconnect_interval=RECONNECT_INTERVAL,
+               max_reconnect_interval=MAX_RECONNECT_INTERVAL,
+               coalesce=False, max_datagram_size=MAX_DATAGRAM_SIZE,
+               multicast_ttl=DEFAULT_MULTICAST_TTL, multicast_interface=None):
     """
-    Write text records to a network socket.
-
-    NOTE: tcp is nominally implemented, but DOES NOT WORK!
+    Write text records (or bytes, such as those produced by
+    ToBinaryTransform) to a network socket.
 
     network      Network address to write, in host:port format (e.g.
                  'rvdas:6202'). If host is omitted (e.g. ':6202'),
                  broadcast via UDP on specified port.
 
-    num_retry    Number of times to retry if write fails.
+                 If host is specified, connect via TCP to a
+                 NetworkReader listening on that host:port.
+
+                 If host is a multicast group address (e.g.
+                 '239.192.0.7:6224'), send to that group via UDP.
+
+    num_retry    Number of times to try sending a record; over UDP,
+                 sends are only retried if the system is momentarily
+                 out of buffer space.
+
+    framing      Over TCP, how records are delimited in the stream: by
+                 'newline' (default) or by 'length' prefix, which must
+                 match the framing the reader uses (see
+                 utils/network.py). Binary records should use 'length'.
+
+    tcp_nodelay, tcp_keepalive
+                 Whether to set TCP_NODELAY and SO_KEEPALIVE on the TCP
+                 connection.
+
+    reconnect_interval, max_reconnect_interval
+                 If the TCP connection can't be made or is lost, wait
+                 reconnect_interval seconds before trying again, doubling
+                 the wait after each failure up to max_reconnect_interval.
+                 Records written while we're waiting are dropped, rather
+                 than holding up the caller.
+
+    coalesce, max_datagram_size
+                 If True, write_batch() sends records over UDP several
+                 to a datagram, framed as above, packing in as many as
+                 fit in max_datagram_size bytes (by default, as many as
+                 will fit in an Ethernet frame). Readers must be created
+                 with coalesce=True and the same framing. Records too big
+                 to share a datagram are sent in one of their own.
+
+    multicast_ttl, multicast_interface
+                 How many hops multicast datagrams may take (1, the
+                 default, keeps them on the local subnet), and the
+                 address of the local interface to send them from. If
+                 multicast_interface is omitted, the system picks one.
     """
 
-    super().__init__(input_format=Text)
+    super().__init__(input_format=Bytes)
 
-    if network.find(':') == -1:
-      raise ValueError('NetworkWriter network argument must be in '
-                       '\'host:port\' or \':port\' format. Found "%s"', network)
+    (host, port) = parse_network(network, 'NetworkWriter')
+    check_framing(framing, 'NetworkWriter')
     self.network = network
     self.num_retry = num_retry
-    
-    (host, port) = network.split(':')
-    port = int(port)
+    self.framing = framing
+    self.tcp_nodelay = tcp_nodelay
+    self.tcp_keepalive = tcp_keepalive
+    self.reconnect_interval = reconnect_interval
+    self.max_reconnect_interval = max_reconnect_interval
+    self.coalesce = coalesce
+    self.max_datagram_size = max_datagram_size
+    self.multicast_ttl = multicast_ttl
+    self.multicast_interface = multicast_interface
 
-    # TCP if host is specified
-    if host:
+    # TCP if host is specified, unless it's a multicast group
+    self.multicast = is_multicast(host)
+    self.tcp = bool(host) and not self.multicast
+    if self.tcp:
+      self.address = (host, port)
+      self.socket = None
+      self.next_connect = 0        # when we may next try to connect
+      self.connect_wait = reconnect_interval
+      self.num_dropped = 0         # records dropped since we lost connection
+      self._connect()
+
+    # UDP multicast if host is a group address
+    elif self.multicast:
       self.socket = socket.socket(family=socket.AF_INET,
-                                  type=socket.SOCK_STREAM,
-                                  proto=socket.IPPROTO_TCP)
-      # Should this be bind()?
+                                  type=socket.SOCK_DGRAM,
+                                  proto=socket.IPPROTO_UDP)
+      self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL,
+                             multicast_ttl)
+      # Let readers on this host hear us too
+      self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, True)
+      if multicast_interface:
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                               socket.inet_aton(multicast_interface))
       self.socket.connect((host, port))
-      
+
     # UDP broadcast if no host specified. Note that there's some
     # dodginess I don't understand about networks: if '<broadcast>' is
     # specified, socket tries to send on *all* interfaces. if '' is
@@ -61,15 +143,126 @@ class NetworkWriter(Writer):
 
       self.socket.connect((host, port))
 
+  ############################
+  def _connect(self):
+    """Try to (re)connect our TCP socket, unless we're still backing off
+    from a previous failure. Return True if we're connected."""
+    if self.socket:
+      return True
+    now = time.time()
+    if now < self.next_connect:
+      return False
+    try:
+      sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+    except OSError as e:
+      logging.warning('NetworkWriter unable to connect to %s (retrying in '
+                      '%g seconds): %s', self.network, self.connect_wait, e)
+      self.next_connect = now + self.connect_wait
+      self.connect_wait = min(2 * self.connect_wait,
+                              self.max_reconnect_interval)
+      return False
+
+    sock.settimeout(None)
+    set_tcp_options(sock, self.tcp_nodelay, self.tcp_keepalive)
+    logging.info('NetworkWriter connected to %s', self.network)
+    if self.num_dropped:
+      logging.warning('NetworkWriter dropped %d records while unable to '
+                      'connect to %s', self.num_dropped, self.network)
+    self.socket = sock
+    self.connect_wait = self.reconnect_interval
+    self.num_dropped = 0
+    return True
+
+  ############################
+  def _disconnect(self):
+    if self.socket:
+      self.socket.close()
+      self.socket = None
+
+  ############################
+  def _write_tcp(self, data, num_records=1):
+    """Send num_records framed records, reconnecting and retrying if
+    the connection has been lost."""
+    for _ in range(max(self.num_retry, 1)):
+      if not self._connect():
+        break
+      try:
+        self.socket.sendall(data)
+        return
+      except OSError as e:
+        logging.warning('NetworkWriter lost connection to %s: %s',
+                        self.network, e)
+        self._disconnect()
+    self.num_dropped += num_records
+
+  ############################
+  def _send_datagram(self, datagram):
+    """Send a UDP datagram, retrying if the system is momentarily out
+    of buffer space. Datagrams are sent whole or not at all."""
+    for num_tries in range(1, max(self.num_retry, 1) + 1):
+      try:
+        self.socket.send(datagram)
+        break
+      except OSError as e:
+        if e.errno not in RETRY_ERRNOS or num_tries >= self.num_retry:
+          raise
+    logging.debug('NetworkWriter wrote %d bytes after %d tries',
+                  len(datagram), num_tries)
+
+  ############################
+  def _encode(self, record):
+    """Return record as bytes: bytes are sent as-is, anything else
+    (str, DASRecord, dict...) as the UTF-8 encoding of its str()."""
+    if type(record) is bytes:
+      return record
+    if type(record) is not str:
+      record = str(record)
+    return record.encode('utf-8')
+
   ############################
   def write(self, record):
     """Write the record to the network."""
-    num_tries = 0
-    bytes_sent = 0
-    rec_len = len(record)
-    while num_tries < self.num_retry and bytes_sent < rec_len:
-      bytes_sent = self.socket.send(record.encode('utf-8'))
-      num_tries += 1
-
-    logging.debug('NetworkWriter.write() wrote %d/%d bytes after %d tries',
-                    bytes_sent, rec_len, num_tries)
+    if record is None:
+      return
+    record = self._encode(record)
+    if self.tcp:
+      self._write_tcp(frame(record, self.framing))
+    elif self.coalesce:
+      self._send_datagram(frame(record, self.framing))
+    else:
+      self._send_datagram(record)
+
+  ############################
+  def write_batch(self, records):
+    """Write a list of records. Over TCP, they're sent in a single
+    call; over UDP with coalesce=True, packed into as few datagrams as
+    will hold them."""
+    if not (self.tcp or self.coalesce):
+      return super().write_batch(records)
+
+    encode = self._encode
+    framed = [frame(encode(record), self.framing)
+              for record in records if record is not None]
+    if self.tcp:
+      if framed:
+        self._write_tcp(b''.join(framed), len(framed))
+      return
+
+    datagram = []
+    datagram_size = 0
+    for data in framed:
+      if datagram and datagram_size + len(data) > self.max_datagram_size:
+        self._send_datagram(b''.join(datagram))
+        datagram = []
+        datagram_size = 0
+      datagram.append(data)
+      datagram_size += len(data)
+    if datagram:
+      self._send_datagram(b''.join(datagram))
+
+  ############################
+  def close(self):
+    """Close our socket."""
+    if self.socket:
+      self.socket.close()
+      self.socket = None
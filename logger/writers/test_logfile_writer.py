@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
+import gzip
 import logging
+import os
 import sys
 import tempfile
 import time
@@ -9,8 +11,9 @@ import warnings
 
 sys.path.append('.')
 
+from logger.utils.file_pool import FilePool
 from logger.writers.logfile_writer import LogfileWriter
-from logger.utils import formats
+from logger.utils import formats, timestamp
 
 SAMPLE_DATA = """2017-11-03T17:23:04.832875Z Nel mezzo del cammin di nostra vita
 2017-11-03T17:23:04.833188Z mi ritrovai per una selva oscura,
@@ -71,7 +74,148 @@ class TestLogfileWriter(unittest.TestCase):
       outfile = open(filebase + '-2017-11-05', 'r')
       for i in r:
         self.assertEqual(lines[i], outfile.readline().rstrip())
-      
+
+  ############################
+  def test_write_batch(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      lines = SAMPLE_DATA.strip().split('\n')
+      filebase = tmpdirname + '/logfile'
+      writer = LogfileWriter(filebase)
+
+      with self.assertLogs(logging.getLogger(), logging.ERROR):
+        writer.write_batch(lines[0:4] + ['there is no timestamp here', None] +
+                           lines[4:8])
+      writer.write_batch(lines[8:])
+
+      for date, r in [('2017-11-03', range(0,3)), ('2017-11-04', range(3,6)),
+                      ('2017-11-05', range(6,9)), ('2017-11-09', range(18,21))]:
+        with open(filebase + '-' + date, 'r') as outfile:
+          self.assertEqual([lines[i] for i in r],
+                           outfile.read().rstrip().split('\n'))
+
+  ############################
+  # Dates are found without parsing every timestamp; check that files
+  # still roll over in the right places with other time and date formats.
+  def test_date_formats(self):
+    lines = SAMPLE_DATA.strip().split('\n')
+    for (time_format, date_format, filenames) in [
+        (timestamp.TIME_FORMAT, timestamp.DATE_FORMAT,
+         ['2017-11-03', '2017-11-04', '2017-11-05']),
+        # Hourly files
+        (timestamp.TIME_FORMAT, '%Y-%m-%dT%H',
+         ['2017-11-03T17', '2017-11-04T17', '2017-11-05T17']),
+        # Time format that doesn't start with the date
+        ('%d/%m/%Y-%H:%M:%S.%f', '%Y+%j', ['2017+307', '2017+308', '2017+309'])
+    ]:
+      with tempfile.TemporaryDirectory() as tmpdirname:
+        filebase = tmpdirname + '/logfile'
+        writer = LogfileWriter(filebase, time_format=time_format,
+                               date_format=date_format)
+        records = []
+        for line in lines[0:9]:
+          (time_str, text) = line.split(' ', 1)
+          ts = timestamp.timestamp(time_str)
+          records.append(timestamp.time_str(ts, time_format=time_format) +
+                         ' ' + text)
+        writer.write_batch(records[0:4])
+        with self.assertLogs(logging.getLogger(), logging.ERROR):
+          writer.write('2017-11-0 not a timestamp')
+        for record in records[4:]:
+          writer.write(record)
+        writer.close()
+
+        self.assertEqual(['logfile-' + f for f in filenames],
+                         sorted(os.listdir(tmpdirname)))
+        for i, filename in enumerate(filenames):
+          with open(tmpdirname + '/logfile-' + filename) as f:
+            self.assertEqual(records[3*i:3*i+3], f.read().splitlines())
+
+  ############################
+  # Records whose date we recognize from the previous record's still
+  # need a well-formed timestamp.
+  def test_malformed_timestamps(self):
+    lines = SAMPLE_DATA.strip().split('\n')
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filebase = tmpdirname + '/logfile'
+      writer = LogfileWriter(filebase)
+      writer.write(lines[0])
+      for bad in ['2017-11-03Tgarbage', '2017-11-03T25:23:04.832875Z text',
+                  '2017-11-03T17:23:04.832875Zjunk text']:
+        with self.assertLogs(logging.getLogger(), logging.ERROR):
+          writer.write(bad)
+        with self.assertLogs(logging.getLogger(), logging.ERROR):
+          writer.write_batch([bad])
+      writer.write_batch(lines[1:3])
+      writer.close()
+      with open(filebase + '-2017-11-03') as f:
+        self.assertEqual(lines[0:3], f.read().splitlines())
+
+  ############################
+  def test_compress(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      lines = SAMPLE_DATA.strip().split('\n')
+      filebase = tmpdirname + '/logfile'
+      writer = LogfileWriter(filebase, compress=True)
+      writer.write_batch(lines[0:7])
+      for thread in writer.compress_threads.values():
+        thread.join()
+
+      # Finished days are compressed; the current one isn't
+      self.assertEqual(['logfile-2017-11-03.gz', 'logfile-2017-11-04.gz',
+                        'logfile-2017-11-05'],
+                       sorted(os.listdir(tmpdirname)))
+      with gzip.open(filebase + '-2017-11-04.gz', 'rt') as f:
+        self.assertEqual(lines[3:6], f.read().rstrip().split('\n'))
+
+      # A late record for a finished day gets appended when we move on
+      writer.write(lines[2])
+      writer.write(lines[8])
+      for thread in writer.compress_threads.values():
+        thread.join()
+      with gzip.open(filebase + '-2017-11-03.gz', 'rt') as f:
+        self.assertEqual(lines[0:3] + lines[2:3],
+                         f.read().rstrip().split('\n'))
+
+  ############################
+  def test_pool(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      lines = SAMPLE_DATA.strip().split('\n')
+      pool = FilePool(max_open_files=2)
+      writers = [LogfileWriter('%s/inst%d/logfile' % (tmpdirname, i),
+                               pool=pool, compress=(i == 0))
+                 for i in range(3)]
+      for line in lines[0:7]:
+        for writer in writers:
+          writer.write(line)
+      writers[0].write(lines[0])  # late record for a compressed day
+      for writer in writers:
+        writer.write_batch(lines[7:9])
+      pool.sync()
+      self.assertLessEqual(len(pool.files), 2)
+      for thread in list(writers[0].compress_threads.values()):
+        thread.join()
+
+      # The late record finished off the 2017-11-05 file too, so the
+      # rest of that day went into a fresh one.
+      self.assertEqual(['logfile-2017-11-03.gz', 'logfile-2017-11-04.gz',
+                        'logfile-2017-11-05', 'logfile-2017-11-05.gz'],
+                       sorted(os.listdir(tmpdirname + '/inst0')))
+      with gzip.open(tmpdirname + '/inst0/logfile-2017-11-03.gz', 'rt') as f:
+        self.assertEqual(lines[0:3] + lines[0:1], f.read().splitlines())
+      with gzip.open(tmpdirname + '/inst0/logfile-2017-11-05.gz', 'rt') as f:
+        self.assertEqual(lines[6:7], f.read().splitlines())
+      with open(tmpdirname + '/inst0/logfile-2017-11-05') as f:
+        self.assertEqual(lines[7:9], f.read().splitlines())
+      for i in [1, 2]:
+        for date, r in [('2017-11-03', range(0,3)), ('2017-11-04', range(3,6)),
+                        ('2017-11-05', range(6,9))]:
+          with open('%s/inst%d/logfile-%s' % (tmpdirname, i, date)) as f:
+            self.assertEqual([lines[j] for j in r], f.read().splitlines())
+      pool.shutdown()
+
+      with self.assertRaises(ValueError):
+        LogfileWriter(tmpdirname + '/logfile', pool='yes')
+
 if __name__ == '__main__':
   import argparse
   parser = argparse.ArgumentParser()
@@ -11,6 +11,8 @@ import warnings
 
 sys.path.append('.')
 
+from logger.readers.network_reader import NetworkReader
+from logger.utils.das_record import DASRecord
 from logger.writers.network_writer import NetworkWriter
 
 SAMPLE_DATA = ['f1 line 1',
@@ -75,7 +77,123 @@ class TestNetworkWriter(unittest.TestCase):
       self.assertTrue(False, 'NetworkReader timed out in test - is port '
                       '%s open?' % addr)
     signal.alarm(0)
-    
+
+  ############################
+  def test_tcp(self):
+    addr = 'localhost:8012'
+    with self.assertLogs(logging.getLogger(), logging.WARNING):
+      writer = NetworkWriter(addr, reconnect_interval=0.1)
+      # Nobody listening yet: record is dropped, and we back off
+      writer.write(SAMPLE_DATA[0])
+    self.assertEqual(1, writer.num_dropped)
+
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, True)
+    server.bind(('localhost', 8012))
+    server.listen()
+
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(5)
+    try:
+      time.sleep(0.2)
+      writer.write(SAMPLE_DATA[0])
+      conn, _ = server.accept()
+      self.assertEqual(0, writer.num_dropped)
+
+      # Drop the connection; the writer should notice and reconnect
+      conn.close()
+      with self.assertLogs(logging.getLogger(), logging.WARNING):
+        for i in range(20):
+          writer.write(SAMPLE_DATA[1])
+          time.sleep(0.01)
+      conn, _ = server.accept()
+      writer.write(SAMPLE_DATA[2])
+      writer.close()
+      received = b''
+      while True:
+        data = conn.recv(4096)
+        if not data:
+          break
+        received += data
+      self.assertEqual(SAMPLE_DATA[2], received.decode('utf-8').split('\n')[-2])
+    except ReaderTimeout:
+      self.assertTrue(False, 'NetworkWriter timed out in test - is port '
+                      '8012 open?')
+    signal.alarm(0)
+    conn.close()
+    server.close()
+
+  ############################
+  def test_udp_coalesce(self):
+    sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    sock.bind(('', 8015))
+    sock.settimeout(2)
+    writer = NetworkWriter(':8015', coalesce=True, max_datagram_size=30)
+    writer.write_batch(SAMPLE_DATA + ['x' * 40])
+    writer.write(SAMPLE_DATA[0])
+
+    # 10-byte framed records, three to a datagram, then one on its own
+    # that's too big to share, then one from write()
+    datagrams = [sock.recv(4096) for _ in range(3)]
+    self.assertEqual([b'f1 line 1\nf1 line 2\nf1 line 3\n',
+                      b'x' * 40 + b'\n', b'f1 line 1\n'], datagrams)
+    writer.close()
+    sock.close()
+
+    # Round trip through a NetworkReader
+    reader = NetworkReader(':8016', binary=True, framing='length',
+                           coalesce=True)
+    writer = NetworkWriter(':8016', framing='length', coalesce=True)
+    records = [b'\x00\n%d' % i for i in range(500)]
+    writer.write_batch(records)
+    result = []
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(5)
+    while len(result) < len(records):
+      result.extend(reader.read_batch())
+    signal.alarm(0)
+    self.assertEqual(records, result)
+    writer.close()
+    reader.close()
+
+  ############################
+  def test_non_text_records(self):
+    # DASRecords, dicts etc. are sent as their str(), as they always were
+    sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    sock.bind(('', 8019))
+    sock.settimeout(2)
+    writer = NetworkWriter(':8019')
+    record = DASRecord(data_id='gyr1', timestamp=1, fields={'Heading': 1.5})
+    writer.write(record)
+    self.assertEqual(str(record).encode('utf-8'), sock.recv(4096))
+    writer.write({'a': 1})
+    self.assertEqual(b"{'a': 1}", sock.recv(4096))
+    writer.write(b'\x00\x01')
+    self.assertEqual(b'\x00\x01', sock.recv(4096))
+
+    # ...but None isn't sent at all
+    writer.write(None)
+    writer.write('next')
+    self.assertEqual(b'next', sock.recv(4096))
+    writer.close()
+    sock.close()
+
+  ############################
+  def test_multicast(self):
+    reader = NetworkReader('239.192.0.3:8018')
+    writer = NetworkWriter('239.192.0.3:8018', multicast_ttl=2)
+    self.assertFalse(writer.tcp)
+    self.assertEqual(2, writer.socket.getsockopt(socket.IPPROTO_IP,
+                                                 socket.IP_MULTICAST_TTL))
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(5)
+    for line in SAMPLE_DATA:
+      writer.write(line)
+      self.assertEqual(line, reader.read())
+    signal.alarm(0)
+    writer.close()
+    reader.close()
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import logging
+import os
 import sys
 import tempfile
 import threading
@@ -39,6 +40,69 @@ class TestTextFileWriter(unittest.TestCase):
         writer.write(line)
         self.assertEqual(line, f.readline().strip())
 
+  ############################
+  def test_write_batch(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      writer = TextFileWriter(tmpdirname + '/f')
+      writer.write_batch(SAMPLE_DATA[:2] + [None])
+      writer.write_batch([])
+      writer.write_batch(SAMPLE_DATA[2:])
+      with open(tmpdirname + '/f') as f:
+        self.assertEqual(f.read(), '\n'.join(SAMPLE_DATA) + '\n')
+
+  ############################
+  def test_flush_records(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      writer = TextFileWriter(tmpdirname + '/f', flush_records=2)
+      with open(tmpdirname + '/f') as f:
+        writer.write(SAMPLE_DATA[0])
+        self.assertEqual('', f.read())
+        writer.write(SAMPLE_DATA[1])
+        self.assertEqual(SAMPLE_DATA[0:2], f.read().splitlines())
+        writer.write_batch(SAMPLE_DATA[2:] * 3)
+        self.assertEqual(SAMPLE_DATA[2:] * 3, f.read().splitlines())
+        writer.write(SAMPLE_DATA[0])
+        self.assertEqual('', f.read())
+
+        # Closing flushes whatever's left
+        writer.close()
+        self.assertEqual(SAMPLE_DATA[0:1], f.read().splitlines())
+        writer.close()
+        with self.assertRaises(ValueError):
+          writer.write(SAMPLE_DATA[0])
+
+  ############################
+  def test_flush_interval(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      writer = TextFileWriter(tmpdirname + '/f', flush_interval=0.1,
+                              fsync_interval=0.2)
+      with open(tmpdirname + '/f') as f:
+        writer.write_batch(SAMPLE_DATA)
+        self.assertEqual('', f.read())
+        time.sleep(0.5)
+        self.assertEqual(SAMPLE_DATA, f.read().splitlines())
+        self.assertFalse(writer.unsynced)
+        writer.close()
+        self.assertFalse(writer.flusher.is_alive())
+
+  ############################
+  def test_flush_interval_after_fork(self):
+    # A writer created in one process and written to from a fork of it
+    # still gets flushed on schedule.
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      writer = TextFileWriter(tmpdirname + '/f', flush_interval=0.1)
+      self.assertIsNone(writer.flusher)
+      pid = os.fork()
+      if pid == 0:
+        writer.write_batch(SAMPLE_DATA)
+        time.sleep(1)
+        os._exit(0)   # skip the flush at exit
+      time.sleep(0.5)
+      with open(tmpdirname + '/f') as f:
+        self.assertEqual(SAMPLE_DATA, f.read().splitlines())
+      os.waitpid(pid, 0)
+      writer.close()
+
   ############################
   def test_compatible(self):
     # Don't specify 'tail' and expect there to be no data
@@ -1,32 +1,76 @@
 #!/usr/bin/env python3
 
+import atexit
+import logging
+import os
 import os.path
 import sys
+import threading
+import weakref
 
 sys.path.append('.')
 
 from logger.utils.formats import Text
 from logger.writers.writer import Writer
 
+# Writers with data that may need flushing when the process exits
+_open_writers = weakref.WeakSet()
+
+################################################################################
+@atexit.register
+def _close_open_writers():
+  for writer in list(_open_writers):
+    writer.close()
+
+################################################################################
+def _reset_after_fork():
+  """A forked child has none of its parent's threads; writers it
+  inherits start their own flusher when it first writes to them."""
+  for writer in list(_open_writers):
+    writer.lock = threading.Lock()
+    writer.flusher = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
 ################################################################################
 class TextFileWriter(Writer):
   """Write to the specified file. If filename is empty, write to stdout."""
   def __init__(self, filename=None, flush=True, truncate=False,
-               create_path=True):
+               create_path=True, flush_records=None, flush_interval=None,
+               fsync_interval=None):
     """
     Write text records to a file. If no filename is specified, write to
     stdout.
 
     filename     Name of file to write to. If None, write to stdout
 
-    flush        If True (default), flush after every write() call
+    flush        If True (default), flush after every write() call, unless
+                 flush_records or flush_interval say otherwise
 
     truncate     Truncate file before beginning to write
 
     create_path  Create directory path to file if it doesn't exist
+
+    flush_records
+                 If specified, flush after every this-many records
+                 rather than after every write() call.
+
+    flush_interval
+                 If specified, flush from a background thread so that no
+                 record sits unflushed for more than this many seconds,
+                 rather than after every write() call.
+
+    fsync_interval
+                 If specified, also fsync() the file every this many
+                 seconds (if anything has been written), so that records
+                 survive a crash of the host and not just of the process.
+
+    Whatever the policy, everything written is flushed (and if
+    fsync_interval is set, fsynced) when close() is called, or when the
+    process exits normally.
     """
     super().__init__(input_format=Text)
-      
+
     if filename:
       # If directory doesn't exist, try to create it
       file_dir = os.path.dirname(filename)
@@ -40,12 +84,103 @@ class TextFileWriter(Writer):
     # If no filename specified, write to stdout
     else:
       self.file = sys.stdout
-    self.flush = flush
+    self.flush = flush and not (flush_records or flush_interval)
+    self.flush_records = flush_records
+    self.flush_interval = flush_interval
+    self.fsync_interval = fsync_interval
+
+    # Records written since the last flush and whether there's been a
+    # flush since the last fsync
+    self.unflushed = 0
+    self.unsynced = False
+    self.lock = threading.Lock()
+
+    # If we're flushing or syncing on a schedule, do it from a
+    # background thread, started by the first write. (Writers are often
+    # created in one process and written to from a fork of it, which
+    # wouldn't inherit a thread started here.)
+    self.quit_flusher = threading.Event()
+    self.flusher = None
+    intervals = [i for i in (flush_interval, fsync_interval) if i]
+    self.flusher_interval = min(intervals) if intervals else None
+    _open_writers.add(self)
+
+  ############################
+  def _flush(self, fsync=False):
+    """Flush (and optionally fsync) whatever we've written. Call only
+    while holding self.lock."""
+    if self.unflushed:
+      self.file.flush()
+      self.unflushed = 0
+      self.unsynced = True
+    if fsync and self.unsynced and self.file is not sys.stdout:
+      os.fsync(self.file.fileno())
+      self.unsynced = False
+
+  ############################
+  def _run_flusher(self, interval):
+    """Flush and/or fsync every interval seconds until told to quit."""
+    fsync_every = 0
+    if self.fsync_interval:
+      fsync_every = max(1, round(self.fsync_interval / interval))
+    ticks = 0
+    while not self.quit_flusher.wait(interval):
+      ticks += 1
+      fsync = bool(fsync_every) and ticks % fsync_every == 0
+      if not self.flush_interval and not fsync:
+        continue
+      with self.lock:
+        if self.file.closed:
+          return
+        try:
+          self._flush(fsync)
+        except (OSError, ValueError) as e:
+          logging.error('TextFileWriter unable to flush: %s', e)
+
+  ############################
+  def _wrote(self, num_records):
+    """Bookkeeping after writing num_records; call holding self.lock."""
+    if self.flusher is None and self.flusher_interval:
+      self.flusher = threading.Thread(target=self._run_flusher,
+                                      args=(self.flusher_interval,),
+                                      daemon=True,
+                                      name='flusher %s' % self.file.name)
+      self.flusher.start()
+    self.unflushed += num_records
+    if self.flush or (self.flush_records and
+                      self.unflushed >= self.flush_records):
+      self._flush()
 
   ############################
   def write(self, record):
     """ Write out record, appending a newline at end."""
-    if record is not None:
-      self.file.write(str(record) + '\n')
-    if self.flush:
-      self.file.flush()
+    with self.lock:
+      if record is not None:
+        self.file.write(str(record) + '\n')
+        self._wrote(1)
+      elif self.flush:
+        self.file.flush()
+
+  ############################
+  def write_batch(self, records):
+    """Write out a list of records with a single write (and at most a
+    single flush)."""
+    lines = [str(record) + '\n' for record in records if record is not None]
+    with self.lock:
+      if lines:
+        self.file.write(''.join(lines))
+        self._wrote(len(lines))
+
+  ############################
+  def close(self):
+    """Flush everything written and close our file, unless it's stdout."""
+    self.quit_flusher.set()
+    with self.lock:
+      if self.file.closed:
+        return
+      self._flush(fsync=bool(self.fsync_interval))
+      if self.file is not sys.stdout:
+        self.file.close()
+    if self.flusher and self.flusher is not threading.current_thread():
+      self.flusher.join()
+    _open_writers.discard(self)
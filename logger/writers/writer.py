@@ -67,6 +67,22 @@ class Writer:
                               'implementation of write () method.'
                               % self.__class__.__name__)
 
+  ############################
+  def write_batch(self, records):
+    """Write a batch of records - a list of records or a RecordBatch.
+
+    By default this just calls write() on each record in turn; writers
+    that can do better by writing many records at once should override
+    it."""
+    for record in records:
+      self.write(record)
+
+  ############################
+  def close(self):
+    """Flush anything buffered and release any resources we hold. By
+    default there's nothing to do."""
+    pass
+
 ################################################################################
 class TimestampedWriter(Writer):
   """
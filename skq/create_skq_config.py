@@ -25,6 +25,7 @@ or load the script via the Django GUI, as described in the gui/
 subdirectory.
 
 """
+import ipaddress
 import json
 import pprint
 import sys
@@ -37,11 +38,26 @@ from logger.utils.read_json import parse_json
 
 # Following line is for testing only (see README.md). Set
 # ALL_USE_SAME_PORT to False to generate a configuration where each
-# logger reads from its proper port.
+# logger reads from its proper port. When all loggers share a port,
+# each reads via a DemuxReader, which picks out its instrument's
+# records from a single socket shared by all of them.
 
 ALL_USE_SAME_PORT = False
 PORT = '6224'
 
+# Set USE_MULTICAST to True to have each logger join its own multicast
+# group (counting up from MULTICAST_BASE, in instrument order) rather
+# than listening to broadcasts, so that hosts only receive the
+# instruments they're logging. Whatever feeds the loggers must then
+# send each instrument to its group, e.g. for met_ptu307, the second
+# instrument in skq_ports.txt:
+#
+#   logger/listener/listen.py --file skq/sikuliaq.data \
+#       --transform_regex_filter '^met_ptu307' \
+#       --write_network 239.192.0.2:6224
+USE_MULTICAST = False
+MULTICAST_BASE = ipaddress.IPv4Address('239.192.0.0')
+
 # Set to desired cruise ID
 cruise = 'SKQ_SAMPLE'
 
@@ -49,7 +65,7 @@ file_db_config = """{
           "name": "INST->file/db",
           "readers": {
             "class": "NetworkReader",
-            "kwargs": { "network": ":PORT" }
+            "kwargs": { "network": "GROUP:PORT" }
           },
           "transforms": {
             "class": "RegexFilterTransform",
@@ -89,7 +105,7 @@ file_config = """{
           "name": "INST->file",
           "readers": {
             "class": "NetworkReader",
-            "kwargs": { "network": ":PORT" }
+            "kwargs": { "network": "GROUP:PORT" }
           },
           "transforms": {
             "class": "RegexFilterTransform",
@@ -117,7 +133,7 @@ db_config = """{
           "name": "INST->db",
           "readers": {
             "class": "NetworkReader",
-            "kwargs": { "network": ":PORT" }
+            "kwargs": { "network": "GROUP:PORT" }
           },
           "transforms": {
             "class": "RegexFilterTransform",
@@ -135,6 +151,16 @@ db_config = """{
           }
         }"""
 
+def share_port(config, inst):
+  """Have config read inst's records from a DemuxReader on the shared
+  port, rather than filtering everything on the port for them."""
+  config['readers'] = {
+    'class': 'DemuxReader',
+    'kwargs': {'network': ':' + PORT, 'data_ids': inst}
+  }
+  del config['transforms']
+  return config
+
 lines = [line.strip() for line in sys.stdin.readlines()]
 
 loggers = {}
@@ -146,29 +172,39 @@ modes['file'] = {}
 modes['db'] = {}
 modes['file/db'] = {}
 
-for line in lines:
+for i, line in enumerate(lines):
   (inst, port) = line.split('\t', maxsplit=2)
 
   if ALL_USE_SAME_PORT:
     port = PORT
+  group = str(MULTICAST_BASE + i + 1) if USE_MULTICAST else ''
   
   config = file_db_config
+  config = config.replace('GROUP', group)
   config = config.replace('INST', inst)
   config = config.replace('PORT', port)
   config = config.replace('CRUISE', cruise)
   configs['%s->file/db' % inst] = parse_json(config)
+  if ALL_USE_SAME_PORT and not USE_MULTICAST:
+    share_port(configs['%s->file/db' % inst], inst)
 
   config = file_config
+  config = config.replace('GROUP', group)
   config = config.replace('INST', inst)
   config = config.replace('PORT', port)
   config = config.replace('CRUISE', cruise)
   configs['%s->file' % inst] = parse_json(config)
+  if ALL_USE_SAME_PORT and not USE_MULTICAST:
+    share_port(configs['%s->file' % inst], inst)
 
   config = db_config
+  config = config.replace('GROUP', group)
   config = config.replace('INST', inst)
   config = config.replace('PORT', port)
   config = config.replace('CRUISE', cruise)
   configs['%s->db' % inst] = parse_json(config)
+  if ALL_USE_SAME_PORT and not USE_MULTICAST:
+    share_port(configs['%s->db' % inst], inst)
 
   loggers[inst] = {}
   loggers[inst]['configs'] = [